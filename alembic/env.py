@@ -4,7 +4,7 @@ from sqlalchemy import pool
 from alembic import context
 from app.config import settings
 from app.db.session import Base
-from app.models import User, Conversation, Message, MessageType, UserToolkitConnection
+from app.models import User, Conversation, Message, MessageType, UserToolkitConnection, MessageEmbedding, EmbeddingOutbox
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,34 @@
+"""adds embedding_model to message_embeddings
+
+Revision ID: 2f6c8e41a7b9
+Revises: 9d3a5f17c2e8
+Create Date: 2026-10-19 15:02:37.904211
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f6c8e41a7b9'
+down_revision: Union[str, Sequence[str], None] = '9d3a5f17c2e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Created only for VECTOR_BACKEND=pgvector (4b7e2c91d0a3).
+    if not sa.inspect(op.get_bind()).has_table('message_embeddings'):
+        return
+    # Existing rows stay NULL until `python -m app.jobs.reembed --stamp-existing` claims them.
+    op.add_column('message_embeddings', sa.Column('embedding_model', sa.String(length=128), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table('message_embeddings'):
+        return
+    op.drop_column('message_embeddings', 'embedding_model')
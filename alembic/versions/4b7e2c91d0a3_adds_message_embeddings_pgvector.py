@@ -0,0 +1,63 @@
+"""adds message_embeddings table for the pgvector backend
+
+Revision ID: 4b7e2c91d0a3
+Revises: cf2754c8bfd0
+Create Date: 2026-10-19 09:12:44.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e2c91d0a3'
+down_revision: Union[str, Sequence[str], None] = 'cf2754c8bfd0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Only the pgvector backend stores vectors in Postgres; other deployments
+    # may run on a server without the extension (see _create_tables in app/main.py).
+    if settings.vector_backend.lower() != "pgvector":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.create_table('message_embeddings',
+    sa.Column('message_id', sa.Integer(), nullable=False),
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('embedding', Vector(settings.embedding_dimensions), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['message_id'], ['messages.message_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.conversation_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('message_id')
+    )
+    op.create_index(op.f('ix_message_embeddings_conversation_id'), 'message_embeddings', ['conversation_id'], unique=False)
+    op.create_index(op.f('ix_message_embeddings_user_id'), 'message_embeddings', ['user_id'], unique=False)
+    if settings.pgvector_index.lower() == "ivfflat":
+        op.execute(
+            "CREATE INDEX ix_message_embeddings_embedding ON message_embeddings "
+            f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {int(settings.pgvector_ivfflat_lists)})"
+        )
+    else:
+        op.execute(
+            "CREATE INDEX ix_message_embeddings_embedding ON message_embeddings "
+            f"USING hnsw (embedding vector_cosine_ops) WITH (m = {int(settings.pgvector_hnsw_m)}, "
+            f"ef_construction = {int(settings.pgvector_hnsw_ef_construction)})"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table('message_embeddings'):
+        return
+    op.drop_index('ix_message_embeddings_embedding', table_name='message_embeddings')
+    op.drop_index(op.f('ix_message_embeddings_user_id'), table_name='message_embeddings')
+    op.drop_index(op.f('ix_message_embeddings_conversation_id'), table_name='message_embeddings')
+    op.drop_table('message_embeddings')
@@ -0,0 +1,41 @@
+"""adds embedding_outbox table
+
+Revision ID: 7e1d4b9a3c05
+Revises: 2f6c8e41a7b9
+Create Date: 2026-10-19 16:21:09.347712
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e1d4b9a3c05'
+down_revision: Union[str, Sequence[str], None] = '2f6c8e41a7b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('embedding_outbox',
+    sa.Column('outbox_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=32), nullable=False),
+    sa.Column('message_id', sa.Integer(), nullable=True),
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('available_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('outbox_id')
+    )
+    op.create_index('ix_embedding_outbox_available_at_outbox_id', 'embedding_outbox', ['available_at', 'outbox_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_embedding_outbox_available_at_outbox_id', table_name='embedding_outbox')
+    op.drop_table('embedding_outbox')
@@ -0,0 +1,68 @@
+"""adds halfvec ANN index on message_embeddings when storing float16
+
+Revision ID: 9d3a5f17c2e8
+Revises: 4b7e2c91d0a3
+Create Date: 2026-10-19 13:40:02.516930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3a5f17c2e8'
+down_revision: Union[str, Sequence[str], None] = '4b7e2c91d0a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _full_index() -> str:
+    if settings.pgvector_index.lower() == "ivfflat":
+        return (
+            "CREATE INDEX ix_message_embeddings_embedding ON message_embeddings "
+            f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {int(settings.pgvector_ivfflat_lists)})"
+        )
+    return (
+        "CREATE INDEX ix_message_embeddings_embedding ON message_embeddings "
+        f"USING hnsw (embedding vector_cosine_ops) WITH (m = {int(settings.pgvector_hnsw_m)}, "
+        f"ef_construction = {int(settings.pgvector_hnsw_ef_construction)})"
+    )
+
+
+def _half_index() -> str:
+    half = f"(embedding::halfvec({int(settings.embedding_dimensions)})) halfvec_cosine_ops"
+    if settings.pgvector_index.lower() == "ivfflat":
+        return (
+            "CREATE INDEX ix_message_embeddings_embedding_half ON message_embeddings "
+            f"USING ivfflat ({half}) WITH (lists = {int(settings.pgvector_ivfflat_lists)})"
+        )
+    return (
+        "CREATE INDEX ix_message_embeddings_embedding_half ON message_embeddings "
+        f"USING hnsw ({half}) WITH (m = {int(settings.pgvector_hnsw_m)}, "
+        f"ef_construction = {int(settings.pgvector_hnsw_ef_construction)})"
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Created only for VECTOR_BACKEND=pgvector (4b7e2c91d0a3).
+    if not sa.inspect(op.get_bind()).has_table('message_embeddings'):
+        return
+    # The heap keeps full-precision vectors for rescoring; only the ANN index,
+    # which has to stay memory-resident, is built over half-precision values.
+    if settings.embedding_storage_dtype.lower() != "float16":
+        return
+    op.drop_index('ix_message_embeddings_embedding', table_name='message_embeddings')
+    op.execute(_half_index())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table('message_embeddings'):
+        return
+    op.execute("DROP INDEX IF EXISTS ix_message_embeddings_embedding_half")
+    op.execute("DROP INDEX IF EXISTS ix_message_embeddings_embedding")
+    op.execute(_full_index())
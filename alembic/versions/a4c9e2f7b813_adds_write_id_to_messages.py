@@ -0,0 +1,30 @@
+"""adds write id to messages
+
+Revision ID: a4c9e2f7b813
+Revises: f1b6d8e3a527
+Create Date: 2026-10-19 21:03:52.418760
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e2f7b813'
+down_revision: Union[str, Sequence[str], None] = 'f1b6d8e3a527'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('write_id', sa.String(length=36), nullable=True))
+    op.create_index(op.f('ix_messages_write_id'), 'messages', ['write_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_messages_write_id'), table_name='messages')
+    op.drop_column('messages', 'write_id')
@@ -0,0 +1,63 @@
+"""adds message_archives
+
+Revision ID: a9d4e1f7c352
+Revises: f3c9a6d1b245
+Create Date: 2026-10-20 14:05:37.284190
+
+"""
+from typing import Sequence, Union
+import glob
+import gzip
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d4e1f7c352'
+down_revision: Union[str, Sequence[str], None] = 'f3c9a6d1b245'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Where archives were written as files before they moved into this table.
+LEGACY_ARCHIVE_DIR = os.environ.get("MESSAGE_ARCHIVE_DIR", "data/message_archive")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('message_archives',
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.conversation_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('conversation_id')
+    )
+    # Archive files found on this host are imported; conversations whose file
+    # lives elsewhere stay archived and fail to restore until it is imported.
+    bind = op.get_bind()
+    archived = set(bind.execute(sa.text("SELECT conversation_id FROM conversation_context WHERE archived_at IS NOT NULL")).scalars())
+    for path in glob.glob(os.path.join(LEGACY_ARCHIVE_DIR, "*", "*.ndjson.gz")):
+        conversation_id = int(os.path.basename(path).split(".")[0])
+        if conversation_id not in archived:
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        count = sum(1 for line in gzip.decompress(data).splitlines() if line.strip())
+        bind.execute(
+            sa.text("INSERT INTO message_archives (conversation_id, message_count, data) VALUES (:cid, :count, :data)"),
+            {"cid": conversation_id, "count": count, "data": data},
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Archives go back to files, or the downgrade would lose their messages.
+    bind = op.get_bind()
+    for row in bind.execute(sa.text("SELECT conversation_id, data FROM message_archives")):
+        path = os.path.join(LEGACY_ARCHIVE_DIR, f"{row.conversation_id % 1000:03d}", f"{row.conversation_id}.ndjson.gz")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(row.data)
+    op.drop_table('message_archives')
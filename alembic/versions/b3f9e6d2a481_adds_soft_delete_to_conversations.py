@@ -0,0 +1,30 @@
+"""adds soft delete to conversations
+
+Revision ID: b3f9e6d2a481
+Revises: 7e1d4b9a3c05
+Create Date: 2026-10-19 17:48:55.061337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f9e6d2a481'
+down_revision: Union[str, Sequence[str], None] = '7e1d4b9a3c05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_conversations_deleted_at', 'conversations', ['deleted_at'], unique=False, postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_conversations_deleted_at', table_name='conversations', postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    op.drop_column('conversations', 'deleted_at')
@@ -0,0 +1,28 @@
+"""adds tools_compacted_up_to
+
+Revision ID: b4e8c2f6d193
+Revises: a9d4e1f7c352
+Create Date: 2026-10-20 15:21:08.641273
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e8c2f6d193'
+down_revision: Union[str, Sequence[str], None] = 'a9d4e1f7c352'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('tools_compacted_up_to', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversations', 'tools_compacted_up_to')
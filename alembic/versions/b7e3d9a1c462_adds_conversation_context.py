@@ -0,0 +1,57 @@
+"""adds conversation context
+
+Revision ID: b7e3d9a1c462
+Revises: a4c9e2f7b813
+Create Date: 2026-10-19 21:47:09.531204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3d9a1c462'
+down_revision: Union[str, Sequence[str], None] = 'a4c9e2f7b813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('conversation_context',
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('summary_text', sa.Text(), nullable=True),
+    sa.Column('recent_messages', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'[]'::jsonb"), nullable=False),
+    sa.Column('recent_message_ids', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'[]'::jsonb"), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.conversation_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('conversation_id')
+    )
+    # Backfill from the last 15 (N_CONTEXT_MESSAGES) Human/AI messages of each live conversation.
+    op.execute(
+        """
+        INSERT INTO conversation_context (conversation_id, summary_text, recent_messages, recent_message_ids)
+        SELECT c.conversation_id, c.summary_text,
+               COALESCE(jsonb_agg(jsonb_build_object(
+                   'message_id', m.message_id, 'write_id', m.write_id, 'type', m.type::text, 'content', m.content
+               ) ORDER BY m.created_at, m.message_id) FILTER (WHERE m.message_id IS NOT NULL), '[]'::jsonb),
+               COALESCE(jsonb_agg(m.message_id ORDER BY m.created_at, m.message_id) FILTER (WHERE m.message_id IS NOT NULL), '[]'::jsonb)
+        FROM conversations c
+        LEFT JOIN LATERAL (
+            SELECT message_id, write_id, type, content, created_at FROM messages
+            WHERE messages.conversation_id = c.conversation_id AND messages.type IN ('HUMAN', 'AI')
+            ORDER BY created_at DESC, message_id DESC
+            LIMIT 15
+        ) m ON true
+        WHERE c.deleted_at IS NULL
+        GROUP BY c.conversation_id, c.summary_text
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('conversation_context')
@@ -0,0 +1,154 @@
+"""partitions messages by conversation
+
+Revision ID: c5f8a2d7e914
+Revises: b7e3d9a1c462
+Create Date: 2026-10-19 23:12:40.118356
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f8a2d7e914'
+down_revision: Union[str, Sequence[str], None] = 'b7e3d9a1c462'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# MESSAGE_PARTITIONS in app/models/message.py.
+PARTITIONS = 16
+BACKFILL_BATCH = 50000
+
+INDEXES = (
+    ('ix_messages_message_id', 'USING btree (message_id)'),
+    ('ix_messages_conversation_id_message_id', 'USING btree (conversation_id, message_id)'),
+    ('ix_messages_content_tsv', 'USING gin (content_tsv)'),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Online: the new table is filled in batches while a trigger mirrors concurrent
+    # writes, and `messages` is locked only for the final renames.
+    op.execute(
+        """
+        CREATE TABLE messages_partitioned (LIKE messages INCLUDING DEFAULTS INCLUDING GENERATED)
+        PARTITION BY HASH (conversation_id)
+        """
+    )
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f"CREATE TABLE messages_p{remainder:02d} PARTITION OF messages_partitioned "
+            f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})"
+        )
+    # Constraints and indexes on the empty parent are created on every partition right away.
+    op.execute("ALTER TABLE messages_partitioned ADD CONSTRAINT messages_partitioned_pkey PRIMARY KEY (message_id, conversation_id)")
+    op.execute("ALTER TABLE messages_partitioned ADD CONSTRAINT messages_partitioned_conversation_id_fkey FOREIGN KEY (conversation_id) REFERENCES conversations (conversation_id)")
+    op.execute("ALTER TABLE messages_partitioned ADD CONSTRAINT messages_partitioned_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (user_id)")
+    op.execute("CREATE UNIQUE INDEX ix_messages_partitioned_conversation_id_write_id ON messages_partitioned USING btree (conversation_id, write_id)")
+    for name, definition in INDEXES:
+        op.execute(f"CREATE INDEX {name}_partitioned ON messages_partitioned {definition}")
+    op.execute(
+        """
+        CREATE FUNCTION messages_mirror_to_partitioned() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM messages_partitioned WHERE message_id = OLD.message_id AND conversation_id = OLD.conversation_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO messages_partitioned (message_id, conversation_id, user_id, type, content, created_at, write_id)
+                VALUES (NEW.message_id, NEW.conversation_id, NEW.user_id, NEW.type, NEW.content, NEW.created_at, NEW.write_id)
+                ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER messages_mirror_to_partitioned AFTER INSERT OR UPDATE OR DELETE ON messages
+        FOR EACH ROW EXECUTE FUNCTION messages_mirror_to_partitioned()
+        """
+    )
+
+    # The trigger must be committed before the copy starts, or writes in between are lost.
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        last_id = bind.execute(sa.text("SELECT COALESCE(MAX(message_id), 0) FROM messages")).scalar()
+        for start in range(0, last_id, BACKFILL_BATCH):
+            # FOR SHARE waits out concurrent deletes, so a row deleted meanwhile is not copied back.
+            bind.execute(sa.text(
+                """
+                INSERT INTO messages_partitioned (message_id, conversation_id, user_id, type, content, created_at, write_id)
+                SELECT message_id, conversation_id, user_id, type, content, created_at, write_id
+                FROM messages WHERE message_id > :start AND message_id <= :end
+                FOR SHARE
+                ON CONFLICT DO NOTHING
+                """
+            ), {"start": start, "end": start + BACKFILL_BATCH})
+
+    # Swap in one short transaction.
+    op.execute("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER messages_mirror_to_partitioned ON messages")
+    op.execute("DROP FUNCTION messages_mirror_to_partitioned()")
+    # message_embeddings exists only for VECTOR_BACKEND=pgvector (4b7e2c91d0a3).
+    has_embeddings = sa.inspect(op.get_bind()).has_table('message_embeddings')
+    if has_embeddings:
+        op.execute("ALTER TABLE message_embeddings DROP CONSTRAINT message_embeddings_message_id_fkey")
+    op.execute("ALTER SEQUENCE messages_message_id_seq OWNED BY messages_partitioned.message_id")
+    op.execute("DROP TABLE messages")
+    op.execute("ALTER TABLE messages_partitioned RENAME TO messages")
+    op.execute("ALTER TABLE messages RENAME CONSTRAINT messages_partitioned_pkey TO messages_pkey")
+    op.execute("ALTER INDEX ix_messages_partitioned_conversation_id_write_id RENAME TO ix_messages_conversation_id_write_id")
+    for name, _ in INDEXES:
+        op.execute(f"ALTER INDEX {name}_partitioned RENAME TO {name}")
+    op.execute("ALTER TABLE messages RENAME CONSTRAINT messages_partitioned_conversation_id_fkey TO messages_conversation_id_fkey")
+    op.execute("ALTER TABLE messages RENAME CONSTRAINT messages_partitioned_user_id_fkey TO messages_user_id_fkey")
+    if not has_embeddings:
+        return
+    op.execute(
+        """
+        ALTER TABLE message_embeddings ADD CONSTRAINT message_embeddings_message_id_fkey
+        FOREIGN KEY (message_id, conversation_id) REFERENCES messages (message_id, conversation_id) ON DELETE CASCADE NOT VALID
+        """
+    )
+
+    # Validating takes no lock that blocks writes.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE message_embeddings VALIDATE CONSTRAINT message_embeddings_message_id_fkey")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Offline: copies every message back into a plain table under an exclusive lock.
+    op.execute("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE")
+    op.execute("CREATE TABLE messages_unpartitioned (LIKE messages INCLUDING DEFAULTS INCLUDING GENERATED)")
+    op.execute(
+        """
+        INSERT INTO messages_unpartitioned (message_id, conversation_id, user_id, type, content, created_at, write_id)
+        SELECT message_id, conversation_id, user_id, type, content, created_at, write_id FROM messages
+        """
+    )
+    has_embeddings = sa.inspect(op.get_bind()).has_table('message_embeddings')
+    if has_embeddings:
+        op.execute("ALTER TABLE message_embeddings DROP CONSTRAINT message_embeddings_message_id_fkey")
+    op.execute("ALTER SEQUENCE messages_message_id_seq OWNED BY messages_unpartitioned.message_id")
+    op.execute("DROP TABLE messages")
+    op.execute("ALTER TABLE messages_unpartitioned RENAME TO messages")
+    op.execute("ALTER TABLE messages ADD CONSTRAINT messages_pkey PRIMARY KEY (message_id)")
+    op.execute("CREATE UNIQUE INDEX ix_messages_write_id ON messages USING btree (write_id)")
+    for name, definition in INDEXES:
+        op.execute(f"CREATE INDEX {name} ON messages {definition}")
+    op.execute("ALTER TABLE messages ADD CONSTRAINT messages_conversation_id_fkey FOREIGN KEY (conversation_id) REFERENCES conversations (conversation_id)")
+    op.execute("ALTER TABLE messages ADD CONSTRAINT messages_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (user_id)")
+    if not has_embeddings:
+        return
+    op.execute(
+        """
+        ALTER TABLE message_embeddings ADD CONSTRAINT message_embeddings_message_id_fkey
+        FOREIGN KEY (message_id) REFERENCES messages (message_id) ON DELETE CASCADE
+        """
+    )
@@ -0,0 +1,38 @@
+"""adds fulltext search to messages
+
+Revision ID: c8d4f1a6e293
+Revises: e5a2c7f90b14
+Create Date: 2026-10-19 19:02:13.640987
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8d4f1a6e293'
+down_revision: Union[str, Sequence[str], None] = 'e5a2c7f90b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Adding a stored generated column rewrites `messages`; run it in a maintenance window on large tables.
+    op.add_column('messages', sa.Column(
+        'content_tsv',
+        postgresql.TSVECTOR(),
+        sa.Computed(f"to_tsvector('{settings.fulltext_language}'::regconfig, content)", persisted=True),
+        nullable=True,
+    ))
+    op.create_index('ix_messages_content_tsv', 'messages', ['content_tsv'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_content_tsv', table_name='messages', postgresql_using='gin')
+    op.drop_column('messages', 'content_tsv')
@@ -0,0 +1,28 @@
+"""adds archived_at to conversation context
+
+Revision ID: d2a7c4e9f186
+Revises: c5f8a2d7e914
+Create Date: 2026-10-19 23:40:02.574913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a7c4e9f186'
+down_revision: Union[str, Sequence[str], None] = 'c5f8a2d7e914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversation_context', sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversation_context', 'archived_at')
@@ -0,0 +1,35 @@
+"""adds dead_at to embedding_outbox
+
+Revision ID: d9b2e5a7f310
+Revises: b4e8c2f6d193
+Create Date: 2026-10-21 10:42:17.905316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9b2e5a7f310'
+down_revision: Union[str, Sequence[str], None] = 'b4e8c2f6d193'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('embedding_outbox', sa.Column('dead_at', sa.DateTime(timezone=True), nullable=True))
+    # Rows that already gave up before the column existed.
+    op.execute(
+        sa.text("UPDATE embedding_outbox SET dead_at = now() WHERE attempts >= :max_attempts").bindparams(
+            max_attempts=settings.outbox_max_attempts
+        )
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('embedding_outbox', 'dead_at')
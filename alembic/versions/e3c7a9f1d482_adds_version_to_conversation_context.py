@@ -0,0 +1,28 @@
+"""adds version to conversation_context
+
+Revision ID: e3c7a9f1d482
+Revises: d9b2e5a7f310
+Create Date: 2026-10-21 14:08:53.217640
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3c7a9f1d482'
+down_revision: Union[str, Sequence[str], None] = 'd9b2e5a7f310'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversation_context', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversation_context', 'version')
@@ -0,0 +1,43 @@
+"""adds chunks to message_embeddings
+
+Revision ID: e5a2c7f90b14
+Revises: b3f9e6d2a481
+Create Date: 2026-10-19 18:20:44.518302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a2c7f90b14'
+down_revision: Union[str, Sequence[str], None] = 'b3f9e6d2a481'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Created only for VECTOR_BACKEND=pgvector (4b7e2c91d0a3).
+    if not sa.inspect(op.get_bind()).has_table('message_embeddings'):
+        return
+    # Existing rows become chunk 0 spanning the whole message.
+    op.add_column('message_embeddings', sa.Column('chunk_index', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('message_embeddings', sa.Column('chunk_start', sa.Integer(), nullable=True))
+    op.add_column('message_embeddings', sa.Column('chunk_end', sa.Integer(), nullable=True))
+    op.drop_constraint('message_embeddings_pkey', 'message_embeddings', type_='primary')
+    op.create_primary_key('message_embeddings_pkey', 'message_embeddings', ['message_id', 'chunk_index'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table('message_embeddings'):
+        return
+    op.execute("DELETE FROM message_embeddings WHERE chunk_index > 0")
+    op.drop_constraint('message_embeddings_pkey', 'message_embeddings', type_='primary')
+    op.create_primary_key('message_embeddings_pkey', 'message_embeddings', ['message_id'])
+    op.drop_column('message_embeddings', 'chunk_end')
+    op.drop_column('message_embeddings', 'chunk_start')
+    op.drop_column('message_embeddings', 'chunk_index')
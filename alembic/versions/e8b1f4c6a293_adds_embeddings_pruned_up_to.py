@@ -0,0 +1,28 @@
+"""adds embeddings_pruned_up_to
+
+Revision ID: e8b1f4c6a293
+Revises: d2a7c4e9f186
+Create Date: 2026-10-20 09:26:51.730442
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b1f4c6a293'
+down_revision: Union[str, Sequence[str], None] = 'd2a7c4e9f186'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('embeddings_pruned_up_to', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversations', 'embeddings_pruned_up_to')
@@ -0,0 +1,39 @@
+"""adds summary watermark to conversations
+
+Revision ID: f1b6d8e3a527
+Revises: c8d4f1a6e293
+Create Date: 2026-10-19 20:11:37.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b6d8e3a527'
+down_revision: Union[str, Sequence[str], None] = 'c8d4f1a6e293'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('summarized_up_to', sa.Integer(), nullable=True))
+    op.create_index('ix_messages_conversation_id_message_id', 'messages', ['conversation_id', 'message_id'], unique=False)
+    # Summaries were refreshed after every message, so existing ones are taken to cover the whole history.
+    op.execute(
+        """
+        UPDATE conversations SET summarized_up_to = (
+            SELECT max(messages.message_id) FROM messages WHERE messages.conversation_id = conversations.conversation_id
+        )
+        WHERE summary_text IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_conversation_id_message_id', table_name='messages')
+    op.drop_column('conversations', 'summarized_up_to')
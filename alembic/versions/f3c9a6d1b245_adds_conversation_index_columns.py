@@ -0,0 +1,72 @@
+"""adds conversation index columns
+
+Revision ID: f3c9a6d1b245
+Revises: e8b1f4c6a293
+Create Date: 2026-10-20 11:04:37.285190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c9a6d1b245'
+down_revision: Union[str, Sequence[str], None] = 'e8b1f4c6a293'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversation_context', sa.Column('user_id', sa.Integer(), nullable=True))
+    op.add_column('conversation_context', sa.Column('message_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('conversation_context', sa.Column('last_activity_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.add_column('conversation_context', sa.Column('last_message_preview', sa.String(length=200), nullable=True))
+    # Conversations without messages got no row from the context backfill; the index lists them too.
+    op.execute(
+        """
+        INSERT INTO conversation_context (conversation_id, summary_text)
+        SELECT c.conversation_id, c.summary_text FROM conversations c
+        WHERE c.deleted_at IS NULL
+          AND NOT EXISTS (SELECT 1 FROM conversation_context cc WHERE cc.conversation_id = c.conversation_id)
+        """
+    )
+    op.execute(
+        """
+        UPDATE conversation_context cc
+        SET user_id = c.user_id,
+            last_activity_at = c.created_at,
+            last_message_preview = left(cc.recent_messages -> -1 ->> 'content', 200)
+        FROM conversations c
+        WHERE c.conversation_id = cc.conversation_id
+        """
+    )
+    # Archived conversations have no rows in `messages`: they show their creation time
+    # as last activity and a count of 0 until restoring them recounts.
+    op.execute(
+        """
+        UPDATE conversation_context cc
+        SET message_count = m.message_count,
+            last_activity_at = GREATEST(cc.last_activity_at, m.last_created_at)
+        FROM (
+            SELECT conversation_id, count(*) AS message_count, max(created_at) AS last_created_at
+            FROM messages GROUP BY conversation_id
+        ) m
+        WHERE m.conversation_id = cc.conversation_id
+        """
+    )
+    op.alter_column('conversation_context', 'user_id', nullable=False)
+    op.create_foreign_key('conversation_context_user_id_fkey', 'conversation_context', 'users', ['user_id'], ['user_id'], ondelete='CASCADE')
+    op.create_index('ix_conversation_context_user_id_last_activity_at', 'conversation_context', ['user_id', 'last_activity_at', 'conversation_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_conversation_context_user_id_last_activity_at', table_name='conversation_context')
+    op.drop_constraint('conversation_context_user_id_fkey', 'conversation_context', type_='foreignkey')
+    op.drop_column('conversation_context', 'last_message_preview')
+    op.drop_column('conversation_context', 'last_activity_at')
+    op.drop_column('conversation_context', 'message_count')
+    op.drop_column('conversation_context', 'user_id')
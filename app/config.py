@@ -12,9 +12,48 @@ class Settings(BaseSettings):
     postgres_user: str = ""
     postgres_password: str = ""
     postgres_db: str = ""
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    database_replica_url: str = ""
+    db_replica_pool_size: int = 5
+    db_replica_max_overflow: int = 10
+    read_your_writes_seconds: float = 5
+    read_your_writes_cookie: str = "meai_ryw"
+
+    vector_backend: str = "chroma"
+    local_index_dir: str = "data/vector_index"
+    local_index_cache_size: int = 1024
+    embedding_dimensions: int = 1536
+    embedding_truncate_dim: int = 0
+    embedding_storage_dtype: str = "float32"
+    embedding_rescore_factor: int = 4
+    retrieval_window_days: int = 0
+    retrieval_scope: str = "conversation"
+    search_max_results: int = 100
+    search_snippet_chars: int = 300
+    fulltext_language: str = "english"
+    retrieval_mode: str = "vector"
+    retrieval_rrf_k: int = 60
+    embedding_chunk_size: int = 1500
+    embedding_chunk_overlap: int = 200
+    embedding_min_chars: int = 8
+    embedding_min_words: int = 2
+
+    pgvector_index: str = "hnsw"
+    pgvector_hnsw_m: int = 16
+    pgvector_hnsw_ef_construction: int = 64
+    pgvector_hnsw_ef_search: int = 40
+    pgvector_ivfflat_lists: int = 100
+    pgvector_ivfflat_probes: int = 10
+    pgvector_iterative_scan: str = "relaxed_order"
 
     chroma_host: str = ""
     chroma_port: int = 8000
+    chroma_collection: str = "messages"
+    chroma_sharding: str = "none"
+    chroma_shard_buckets: int = 64
+    chroma_collection_cache_size: int = 256
+    chroma_hnsw_profile: str = "default"
 
     google_client_id: str = ""
     google_client_secret: str = ""
@@ -52,6 +91,51 @@ class Settings(BaseSettings):
     cookie_samesite: str = ""
     frontend_url: str = "http://localhost:5173"
 
+    outbox_worker_in_process: bool = True
+    outbox_batch_size: int = 100
+    outbox_poll_interval_seconds: float = 1.0
+    outbox_lease_seconds: int = 120
+    outbox_max_attempts: int = 10
+    outbox_max_backoff_seconds: int = 600
+    outbox_shutdown_timeout_seconds: float = 10
+
+    conversation_purge_in_process: bool = True
+    conversation_purge_batch_size: int = 500
+    conversation_purge_max_batches: int = 20
+    conversation_purge_interval_seconds: float = 30
+    message_archive_after_days: int = 0
+    message_archive_batch_size: int = 1000
+    message_archive_interval_seconds: float = 3600
+    tool_compact_after_hours: float = 24
+    tool_payload_retention_days: int = 0
+    tool_payload_max_chars: int = 200
+    summarized_embedding_retention_days: int = 0
+    transfer_batch_size: int = 1000
+    import_max_line_bytes: int = 16777216
+    summary_max_prompt_chars: int = 12000
+    summary_max_chunks_per_update: int = 3
+    summary_rebuild_concurrency: int = 4
+    write_behind_enabled: bool = False
+    write_behind_dir: str = "data/write_behind"
+    write_behind_fsync: bool = True
+    write_behind_batch_size: int = 50
+    write_behind_max_attempts: int = 8
+    write_behind_shutdown_timeout_seconds: float = 10
+    conversation_state_cache_enabled: bool = True
+    conversation_state_max_entries: int = 1000
+    conversation_state_idle_seconds: float = 900
+
+    create_tables_on_startup: bool = True
+    preload_providers: bool = False
+
+    ready_db_pool_min: int = 2
+    ready_db_max_latency_ms: float = 100
+    ready_chroma_max_latency_ms: float = 250
+    ready_embeddings_max_latency_ms: float = 1500
+    ready_llm_max_latency_ms: float = 3000
+    ready_check_timeout_seconds: float = 10
+    ready_provider_check_interval: int = 300
+
     class Config:
         env_file = ".env"
         case_sensitive = False
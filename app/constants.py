@@ -1,5 +1,9 @@
 N_CONTEXT_MESSAGES = 15
 M_SUMMARY_INTERVAL = 1
+EMBEDDING_MODELS = {
+    "gemini": "models/embedding-001",
+    "openai": "text-embedding-3-small",
+}
 SYSTEM_PROMPT = """
 # AI Personal Assistant Instructions
 
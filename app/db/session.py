@@ -1,25 +1,87 @@
-from sqlalchemy import create_engine
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    echo=settings.debug
-)
+
+def _create_engine(url: str, pool_size: int, max_overflow: int):
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        echo=settings.debug
+    )
+
+
+engine = _create_engine(settings.database_url, settings.db_pool_size, settings.db_max_overflow)
+
+# Read-only endpoints use the replica's pool, so they never wait behind the chat pipeline
+# for a primary connection. Without DATABASE_REPLICA_URL both are the primary.
+has_replica = bool(settings.database_replica_url)
+replica_engine = _create_engine(settings.database_replica_url, settings.db_replica_pool_size, settings.db_replica_max_overflow) if has_replica else engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
 
 Base = declarative_base()
 
 
-def get_db():
+# Read-your-writes: a request whose primary session commits a write is flagged on
+# request.state, and the middleware in app/main.py answers with a short-lived cookie
+# that sends the client's reads to the primary until the replica has caught up.
+@event.listens_for(SessionLocal, "after_flush")
+def _flushed(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _executed(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _committed(session):
+    if session.info.pop("wrote", False) and "request_state" in session.info:
+        session.info["request_state"].wrote_to_primary = True
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _rolled_back(session):
+    session.info.pop("wrote", None)
+
+
+def wrote_recently(request: Request) -> bool:
+    """Whether the client's read-your-writes cookie is still valid."""
+    try:
+        return float(request.cookies.get(settings.read_your_writes_cookie, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_db(request: Request = None):
     db = SessionLocal()
+    if request is not None:
+        db.info["request_state"] = request.state
     try:
         yield db
     finally:
         db.close()
 
 
+def read_sessionmaker(request: Request) -> sessionmaker:
+    """The replica's sessionmaker, or the primary's shortly after this client wrote."""
+    return SessionLocal if not has_replica or wrote_recently(request) else ReplicaSessionLocal
+
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints: the replica, or the primary shortly after this client wrote."""
+    db = read_sessionmaker(request)()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,6 +1,6 @@
 from fastapi import Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
-from app.db.session import get_db
+from app.db.session import get_db, get_read_db
 from app.models.user import User
 from app.services.auth_service import get_user_by_email
 from app.utils.auth_utils import verify_session_token
@@ -11,6 +11,16 @@ async def get_current_user(
     db: Session = Depends(get_db)
 ) -> User:
     """Get current authenticated user from session cookie"""
+    return _authenticate(request, db)
+
+async def get_current_user_read(
+    request: Request,
+    db: Session = Depends(get_read_db)
+) -> User:
+    """Like get_current_user, for read-only endpoints: looks the user up through their read session"""
+    return _authenticate(request, db)
+
+def _authenticate(request: Request, db: Session) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
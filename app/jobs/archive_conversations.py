@@ -0,0 +1,44 @@
+"""
+Move the messages of conversations idle for MESSAGE_ARCHIVE_AFTER_DAYS into
+gzip'd NDJSON archives in the message_archives table. They are restored
+transparently when the conversation is read or written again.
+
+    python -m app.jobs.archive_conversations --once
+    python -m app.jobs.archive_conversations --conversation-id 42
+
+Without --once, archives every MESSAGE_ARCHIVE_INTERVAL_SECONDS until stopped.
+"""
+import argparse
+import asyncio
+import signal
+from app.config import settings
+from app.services import archive_service
+
+
+async def _run_forever() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await archive_service.run_archiver(stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive the messages of idle conversations to cold storage")
+    parser.add_argument("--once", action="store_true", help="Archive every idle conversation and exit")
+    parser.add_argument("--conversation-id", type=int, help="Archive a single conversation if it is idle and exit")
+    parser.add_argument("--after-days", type=int, default=settings.message_archive_after_days, help="Idle time before archiving; 0 disables")
+    args = parser.parse_args()
+    settings.message_archive_after_days = args.after_days
+    if settings.message_archive_after_days <= 0:
+        print("[archive_conversations] archiving is disabled; set MESSAGE_ARCHIVE_AFTER_DAYS or --after-days")
+        return
+    if args.conversation_id is not None or args.once:
+        totals = archive_service.archive_idle(limit=None, conversation_id=args.conversation_id)
+        print(f"[archive_conversations] {totals}")
+        return
+    asyncio.run(_run_forever())
+
+
+if __name__ == "__main__":
+    main()
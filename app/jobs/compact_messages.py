@@ -0,0 +1,329 @@
+"""
+Retention and compaction for Tool messages and stale embeddings.
+
+Three passes, each optional:
+
+- compact: collapse every turn's Tool rows (a run of consecutive Tool
+  messages) older than TOOL_COMPACT_AFTER_HOURS into one Tool row with a line
+  per tool call, dropping "Executing ..." lines the call's outcome supersedes.
+  conversations.tools_compacted_up_to records how far each conversation was
+  compacted, so a pass only reads messages written since
+- prune: cut Tool payloads older than TOOL_PAYLOAD_RETENTION_DAYS down to
+  TOOL_PAYLOAD_MAX_CHARS characters
+- embeddings: drop the vectors of Human/AI messages that their conversation's
+  summary already covers and that are older than
+  SUMMARIZED_EMBEDDING_RETENTION_DAYS. conversations.embeddings_pruned_up_to
+  records how far this went, so reconcile, reembed and rehydration do not
+  embed them again
+
+Tool messages are never embedded and never part of a turn's context, so
+compaction and pruning only change what the message history shows. The
+report counts rows and bytes removed; Postgres reuses that space after
+autovacuum, and returns it to the OS only after VACUUM FULL or pg_repack.
+
+    python -m app.jobs.compact_messages --dry-run
+    python -m app.jobs.compact_messages --payload-retention-days 30
+    python -m app.jobs.compact_messages --loop --interval 3600
+"""
+import argparse
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, delete, exists, func, select, update
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message, MessageType
+from app.services import context_service, outbox_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+COMPACT_PREFIX = "[tools] "
+PRUNED_SUFFIX = " [pruned]"
+# Longest line kept per tool call in a compacted record.
+COMPACT_LINE_CHARS = 500
+
+# Tool rows are stored as "[tool_name] <event text>" by the socket handler.
+_TOOL_EVENT = re.compile(r"^\[(?P<tool>[^\]]*)\]\s*(?P<body>.*)$", re.S)
+_STARTED = re.compile(r"^\[(?P<tool>[^\]]*)\] Executing ")
+
+
+def _size(text: Optional[str]) -> int:
+    return len(text.encode("utf-8")) if text else 0
+
+
+def _event_lines(content: str) -> List[str]:
+    if content.startswith(COMPACT_PREFIX):
+        return content.split("\n")[1:]
+    match = _TOOL_EVENT.match(content)
+    tool, body = (match["tool"], match["body"]) if match else ("tool", content)
+    line = f"[{tool}] {' '.join(body.replace('**', '').split())}"
+    return [line if len(line) <= COMPACT_LINE_CHARS else line[:COMPACT_LINE_CHARS - 1] + "…"]
+
+
+def compact_tool_messages(contents: List[str]) -> str:
+    """One record for a turn's Tool messages (or earlier compacted records), oldest first."""
+    lines: List[str] = []
+    for content in contents:
+        for line in _event_lines(content):
+            tool = line.split("]", 1)[0]
+            if not _STARTED.match(line):
+                # The call finished, so its "Executing" line says nothing new.
+                for index in range(len(lines) - 1, -1, -1):
+                    if lines[index].split("]", 1)[0] == tool and _STARTED.match(lines[index]):
+                        del lines[index]
+                        break
+            lines.append(line)
+    return "\n".join([f"{COMPACT_PREFIX}{len(lines)} tool events"] + lines)
+
+
+def _conversations_to_compact(cutoff: datetime, after_id: int, batch_size: int) -> List[int]:
+    """
+    The next live conversations after `after_id` with a Tool message past their
+    watermark that is older than `cutoff`. Each probe reads only messages written
+    since the conversation's last pass.
+    """
+    uncompacted = exists().where(
+        Message.conversation_id == Conversation.conversation_id,
+        Message.message_id > func.coalesce(Conversation.tools_compacted_up_to, 0),
+        Message.type == MessageType.TOOL,
+        Message.created_at < cutoff,
+    )
+    with SessionLocal() as db:
+        return list(db.execute(
+            select(Conversation.conversation_id)
+            .where(Conversation.conversation_id > after_id, Conversation.deleted_at.is_(None), uncompacted)
+            .order_by(Conversation.conversation_id)
+            .limit(batch_size)
+        ).scalars())
+
+
+def _tool_runs(db, conversation_id: int, cutoff: datetime, after_id: int) -> Tuple[List[List[int]], Optional[int]]:
+    """
+    message_ids of each run of two or more consecutive Tool messages older than
+    `cutoff` after message `after_id`, and the new watermark: the last non-Tool
+    message among them, after which no run can still grow.
+    """
+    runs: List[List[int]] = [[]]
+    watermark = None
+    rows = db.execute(
+        select(Message.message_id, Message.type)
+        .where(Message.conversation_id == conversation_id, Message.message_id > after_id, Message.created_at < cutoff)
+        .order_by(Message.created_at, Message.message_id)
+    ).all()
+    for row in rows:
+        if row.type == MessageType.TOOL:
+            runs[-1].append(row.message_id)
+        else:
+            watermark = max(watermark or 0, row.message_id)
+            if runs[-1]:
+                runs.append([])
+    return [run for run in runs if len(run) > 1], watermark
+
+
+def compact_tool_turns(after_hours: float, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    stats = {"compacted_turns": 0, "compacted_rows_deleted": 0, "compacted_bytes": 0}
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=after_hours)
+    after_id = 0
+    while True:
+        candidates = _conversations_to_compact(cutoff, after_id, batch_size)
+        if not candidates:
+            break
+        after_id = candidates[-1]
+        for conversation_id in candidates:
+            try:
+                _compact_conversation(conversation_id, cutoff, stats, dry_run)
+            except Exception as e:
+                logger.error(f"Failed to compact tool messages of conversation {conversation_id}: {str(e)}")
+    return stats
+
+
+def _compact_conversation(conversation_id: int, cutoff: datetime, stats: Dict[str, int], dry_run: bool) -> None:
+    with SessionLocal() as db:
+        # Serializes with message writers and the archiver.
+        context = context_service.lock_context(db, conversation_id)
+        compacted_up_to = db.execute(
+            select(Conversation.tools_compacted_up_to).where(Conversation.conversation_id == conversation_id)
+        ).scalar() or 0
+        runs, watermark = _tool_runs(db, conversation_id, cutoff, compacted_up_to)
+        for run in runs:
+            contents = dict(db.execute(
+                select(Message.message_id, Message.content).where(
+                    Message.conversation_id == conversation_id, Message.message_id.in_(run)
+                )
+            ).all())
+            compacted = compact_tool_messages([contents[message_id] for message_id in run])
+            stats["compacted_turns"] += 1
+            stats["compacted_rows_deleted"] += len(run) - 1
+            stats["compacted_bytes"] += sum(_size(content) for content in contents.values()) - _size(compacted)
+            if dry_run:
+                continue
+            db.execute(
+                update(Message)
+                .where(Message.conversation_id == conversation_id, Message.message_id == run[0])
+                .values(content=compacted)
+                .execution_options(synchronize_session=False)
+            )
+            db.execute(
+                delete(Message)
+                .where(Message.conversation_id == conversation_id, Message.message_id.in_(run[1:]))
+                .execution_options(synchronize_session=False)
+            )
+            context.message_count = max((context.message_count or 0) - (len(run) - 1), 0)
+        if dry_run:
+            return
+        if watermark is not None and watermark > compacted_up_to:
+            db.execute(
+                update(Conversation)
+                .where(Conversation.conversation_id == conversation_id)
+                .values(tools_compacted_up_to=watermark)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+
+
+def prune_tool_payloads(retention_days: int, max_chars: int, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    stats = {"pruned_rows": 0, "pruned_bytes": 0}
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    table = Message.__table__
+    statement = (
+        update(table)
+        .where(table.c.conversation_id == bindparam("b_conversation_id"), table.c.message_id == bindparam("b_message_id"))
+        .values(content=bindparam("b_content"))
+    )
+    after_id = 0
+    while True:
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(Message.message_id, Message.conversation_id, Message.content)
+                .where(
+                    Message.message_id > after_id,
+                    Message.type == MessageType.TOOL,
+                    Message.created_at < cutoff,
+                    # Pruned rows are exactly this long, so they are not picked up again.
+                    func.length(Message.content) > max_chars + len(PRUNED_SUFFIX),
+                )
+                .order_by(Message.message_id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            after_id = rows[-1].message_id
+            params = [
+                {"b_conversation_id": row.conversation_id, "b_message_id": row.message_id, "b_content": row.content[:max_chars] + PRUNED_SUFFIX}
+                for row in rows
+            ]
+            stats["pruned_rows"] += len(rows)
+            stats["pruned_bytes"] += sum(_size(row.content) - _size(param["b_content"]) for row, param in zip(rows, params))
+            if not dry_run:
+                db.connection().execute(statement, params)
+                db.commit()
+    return stats
+
+
+def drop_summarized_embeddings(retention_days: int, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    stats = {"embeddings_dropped": 0, "embedding_bytes": 0}
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    dimensions = settings.embedding_truncate_dim or settings.embedding_dimensions
+    with SessionLocal() as db:
+        conversations = db.execute(
+            select(Conversation.conversation_id, Conversation.user_id).where(
+                Conversation.deleted_at.is_(None),
+                Conversation.summarized_up_to > func.coalesce(Conversation.embeddings_pruned_up_to, 0),
+            ).order_by(Conversation.conversation_id)
+        ).all()
+    for conversation_id, user_id in conversations:
+        try:
+            while True:
+                with SessionLocal() as db:
+                    conversation = db.execute(
+                        select(Conversation).where(Conversation.conversation_id == conversation_id).with_for_update()
+                    ).scalar_one()
+                    pruned_up_to = conversation.embeddings_pruned_up_to or 0
+                    rows = db.execute(
+                        select(Message.message_id, Message.type, Message.created_at)
+                        .where(
+                            Message.conversation_id == conversation_id,
+                            Message.message_id > pruned_up_to,
+                            Message.message_id <= conversation.summarized_up_to,
+                        )
+                        .order_by(Message.message_id)
+                        .limit(batch_size)
+                    ).all()
+                    # The watermark only moves over a contiguous prefix of old-enough messages.
+                    old = []
+                    for row in rows:
+                        if row.created_at is None or row.created_at >= cutoff:
+                            break
+                        old.append(row)
+                    embedded = [row for row in old if row.type in outbox_service.EMBEDDED_TYPES]
+                    stats["embeddings_dropped"] += len(embedded)
+                    # At least one float32 vector per message; chunked messages have more.
+                    stats["embedding_bytes"] += len(embedded) * dimensions * 4
+                    if old and not dry_run:
+                        for row in embedded:
+                            outbox_service.enqueue_delete_message(db, row.message_id, conversation_id, user_id)
+                        conversation.embeddings_pruned_up_to = old[-1].message_id
+                        db.commit()
+                    if dry_run or len(old) < batch_size:
+                        break
+        except Exception as e:
+            logger.error(f"Failed to drop summarized embeddings of conversation {conversation_id}: {str(e)}")
+    return stats
+
+
+def compact(
+    compact_after_hours: Optional[float],
+    payload_retention_days: int,
+    embedding_retention_days: int,
+    batch_size: int = 500,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    started = time.monotonic()
+    report: Dict[str, Any] = {"dry_run": dry_run}
+    if compact_after_hours is not None:
+        report.update(compact_tool_turns(compact_after_hours, batch_size=batch_size, dry_run=dry_run))
+    if payload_retention_days > 0:
+        report.update(prune_tool_payloads(payload_retention_days, settings.tool_payload_max_chars, batch_size=batch_size, dry_run=dry_run))
+    if embedding_retention_days > 0:
+        report.update(drop_summarized_embeddings(embedding_retention_days, batch_size=batch_size, dry_run=dry_run))
+    report["bytes_reclaimed"] = sum(report.get(key, 0) for key in ("compacted_bytes", "pruned_bytes", "embedding_bytes"))
+    report["seconds"] = round(time.monotonic() - started, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact and prune Tool messages and drop vectors of summarized messages")
+    parser.add_argument("--compact-after-hours", type=float, default=settings.tool_compact_after_hours)
+    parser.add_argument("--skip-compact", action="store_true")
+    parser.add_argument("--payload-retention-days", type=int, default=settings.tool_payload_retention_days, help="0 keeps Tool payloads")
+    parser.add_argument("--embedding-retention-days", type=int, default=settings.summarized_embedding_retention_days, help="0 keeps vectors of summarized messages")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--loop", action="store_true", help="Run forever, sleeping --interval seconds between passes")
+    parser.add_argument("--interval", type=int, default=3600)
+    args = parser.parse_args()
+
+    while True:
+        try:
+            report = compact(
+                None if args.skip_compact else args.compact_after_hours,
+                args.payload_retention_days,
+                args.embedding_retention_days,
+                batch_size=args.batch_size,
+                dry_run=args.dry_run,
+            )
+            print(f"[compact_messages] {report}")
+        except Exception as e:
+            if not args.loop:
+                raise
+            logger.error(f"Message compaction pass failed: {str(e)}")
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Bring metadata of existing vectors up to date in place, without re-embedding:
+ISO-string timestamps become epoch seconds of the message's creation time, and
+message type and user_id are added, so time-window, role and user filters
+also match vectors written before they existed.
+
+Vectors whose message no longer exists are left for app.jobs.reconcile. The
+pgvector backend reads this metadata from `messages` and needs no migration.
+
+    python -m app.jobs.migrate_vector_metadata --dry-run
+    python -m app.jobs.migrate_vector_metadata
+"""
+import argparse
+from typing import Any, Dict, List
+from sqlalchemy import select
+from app.db.session import SessionLocal
+from app.models.message import Message
+from app.vectorstores import get_vector_store
+from app.vectorstores.base import epoch_seconds, type_value
+
+
+def _is_current(metadata: Dict[str, Any]) -> bool:
+    return isinstance(metadata.get("timestamp"), int) and "type" in metadata and "user_id" in metadata
+
+
+def _messages(message_ids: List[int]) -> Dict[int, Any]:
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(Message.message_id, Message.user_id, Message.type, Message.created_at).where(Message.message_id.in_(message_ids))
+        ).all()
+    return {row.message_id: row for row in rows}
+
+
+def migrate(batch_size: int = 500, dry_run: bool = False) -> Dict[str, Any]:
+    store = get_vector_store()
+    stats: Dict[str, Any] = {"backend": store.name, "scanned": 0, "current": 0, "updated": 0, "orphans": 0, "dry_run": dry_run}
+    if store.name == "pgvector":
+        return stats
+    for page in store.iter_vectors(batch_size):
+        stats["scanned"] += len(page)
+        stale = [item for item in page if not _is_current(item.get("metadata") or {})]
+        stats["current"] += len(page) - len(stale)
+        if not stale:
+            continue
+        messages = _messages([item["message_id"] for item in stale])
+        updates = []
+        for item in stale:
+            message = messages.get(item["message_id"])
+            if message is None:
+                stats["orphans"] += 1
+                continue
+            # Keep everything else, embedding_model in particular: the vector itself is unchanged.
+            metadata = dict(
+                item.get("metadata") or {},
+                user_id=message.user_id,
+                type=type_value(message.type),
+                timestamp=epoch_seconds(message.created_at),
+            )
+            updates.append(dict(item, metadata=metadata))
+        if updates and not dry_run:
+            store.update_metadata(updates)
+        stats["updated"] += len(updates)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate vector metadata to epoch timestamps with message type and user_id")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    print(f"[migrate_vector_metadata] {migrate(batch_size=args.batch_size, dry_run=args.dry_run)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Drain the embedding outbox outside the API process. Any number of workers
+can run next to each other and next to the in-process drainer; rows are
+claimed with FOR UPDATE SKIP LOCKED.
+
+    python -m app.jobs.outbox_worker
+    python -m app.jobs.outbox_worker --once      # drain what is due and exit
+
+Set OUTBOX_WORKER_IN_PROCESS=false to leave draining to these workers only.
+"""
+import argparse
+import asyncio
+import signal
+from app.config import settings
+from app.services import outbox_service
+
+
+async def _drain_due(batch_size: int) -> int:
+    total = 0
+    while True:
+        claimed = await outbox_service.drain_once(batch_size)
+        total += claimed
+        if claimed < batch_size:
+            return total
+
+
+async def _run_forever() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await outbox_service.run_worker(stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply queued vector store writes and deletes")
+    parser.add_argument("--once", action="store_true", help="Drain rows that are due and exit")
+    parser.add_argument("--batch-size", type=int, default=settings.outbox_batch_size)
+    args = parser.parse_args()
+    if args.once:
+        total = asyncio.run(_drain_due(args.batch_size))
+        print(f"[outbox_worker] processed {total} rows")
+        return
+    settings.outbox_batch_size = args.batch_size
+    asyncio.run(_run_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Remove soft-deleted conversations outside the API process, in transactions of
+at most --batch-size messages. Safe to run next to the in-process purger;
+message batches are claimed with FOR UPDATE SKIP LOCKED.
+
+    python -m app.jobs.purge_conversations --once
+    python -m app.jobs.purge_conversations --conversation-id 42
+
+Set CONVERSATION_PURGE_IN_PROCESS=false to leave purging to this job only.
+"""
+import argparse
+import asyncio
+import signal
+from app.config import settings
+from app.services import purge_service
+
+
+async def _run_forever() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await purge_service.run_purger(stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete messages and vectors of soft-deleted conversations")
+    parser.add_argument("--once", action="store_true", help="Purge every soft-deleted conversation completely and exit")
+    parser.add_argument("--conversation-id", type=int, help="Purge a single soft-deleted conversation and exit")
+    parser.add_argument("--batch-size", type=int, default=settings.conversation_purge_batch_size)
+    args = parser.parse_args()
+    settings.conversation_purge_batch_size = args.batch_size
+    if args.conversation_id is not None:
+        rows = purge_service.deleted_conversations(conversation_id=args.conversation_id)
+        if not rows:
+            print(f"[purge_conversations] conversation {args.conversation_id} is not soft-deleted")
+            return
+        stats = purge_service.purge_conversation(rows[0].conversation_id, rows[0].user_id)
+        print(f"[purge_conversations] {stats}")
+        return
+    if args.once:
+        stats = purge_service.purge_deleted(limit=None)
+        print(f"[purge_conversations] {stats}")
+        return
+    asyncio.run(_run_forever())
+
+
+if __name__ == "__main__":
+    main()
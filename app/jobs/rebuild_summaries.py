@@ -0,0 +1,74 @@
+"""
+Backfill or rebuild conversation summaries with map-reduce: each history is
+cut into prompts of at most --max-prompt-chars, summarized in parallel and
+merged, and the summarized-up-to watermark is reset to the last message.
+
+    python -m app.jobs.rebuild_summaries                     # conversations that have no watermark yet
+    python -m app.jobs.rebuild_summaries --all               # every live conversation
+    python -m app.jobs.rebuild_summaries --conversation-id 42
+"""
+import argparse
+import asyncio
+from typing import List, Optional
+from sqlalchemy import select
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.services import summary_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _conversation_ids(all_conversations: bool, conversation_id: Optional[int], limit: Optional[int]) -> List[int]:
+    query = select(Conversation.conversation_id).where(Conversation.deleted_at.is_(None))
+    if conversation_id is not None:
+        query = query.where(Conversation.conversation_id == conversation_id)
+    elif not all_conversations:
+        query = query.where(Conversation.summarized_up_to.is_(None))
+    with SessionLocal() as db:
+        return list(db.execute(query.order_by(Conversation.conversation_id).limit(limit)).scalars())
+
+
+async def rebuild(
+    all_conversations: bool = False,
+    conversation_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    max_chars: Optional[int] = None,
+    concurrency: Optional[int] = None,
+) -> dict:
+    stats = {"conversations": 0, "messages": 0, "failed": 0}
+    for cid in _conversation_ids(all_conversations, conversation_id, limit):
+        try:
+            with SessionLocal() as db:
+                count = await summary_service.rebuild_summary(db, cid, max_chars=max_chars, concurrency=concurrency)
+        except Exception as e:
+            logger.error(f"Failed to rebuild summary for conversation {cid}: {str(e)}")
+            stats["failed"] += 1
+            continue
+        stats["conversations"] += 1
+        stats["messages"] += count
+        print(f"[rebuild_summaries] conversation {cid}: {count} messages")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild conversation summaries with map-reduce")
+    parser.add_argument("--all", action="store_true", help="Rebuild every live conversation, not only those without a watermark")
+    parser.add_argument("--conversation-id", type=int)
+    parser.add_argument("--limit", type=int, help="Rebuild at most this many conversations")
+    parser.add_argument("--max-prompt-chars", type=int, default=settings.summary_max_prompt_chars, help="Upper bound on the messages or summaries sent per LLM call")
+    parser.add_argument("--concurrency", type=int, default=settings.summary_rebuild_concurrency, help="Summary requests in flight per conversation")
+    args = parser.parse_args()
+    stats = asyncio.run(rebuild(
+        all_conversations=args.all,
+        conversation_id=args.conversation_id,
+        limit=args.limit,
+        max_chars=args.max_prompt_chars,
+        concurrency=args.concurrency,
+    ))
+    print(f"[rebuild_summaries] done: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Reconcile the vector store with Postgres.
+
+Two bounded passes, each holding one batch of ids at a time:
+
+- vectors: page through every stored vector and bulk-delete those whose
+  message no longer exists (orphans)
+- messages: walk Human/AI messages in message_id order and enqueue an outbox
+  upsert for those without a vector from the current embedding model
+
+Messages newer than --grace-seconds and messages that already have a pending
+outbox row are left alone, so the job is idempotent and safe to run next to
+live traffic, continuously with --loop. The report counts dead outbox rows,
+those that used up OUTBOX_MAX_ATTEMPTS; --requeue-dead retries them.
+
+    python -m app.jobs.reconcile --dry-run
+    python -m app.jobs.reconcile --loop --interval 3600
+    python -m app.jobs.reconcile --requeue-dead --skip-orphans --skip-missing
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy import func, select, tuple_
+from app.db.session import SessionLocal
+from app.jobs.reembed import existing_message_ids
+from app.models.conversation import Conversation
+from app.models.embedding_outbox import EmbeddingOutbox, OutboxOp
+from app.models.message import Message
+from app.services import outbox_service
+from app.utils import chunking
+from app.vectorstores import get_vector_store, embedding_model_id
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _existing_messages(keys: List[Tuple[int, Optional[int]]]) -> Set[int]:
+    """
+    Ids of the (message_id, conversation_id) pairs that still exist; the
+    conversation ids limit the lookup to their partitions. Vectors written
+    without a conversation_id are looked up by message_id across partitions.
+    """
+    scoped = [(message_id, conversation_id) for message_id, conversation_id in keys if conversation_id is not None]
+    unscoped = [message_id for message_id, conversation_id in keys if conversation_id is None]
+    found: Set[int] = set()
+    with SessionLocal() as db:
+        if scoped:
+            found.update(db.execute(
+                select(Message.message_id).where(
+                    Message.conversation_id.in_({conversation_id for _, conversation_id in scoped}),
+                    tuple_(Message.message_id, Message.conversation_id).in_(scoped),
+                )
+            ).scalars())
+        if unscoped:
+            found.update(db.execute(select(Message.message_id).where(Message.message_id.in_(unscoped))).scalars())
+    return found
+
+
+def sweep_orphans(store, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    stats = {"vectors_scanned": 0, "orphans": 0, "orphans_deleted": 0}
+    orphans: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        if orphans and not dry_run:
+            store.delete_vectors(orphans)
+            stats["orphans_deleted"] += len(orphans)
+        orphans.clear()
+
+    for page in store.iter_vectors(batch_size):
+        stats["vectors_scanned"] += len(page)
+        live = _existing_messages([(item["message_id"], item["conversation_id"]) for item in page])
+        found = [item for item in page if item["message_id"] not in live]
+        stats["orphans"] += len(found)
+        orphans.extend(found)
+        if len(orphans) >= batch_size:
+            flush()
+    flush()
+    return stats
+
+
+def _fetch_messages(after_id: int, batch_size: int) -> List[Any]:
+    with SessionLocal() as db:
+        return db.execute(
+            select(Message.message_id, Message.conversation_id, Message.user_id, Message.type, Message.content, Message.created_at)
+            .join(Conversation)
+            .where(
+                Message.message_id > after_id,
+                Message.type.in_(outbox_service.EMBEDDED_TYPES),
+                # Soft-deleted conversations are the purger's job.
+                Conversation.deleted_at.is_(None),
+                # Vectors dropped on purpose by app/jobs/compact_messages.py.
+                Message.message_id > func.coalesce(Conversation.embeddings_pruned_up_to, 0),
+            )
+            .order_by(Message.message_id)
+            .limit(batch_size)
+        ).all()
+
+
+def _pending_upserts(message_ids: List[int]) -> Set[int]:
+    with SessionLocal() as db:
+        return set(db.execute(
+            select(EmbeddingOutbox.message_id).where(
+                EmbeddingOutbox.op == OutboxOp.UPSERT.value,
+                EmbeddingOutbox.message_id.in_(message_ids),
+            )
+        ).scalars().all())
+
+
+def enqueue_missing(store, batch_size: int = 500, grace_seconds: int = 300, dry_run: bool = False) -> Dict[str, int]:
+    stats = {"messages_scanned": 0, "missing": 0, "enqueued": 0, "skipped_recent": 0, "already_queued": 0}
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    last_id = 0
+    while True:
+        rows = _fetch_messages(last_id, batch_size)
+        if not rows:
+            break
+        last_id = rows[-1].message_id
+        stats["messages_scanned"] += len(rows)
+        candidates = []
+        for row in rows:
+            if chunking.is_trivial(row.content):
+                continue
+            created_at = row.created_at
+            if created_at is not None and created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            if created_at is not None and created_at > cutoff:
+                stats["skipped_recent"] += 1
+                continue
+            candidates.append(row)
+        if not candidates:
+            continue
+        existing = existing_message_ids(store, candidates)
+        missing = [row for row in candidates if row.message_id not in existing]
+        if not missing:
+            continue
+        queued = _pending_upserts([row.message_id for row in missing])
+        stats["already_queued"] += len(queued)
+        missing = [row for row in missing if row.message_id not in queued]
+        stats["missing"] += len(missing)
+        if missing and not dry_run:
+            with SessionLocal() as db:
+                for row in missing:
+                    outbox_service.enqueue_upsert(db, row)
+                db.commit()
+            stats["enqueued"] += len(missing)
+    return stats
+
+
+def reconcile(
+    batch_size: int = 500,
+    grace_seconds: int = 300,
+    dry_run: bool = False,
+    orphans: bool = True,
+    missing: bool = True,
+    requeue_dead: bool = False,
+) -> Dict[str, Any]:
+    store = get_vector_store()
+    started = time.monotonic()
+    report: Dict[str, Any] = {"backend": store.name, "embedding_model": embedding_model_id(), "dry_run": dry_run}
+    report["outbox_dead"] = outbox_service.dead_rows()
+    if requeue_dead and not dry_run:
+        report["outbox_requeued"] = outbox_service.requeue_dead()
+    if orphans:
+        report.update(sweep_orphans(store, batch_size=batch_size, dry_run=dry_run))
+    if missing:
+        report.update(enqueue_missing(store, batch_size=batch_size, grace_seconds=grace_seconds, dry_run=dry_run))
+    report["seconds"] = round(time.monotonic() - started, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete orphaned vectors and enqueue missing embeddings")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--grace-seconds", type=int, default=300, help="Ignore messages newer than this")
+    parser.add_argument("--skip-orphans", action="store_true")
+    parser.add_argument("--skip-missing", action="store_true")
+    parser.add_argument("--requeue-dead", action="store_true", help="Retry outbox rows that used up their attempts")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--loop", action="store_true", help="Run forever, sleeping --interval seconds between passes")
+    parser.add_argument("--interval", type=int, default=3600)
+    args = parser.parse_args()
+
+    while True:
+        try:
+            report = reconcile(
+                batch_size=args.batch_size,
+                grace_seconds=args.grace_seconds,
+                dry_run=args.dry_run,
+                orphans=not args.skip_orphans,
+                missing=not args.skip_missing,
+                requeue_dead=args.requeue_dead,
+            )
+            print(f"[reconcile] {report}")
+        except Exception as e:
+            if not args.loop:
+                raise
+            logger.error(f"Reconciliation pass failed: {str(e)}")
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
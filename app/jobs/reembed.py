@@ -0,0 +1,280 @@
+"""
+Embed messages with the configured embedding model and bulk-write them to the
+vector store. Messages are read in message_id order and progress is
+checkpointed after every batch, so an interrupted run resumes where it stopped.
+
+    python -m app.jobs.reembed                          # (re-)embed everything for the current model
+    python -m app.jobs.reembed --missing-only           # retry messages that have no vector from this model
+    python -m app.jobs.reembed --stamp-existing         # claim vectors written before model stamping
+
+Run it with the MODEL / EMBEDDING_TRUNCATE_DIM you are about to deploy; vectors
+are stamped with that model id and queries only match vectors from it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+from sqlalchemy import func, select, text
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services import outbox_service
+from app.services.llm_service import get_embedding_model
+from app.utils import chunking
+from app.vectorstores import get_vector_store, embedding_model_id
+from app.vectorstores.local import model_dir
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket refilled at `per_minute` units per minute; 0 disables the limit."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.available = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, cost: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        cost = min(cost, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= cost:
+                    self.available -= cost
+                    return
+                await asyncio.sleep((cost - self.available) / self.rate)
+
+
+def _estimate_tokens(texts: List[str]) -> int:
+    return sum(len(t) for t in texts) // 4 + len(texts)
+
+
+def default_checkpoint_path(conversation_id: Optional[int] = None) -> str:
+    suffix = f"_c{conversation_id}" if conversation_id is not None else ""
+    return os.path.join("data", f"reembed_{model_dir(embedding_model_id())}{suffix}.json")
+
+
+def _new_state(model_id: str) -> Dict[str, Any]:
+    return {"embedding_model": model_id, "last_message_id": 0, "embedded": 0, "skipped": 0}
+
+
+def _load_checkpoint(path: str, model_id: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("embedding_model") == model_id:
+            return state
+        logger.warning(f"Ignoring checkpoint {path} written for {state.get('embedding_model')}")
+    except FileNotFoundError:
+        pass
+    return _new_state(model_id)
+
+
+def _save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dict(state, updated_at=time.time()), f)
+    os.replace(tmp, path)
+
+
+def _fetch_batch(after_id: int, batch_size: int, conversation_id: Optional[int]) -> List[Any]:
+    query = select(
+        Message.message_id, Message.conversation_id, Message.user_id, Message.type, Message.content, Message.created_at
+    ).join(Conversation).where(
+        Message.message_id > after_id,
+        Message.type.in_(outbox_service.EMBEDDED_TYPES),
+        Conversation.deleted_at.is_(None),
+        Message.message_id > func.coalesce(Conversation.embeddings_pruned_up_to, 0),
+    )
+    if conversation_id is not None:
+        query = query.where(Message.conversation_id == conversation_id)
+    with SessionLocal() as db:
+        return db.execute(query.order_by(Message.message_id).limit(batch_size)).all()
+
+
+def existing_message_ids(store, rows: List[Any]) -> Set[int]:
+    """Ids among message rows (message_id, conversation_id, user_id) that already have a vector from the current model."""
+    groups: Dict[tuple, List[int]] = defaultdict(list)
+    for row in rows:
+        groups[(row.conversation_id, row.user_id)].append(row.message_id)
+    found: Set[int] = set()
+    for (conversation_id, user_id), message_ids in groups.items():
+        found |= store.existing_ids(message_ids, conversation_id=conversation_id, user_id=user_id)
+    return found
+
+
+async def _embed(model, texts: List[str], semaphore: asyncio.Semaphore, requests: RateLimiter, tokens: RateLimiter, retries: int) -> List[List[float]]:
+    async with semaphore:
+        for attempt in range(retries + 1):
+            await requests.acquire()
+            await tokens.acquire(_estimate_tokens(texts))
+            try:
+                return await model.aembed_documents(texts)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                delay = min(60.0, 2 ** attempt) + random.random()
+                logger.warning(f"Embedding batch of {len(texts)} failed ({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+    return []
+
+
+async def reembed(
+    batch_size: int = 500,
+    embed_batch_size: int = 100,
+    concurrency: int = 4,
+    requests_per_minute: float = 0,
+    tokens_per_minute: float = 0,
+    retries: int = 5,
+    missing_only: bool = False,
+    conversation_id: Optional[int] = None,
+    checkpoint_path: Optional[str] = None,
+    reset: bool = False,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    model_id = embedding_model_id()
+    checkpoint_path = checkpoint_path or default_checkpoint_path(conversation_id)
+    state = _new_state(model_id) if reset else _load_checkpoint(checkpoint_path, model_id)
+    store = get_vector_store()
+    model = get_embedding_model()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    requests = RateLimiter(requests_per_minute)
+    tokens = RateLimiter(tokens_per_minute)
+    started = time.monotonic()
+    print(f"[reembed] model={model_id} backend={store.name} resuming after message {state['last_message_id']}")
+
+    while True:
+        rows = await asyncio.to_thread(_fetch_batch, state["last_message_id"], batch_size, conversation_id)
+        if not rows:
+            break
+        pending = [row for row in rows if not chunking.is_trivial(row.content)]
+        if missing_only and pending:
+            existing = await asyncio.to_thread(existing_message_ids, store, pending)
+            pending = [row for row in pending if row.message_id not in existing]
+
+        if pending and not dry_run:
+            records = chunking.message_chunks(pending)
+            texts, positions = chunking.unique_texts(records)
+            batches = [texts[i:i + embed_batch_size] for i in range(0, len(texts), embed_batch_size)]
+            vectors = [
+                vector
+                for batch_vectors in await asyncio.gather(*[
+                    _embed(model, batch, semaphore, requests, tokens, retries) for batch in batches
+                ])
+                for vector in batch_vectors
+            ]
+            for record, position in zip(records, positions):
+                record["embedding"] = vectors[position]
+            await asyncio.to_thread(store.add_many, records)
+
+        state["embedded"] += len(pending)
+        state["skipped"] += len(rows) - len(pending)
+        state["last_message_id"] = rows[-1].message_id
+        if not dry_run:
+            _save_checkpoint(checkpoint_path, state)
+        elapsed = time.monotonic() - started
+        print(f"[reembed] last_message_id={state['last_message_id']} embedded={state['embedded']} skipped={state['skipped']} ({state['embedded'] / max(elapsed, 1e-9):.1f}/s)")
+
+    return state
+
+
+def stamp_existing(batch_size: int = 500) -> int:
+    """
+    Claim vectors written before model stamping for the current model, without
+    re-embedding. Only run this when they were produced by the configured model.
+    """
+    model_id = embedding_model_id()
+    backend = settings.vector_backend.lower()
+    stamped = 0
+    if backend == "pgvector":
+        with SessionLocal() as db:
+            result = db.execute(
+                text("UPDATE message_embeddings SET embedding_model = :model WHERE embedding_model IS NULL"),
+                {"model": model_id},
+            )
+            db.commit()
+            stamped = result.rowcount
+    elif backend == "local":
+        # Unstamped indexes live directly under LOCAL_INDEX_DIR; move them into the model's tree.
+        target = os.path.join(settings.local_index_dir, model_dir(model_id))
+        os.makedirs(target, exist_ok=True)
+        for name in os.listdir(settings.local_index_dir):
+            source = os.path.join(settings.local_index_dir, name)
+            if name.isdigit() and not os.path.exists(os.path.join(target, name)):
+                os.replace(source, os.path.join(target, name))
+                stamped += 1
+    elif backend == "chroma":
+        from app.vectorstores.chroma import get_collection_by_name, list_collection_names
+        for name in list_collection_names():
+            target = get_collection_by_name(name)
+            offset = 0
+            while True:
+                page = target.get(limit=batch_size, offset=offset, include=["metadatas"])
+                if not page["ids"]:
+                    break
+                ids, metadatas = [], []
+                for vector_id, metadata in zip(page["ids"], page["metadatas"] or []):
+                    if metadata is not None and "embedding_model" not in metadata:
+                        ids.append(vector_id)
+                        metadatas.append(dict(metadata, embedding_model=model_id))
+                if ids:
+                    target.update(ids=ids, metadatas=metadatas)
+                stamped += len(ids)
+                offset += len(page["ids"])
+    else:
+        raise ValueError(f"Invalid vector_backend: {settings.vector_backend}")
+    print(f"[reembed] stamped {stamped} {'conversations' if backend == 'local' else 'vectors'} with {model_id}")
+    return stamped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed messages into the vector store with the configured model")
+    parser.add_argument("--batch-size", type=int, default=500, help="Messages read from Postgres per batch")
+    parser.add_argument("--embed-batch-size", type=int, default=100, help="Texts per embedding request")
+    parser.add_argument("--concurrency", type=int, default=4, help="Embedding requests in flight")
+    parser.add_argument("--requests-per-minute", type=float, default=0)
+    parser.add_argument("--tokens-per-minute", type=float, default=0)
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--missing-only", action="store_true", help="Skip messages that already have a vector from this model")
+    parser.add_argument("--conversation-id", type=int)
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: data/reembed_<model>[_c<conversation>].json)")
+    parser.add_argument("--reset", action="store_true", help="Ignore the checkpoint and start from the first message")
+    parser.add_argument("--stamp-existing", action="store_true", help="Only stamp vectors written before model stamping")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.stamp_existing:
+        stamp_existing(batch_size=args.batch_size)
+        return
+    state = asyncio.run(reembed(
+        batch_size=args.batch_size,
+        embed_batch_size=args.embed_batch_size,
+        concurrency=args.concurrency,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        retries=args.retries,
+        missing_only=args.missing_only,
+        conversation_id=args.conversation_id,
+        checkpoint_path=args.checkpoint,
+        reset=args.reset,
+        dry_run=args.dry_run,
+    ))
+    print(f"[reembed] done: {state}")
+
+
+if __name__ == "__main__":
+    main()
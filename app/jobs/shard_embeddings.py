@@ -0,0 +1,97 @@
+"""
+Move vectors from the global Chroma collection into the per-user/per-bucket
+collections selected by settings.chroma_sharding. Embeddings, documents and
+metadata are copied as-is, so nothing is re-embedded.
+
+    CHROMA_SHARDING=user python -m app.jobs.shard_embeddings --delete-source
+"""
+import argparse
+from collections import defaultdict
+from typing import Dict, Iterable, List
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models import Conversation
+from app.vectorstores.chroma import collection_name_for_user, get_collection_by_name
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _conversation_owners(conversation_ids: Iterable[int]) -> Dict[int, int]:
+    ids = list(set(conversation_ids))
+    if not ids:
+        return {}
+    with SessionLocal() as db:
+        rows = db.query(Conversation.conversation_id, Conversation.user_id).filter(
+            Conversation.conversation_id.in_(ids)
+        ).all()
+    return {conversation_id: user_id for conversation_id, user_id in rows}
+
+
+def shard_embeddings(batch_size: int = 500, delete_source: bool = False, dry_run: bool = False) -> Dict[str, int]:
+    if settings.chroma_sharding.lower() == "none":
+        raise ValueError("Set CHROMA_SHARDING to 'user' or 'bucket' before running the migration")
+
+    source = get_collection_by_name(settings.chroma_collection)
+    stats = {"scanned": 0, "moved": 0, "orphaned": 0, "deleted": 0}
+    offset = 0
+
+    while True:
+        page = source.get(
+            limit=batch_size,
+            offset=offset,
+            include=["embeddings", "metadatas", "documents"],
+        )
+        ids: List[str] = page["ids"]
+        if not ids:
+            break
+        stats["scanned"] += len(ids)
+
+        metadatas = page["metadatas"] or [{} for _ in ids]
+        owners = _conversation_owners(
+            int(m["conversation_id"]) for m in metadatas if m and "conversation_id" in m
+        )
+
+        grouped = defaultdict(lambda: {"ids": [], "embeddings": [], "metadatas": [], "documents": []})
+        orphan_ids: List[str] = []
+        for i, vector_id in enumerate(ids):
+            metadata = metadatas[i] or {}
+            user_id = owners.get(int(metadata.get("conversation_id", 0)))
+            if user_id is None:
+                orphan_ids.append(vector_id)
+                continue
+            target = grouped[collection_name_for_user(user_id)]
+            target["ids"].append(vector_id)
+            target["embeddings"].append(page["embeddings"][i])
+            target["metadatas"].append(metadata)
+            target["documents"].append(page["documents"][i])
+        stats["orphaned"] += len(orphan_ids)
+
+        for name, records in grouped.items():
+            if not dry_run:
+                get_collection_by_name(name).upsert(**records)
+            stats["moved"] += len(records["ids"])
+
+        if delete_source and not dry_run:
+            source.delete(ids=ids)
+            stats["deleted"] += len(ids)
+        else:
+            offset += len(ids)
+
+        print(f"[shard_embeddings] scanned={stats['scanned']} moved={stats['moved']} orphaned={stats['orphaned']}")
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move embeddings from the global collection into sharded collections")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--delete-source", action="store_true", help="Remove vectors from the global collection once copied")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    stats = shard_embeddings(batch_size=args.batch_size, delete_source=args.delete_source, dry_run=args.dry_run)
+    print(f"[shard_embeddings] done: {stats}")
+
+
+if __name__ == "__main__":
+    main()
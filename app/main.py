@@ -1,17 +1,74 @@
+import asyncio
+import logging
+import math
+import time
 import socketio
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
 from starlette.middleware.sessions import SessionMiddleware
 from app.config import settings
 from app.routers import auth, conversations, tools
-from app.db.session import engine
+from app.db.session import engine, has_replica
 from app.db.session import Base
+from app import providers
+from app.services import readiness_service, outbox_service, purge_service, summary_service, write_behind
 from contextlib import asynccontextmanager
 
+logger = logging.getLogger(__name__)
+
+def _preload_providers():
+    for name in providers.registered():
+        try:
+            providers.get(name)
+        except Exception as e:
+            logger.error(f"Failed to preload provider {name}: {str(e)}")
+
+def _create_tables():
+    tables = list(Base.metadata.sorted_tables)
+    if settings.vector_backend.lower() == "pgvector":
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    else:
+        # Skip the vector table so plain Postgres without the extension still boots.
+        tables = [t for t in tables if t.name != "message_embeddings"]
+    Base.metadata.create_all(bind=engine, tables=tables)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
+    if settings.create_tables_on_startup:
+        await asyncio.to_thread(_create_tables)
+    if settings.write_behind_enabled:
+        # Messages journaled by a process that died before inserting them.
+        await asyncio.to_thread(write_behind.replay_journals)
+    preload_task = None
+    if settings.preload_providers:
+        # Warm clients in the background so startup never waits on Chroma/LLM providers.
+        preload_task = asyncio.create_task(asyncio.to_thread(_preload_providers))
+    worker_stop = asyncio.Event()
+    outbox_task = None
+    if settings.outbox_worker_in_process:
+        outbox_task = asyncio.create_task(outbox_service.run_worker(worker_stop))
+    purge_task = None
+    if settings.conversation_purge_in_process:
+        purge_task = asyncio.create_task(purge_service.run_purger(worker_stop))
     yield
+    if preload_task is not None and not preload_task.done():
+        preload_task.cancel()
+    if settings.write_behind_enabled:
+        await write_behind.write_queue.close(settings.write_behind_shutdown_timeout_seconds)
+    summary_service.cancel_updates()
+    worker_stop.set()
+    # Anything left queued stays in Postgres for the next drainer.
+    for task in (purge_task, outbox_task):
+        if task is None:
+            continue
+        try:
+            await asyncio.wait_for(task, timeout=settings.outbox_shutdown_timeout_seconds)
+        except asyncio.TimeoutError:
+            task.cancel()
+    providers.reset()
 
 fastapi_app = FastAPI(
     title=settings.app_name,
@@ -24,6 +81,23 @@ fastapi_app = FastAPI(
 
 fastapi_app.add_middleware(SessionMiddleware, secret_key=settings.secret_key)
 
+@fastapi_app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    """After a request commits to the primary, route the client's reads there until the replica catches up."""
+    response = await call_next(request)
+    if has_replica and getattr(request.state, "wrote_to_primary", False):
+        response.set_cookie(
+            key=settings.read_your_writes_cookie,
+            value=f"{time.time() + settings.read_your_writes_seconds:.3f}",
+            max_age=math.ceil(settings.read_your_writes_seconds),
+            path=settings.cookie_path or "/",
+            domain=settings.cookie_domain,
+            secure=settings.cookie_secure,
+            httponly=True,
+            samesite=settings.cookie_samesite or "lax",
+        )
+    return response
+
 fastapi_app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.allowed_origin,
@@ -49,6 +123,12 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@fastapi_app.get("/ready")
+async def readiness_check():
+    """Warm dependencies and report ready only when all of them respond within their thresholds."""
+    result = await readiness_service.check_readiness()
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
+
 sio = socketio.AsyncServer(
     cors_allowed_origins='*', 
     async_mode='asgi',
@@ -1,6 +1,10 @@
 from .user import User
 from .conversation import Conversation
+from .conversation_context import ConversationContext
 from .message import Message, MessageType
 from .user_toolkit_connection import UserToolkitConnection, ConnectionStatus
+from .message_embedding import MessageEmbedding
+from .embedding_outbox import EmbeddingOutbox, OutboxOp
+from .message_archive import MessageArchive
 
-__all__ = ["User", "Conversation", "Message", "MessageType", "UserToolkitConnection", "ConnectionStatus"]
+__all__ = ["User", "Conversation", "ConversationContext", "Message", "MessageType", "UserToolkitConnection", "ConnectionStatus", "MessageEmbedding", "EmbeddingOutbox", "OutboxOp", "MessageArchive"]
@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Integer, String, DateTime, ForeignKey, Text, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from app.db.session import Base
@@ -6,13 +6,24 @@ from app.db.session import Base
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Only soft-deleted rows waiting for the purger are indexed.
+        Index("ix_conversations_deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL")),
+    )
 
     conversation_id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.user_id"), nullable=False)
     title: Mapped[str | None] = mapped_column(String(255), nullable=True)
     summary_text: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # message_id of the last message summary_text covers; later messages are still to be summarized.
+    summarized_up_to: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # message_id up to which summarized messages had their vectors dropped (app/jobs/compact_messages.py).
+    embeddings_pruned_up_to: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # message_id of the last non-Tool message compaction has passed; Tool runs before it are settled.
+    tools_compacted_up_to: Mapped[int | None] = mapped_column(Integer, nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), onupdate=func.now())
+    deleted_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
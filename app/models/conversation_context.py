@@ -0,0 +1,34 @@
+from sqlalchemy import Integer, String, DateTime, ForeignKey, Index, Text, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.session import Base
+
+
+class ConversationContext(Base):
+    """
+    Denormalized history a chat turn starts from: the summary and the latest
+    Human/AI messages, maintained in the same transactions that insert or
+    delete messages and store summaries (app/services/context_service.py).
+    """
+    __tablename__ = "conversation_context"
+    __table_args__ = (
+        # Keyset pages of a user's conversations, most recently active first.
+        Index("ix_conversation_context_user_id_last_activity_at", "user_id", "last_activity_at", "conversation_id"),
+    )
+
+    conversation_id: Mapped[int] = mapped_column(Integer, ForeignKey("conversations.conversation_id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
+    summary_text: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Oldest first: [{"message_id", "write_id", "type", "content"}, ...]; "type" is the MessageType name.
+    recent_messages = mapped_column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    recent_message_ids = mapped_column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    updated_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Bumped by every change to the summary or the window, so cached conversation states can tell they are stale.
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # For the conversation index: every stored message counts, Tool messages included.
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    last_activity_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_message_preview: Mapped[str | None] = mapped_column(String(200), nullable=True)
+    # Set while the conversation's messages are in cold storage (app/services/archive_service.py).
+    archived_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
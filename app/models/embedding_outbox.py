@@ -0,0 +1,33 @@
+from sqlalchemy import Integer, String, DateTime, Text, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.session import Base
+from enum import Enum
+
+
+class OutboxOp(str, Enum):
+    UPSERT = "upsert"
+    DELETE_MESSAGE = "delete_message"
+    DELETE_CONVERSATION = "delete_conversation"
+
+
+class EmbeddingOutbox(Base):
+    """
+    Pending vector store writes, inserted in the same transaction as the
+    message change they mirror. No foreign keys: rows must outlive the
+    messages and conversations they delete.
+    """
+    __tablename__ = "embedding_outbox"
+    __table_args__ = (Index("ix_embedding_outbox_available_at_outbox_id", "available_at", "outbox_id"),)
+
+    outbox_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    op: Mapped[str] = mapped_column(String(32), nullable=False)
+    message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    conversation_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    available_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Set once a row has used up outbox_max_attempts; drainers skip it until it is requeued.
+    dead_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -1,8 +1,15 @@
-from sqlalchemy import Integer, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import DDL, Integer, String, DateTime, ForeignKey, Text, Enum, Computed, Index, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 import enum
 from app.db.session import Base
+from app.config import settings
+
+# `messages` is hash-partitioned on conversation_id, so a conversation's rows live in
+# one partition and every per-conversation query prunes to it. Changing the count
+# means repartitioning; see the migration that introduced it.
+MESSAGE_PARTITIONS = 16
 
 
 class MessageType(str, enum.Enum):
@@ -14,13 +21,43 @@ class MessageType(str, enum.Enum):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_content_tsv", "content_tsv", postgresql_using="gin"),
+        Index("ix_messages_conversation_id_message_id", "conversation_id", "message_id"),
+        # Unique indexes on a partitioned table must include the partition key.
+        Index("ix_messages_conversation_id_write_id", "conversation_id", "write_id", unique=True),
+        {"postgresql_partition_by": "HASH (conversation_id)"},
+    )
+    # The table's key is (message_id, conversation_id) because of the partitioning;
+    # message_id alone still identifies a message.
+    __mapper_args__ = {"exclude_properties": ["content_tsv"], "primary_key": ["message_id"]}
 
-    message_id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    conversation_id: Mapped[int] = mapped_column(Integer, ForeignKey("conversations.conversation_id"), nullable=False)
+    message_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, index=True)
+    conversation_id: Mapped[int] = mapped_column(Integer, ForeignKey("conversations.conversation_id"), primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.user_id"), nullable=False)
     type: Mapped[MessageType] = mapped_column(Enum(MessageType), nullable=False)
     content: Mapped[str] = mapped_column(Text, nullable=False)
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # Set by write-behind persistence so journal replays never insert a message twice.
+    write_id: Mapped[str | None] = mapped_column(String(36), nullable=True)
+    # Maintained by Postgres for keyword search. Kept out of the mapper so inserts never
+    # RETURN it and message loads never fetch it; query it as Message.__table__.c.content_tsv.
+    content_tsv = mapped_column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{settings.fulltext_language}'::regconfig, content)", persisted=True),
+    )
 
     conversation = relationship("Conversation", back_populates="messages")
     user = relationship("User", back_populates="messages")
+
+
+# create_all (CREATE_TABLES_ON_STARTUP) creates only the partitioned parent.
+for _remainder in range(MESSAGE_PARTITIONS):
+    event.listen(
+        Message.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TABLE IF NOT EXISTS messages_p{_remainder:02d} PARTITION OF messages "
+            f"FOR VALUES WITH (MODULUS {MESSAGE_PARTITIONS}, REMAINDER {_remainder})"
+        ).execute_if(dialect="postgresql"),
+    )
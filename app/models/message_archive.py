@@ -0,0 +1,18 @@
+from sqlalchemy import Integer, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.sql import func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.session import Base
+
+
+class MessageArchive(Base):
+    """
+    An archived conversation's messages as one gzip'd NDJSON document
+    (app/services/archive_service.py). Kept in Postgres so every app host and
+    every backup sees the same archive as the rows it replaced.
+    """
+    __tablename__ = "message_archives"
+
+    conversation_id: Mapped[int] = mapped_column(Integer, ForeignKey("conversations.conversation_id", ondelete="CASCADE"), primary_key=True)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,30 @@
+from sqlalchemy import Integer, String, DateTime, ForeignKey, ForeignKeyConstraint
+from sqlalchemy.sql import func
+from sqlalchemy.orm import Mapped, mapped_column
+from pgvector.sqlalchemy import Vector
+from app.db.session import Base
+from app.config import settings
+
+
+class MessageEmbedding(Base):
+    __tablename__ = "message_embeddings"
+    __table_args__ = (
+        # Includes conversation_id because `messages` is keyed by (message_id, conversation_id).
+        ForeignKeyConstraint(
+            ["message_id", "conversation_id"],
+            ["messages.message_id", "messages.conversation_id"],
+            name="message_embeddings_message_id_fkey",
+            ondelete="CASCADE",
+        ),
+    )
+
+    message_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    chunk_index: Mapped[int] = mapped_column(Integer, primary_key=True, default=0, server_default="0")
+    # Character span of the chunk in messages.content; NULL means the whole message.
+    chunk_start: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    chunk_end: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    conversation_id: Mapped[int] = mapped_column(Integer, ForeignKey("conversations.conversation_id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False, index=True)
+    embedding = mapped_column(Vector(settings.embedding_dimensions), nullable=False)
+    embedding_model: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,64 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+_factories: Dict[str, Callable[[], Any]] = {}
+_closers: Dict[str, Callable[[Any], None]] = {}
+_instances: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def register(name: str, factory: Callable[[], Any], close: Optional[Callable[[Any], None]] = None) -> None:
+    """
+    Register a lazily constructed provider.
+
+    The factory is only called the first time `get(name)` is used, so modules can
+    register heavy clients at import time without paying for them.
+    """
+    with _lock:
+        _factories[name] = factory
+        if close is not None:
+            _closers[name] = close
+
+
+def get(name: str) -> Any:
+    """Return the provider instance, constructing it on first use."""
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        instance = _instances.get(name)
+        if instance is None:
+            factory = _factories.get(name)
+            if factory is None:
+                raise KeyError(f"No provider registered under '{name}'")
+            instance = factory()
+            _instances[name] = instance
+            logger.info(f"Initialized provider {name}")
+        return instance
+
+
+def is_initialized(name: str) -> bool:
+    return name in _instances
+
+
+def registered() -> List[str]:
+    return list(_factories.keys())
+
+
+def reset(name: Optional[str] = None) -> None:
+    """
+    Drop cached provider instances, closing them if a closer was registered.
+    """
+    with _lock:
+        names = [name] if name else list(_instances.keys())
+        for provider_name in names:
+            instance = _instances.pop(provider_name, None)
+            closer = _closers.get(provider_name)
+            if instance is not None and closer is not None:
+                try:
+                    closer(instance)
+                except Exception as e:
+                    logger.error(f"Error closing provider {provider_name}: {str(e)}")
@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 from authlib.integrations.starlette_client import OAuth
 from starlette.requests import Request
 from app.config import settings
-from app.db.session import get_db
+from app.db.session import get_db, get_read_db
 from app.models.user import User
 from app.services.auth_service import get_or_create_user, get_user_by_email
 from app.schemas.user import UserRead
@@ -22,7 +22,7 @@ oauth.register(
     client_kwargs={"scope": "openid email profile"},
 )
 
-async def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optional[User]:
+async def get_current_user(request: Request, db: Session = Depends(get_read_db)) -> Optional[User]:
     """Get current user from session cookie"""
     session_token = request.cookies.get(settings.cookie_name)
     if not session_token:
@@ -4,11 +4,13 @@ from app.main import sio
 from app.config import settings
 from app.services.auth_service import get_user_by_email
 from app.services import conversation_service
-from app.schemas.message import MessageCreate, MessageType
-from app.services.llm_service import stream_llm_response, store_message_embedding, get_context_with_summary, classify_tool_intent_with_llm, get_semantic_context
+from app.services.conversation_state import ConversationState, RecentMessage, state_cache
+from app.services.write_behind import write_queue
+from app.schemas.message import MessageType
+from app.services.llm_service import stream_llm_response, get_context_with_summary, classify_tool_intent_with_llm, get_semantic_context
 from app.utils.auth_utils import verify_session_token
 from sqlalchemy.orm import Session
-from app.utils.message_utils import get_last_n_messages
+from typing import List, Tuple
 
 def get_cookie_from_environ(environ, cookie_name):
     cookie_header = environ.get('HTTP_COOKIE')
@@ -18,6 +20,18 @@ def get_cookie_from_environ(environ, cookie_name):
     cookies.load(cookie_header)
     return cookies.get(cookie_name).value if cookie_name in cookies else None
 
+async def store_messages(db: Session, state: ConversationState, messages: List[Tuple[MessageType, str]]) -> None:
+    """
+    Persist messages in order, as one batch, and append them to the conversation
+    state. With write-behind they are journaled and inserted in the background;
+    otherwise they are inserted in one transaction right away.
+    """
+    if settings.write_behind_enabled:
+        state.append(await write_queue.submit(state.conversation_id, state.user_id, messages))
+        return
+    await conversation_service.add_turn_messages(db, state.conversation_id, state.user_id, messages)
+    state.append(RecentMessage(type=message_type, content=content) for message_type, content in messages)
+
 @sio.event(namespace='/conversations/stream')
 async def connect(sid, environ):
     print(f"[connect] sid={sid}")
@@ -50,8 +64,9 @@ async def join_conversation(sid, data):
         await sio.disconnect(sid, namespace='/conversations/stream')
         return
     with SessionLocal() as db:
-        conversation = conversation_service.get_conversation(db, conversation_id, user_id)
-        if not conversation:
+        # Warms the conversation state the turns of this socket read.
+        state = state_cache.get(db, conversation_id, user_id, write_queue.pending(conversation_id))
+        if not state:
             print(f"[join_conversation] Conversation not found: {conversation_id} for user_id: {user_id}")
             await sio.emit('error', {'error': 'Conversation not found'}, room=sid, namespace='/conversations/stream')
             await sio.disconnect(sid, namespace='/conversations/stream')
@@ -76,30 +91,27 @@ async def handle_message(sid, data):
         if not user_message:
             print(f"[handle_message] No user_message provided.")
             return
-        conversation = db.query(conversation_service.Conversation).filter(conversation_service.Conversation.conversation_id == conversation_id).first()
-        conversation_summary = conversation.summary_text if conversation and conversation.summary_text else ""
-        
-        last_msgs = get_last_n_messages(db, conversation_id, 3)
+        # Served from memory after join_conversation; loaded from Postgres after an eviction.
+        state = state_cache.get(db, conversation_id, user_id, write_queue.pending(conversation_id))
+        if not state:
+            print(f"[handle_message] Conversation {conversation_id} not found or deleted.")
+            await sio.emit('error', {'error': 'Conversation not found.'}, room=sid, namespace='/conversations/stream')
+            return
+        conversation_summary = state.summary_text or ""
+        last_msgs = state.last(3)
         last_messages = "\n".join([f"{msg.type}: {msg.content}" for msg in last_msgs])
-        semantic_context = await get_semantic_context(user_message, conversation_id, top_k=3)
+        await store_messages(db, state, [(MessageType.HUMAN, user_message)])
+        semantic_context = await get_semantic_context(user_message, conversation_id, top_k=3, user_id=user_id)
         semantic_results = "\n".join(semantic_context)
         slugs = await classify_tool_intent_with_llm(user_message, conversation_summary, last_messages, semantic_results)
         print(f"[handle_message] slug={slugs}")
-        message_in = MessageCreate(
-            conversation_id=conversation_id,
-            type=MessageType.HUMAN,
-            content=user_message
-        )
-        message_obj = await conversation_service.add_message(db, message_in, user_id)
-        if message_in.type in [MessageType.HUMAN, MessageType.AI]:
-            await store_message_embedding(message_obj, conversation_id)
         try:
-            context = await get_context_with_summary(db, conversation_id, user_message)
+            context = await get_context_with_summary(db, conversation_id, user_message, user_id=user_id, state=state)
             print(f"[handle_message] context={context}")
             llm_response = ""
             tool_messages = []
             try:
-                async for chunk in stream_llm_response(user_message, context, db, user_id, slugs):
+                async for chunk in stream_llm_response(user_message, context, db, user_id, slugs, enabled_toolkits=state.enabled_toolkits):
                     print(f"[handle_message] chunk={chunk}")
                     if chunk["type"] == "ai":
                         await sio.emit('assistant', {"role": "assistant", "content": chunk["content"]}, room=sid, namespace='/conversations/stream')
@@ -122,30 +134,11 @@ async def handle_message(sid, data):
                 await sio.emit('assistant', {"role": "assistant", "content": error_message}, room=sid, namespace='/conversations/stream')
                 return
             await sio.emit('last_chunk', {"last_chunk": True}, room=sid, namespace='/conversations/stream')
-            reply_in = MessageCreate(
-                conversation_id=conversation_id,
-                type=MessageType.AI,
-                content=llm_response
-            )
-            for tool_msg in tool_messages:
-                tool_message_in = MessageCreate(
-                    conversation_id=conversation_id,
-                    type=MessageType.TOOL,
-                    content=f"[{tool_msg['tool_name']}] {tool_msg['content']}"
-                )
-                await conversation_service.add_message(db, tool_message_in, user_id)
-            reply_message_obj = await conversation_service.add_message(db, reply_in, user_id)
-            if reply_in.type in [MessageType.HUMAN, MessageType.AI]:
-                await store_message_embedding(reply_message_obj, conversation_id)
+            turn = [(MessageType.TOOL, f"[{tool_msg['tool_name']}] {tool_msg['content']}") for tool_msg in tool_messages]
+            turn.append((MessageType.AI, llm_response))
+            await store_messages(db, state, turn)
         except Exception as e:
             error_message = f"Error processing request: {str(e)}"
             print(f"[handle_message] Exception: {error_message}")
             await sio.emit('assistant', {"role": "assistant", "content": error_message}, room=sid, namespace='/conversations/stream')
-            reply_in = MessageCreate(
-                conversation_id=conversation_id,
-                type=MessageType.AI,
-                content=error_message
-            )
-            reply_message_obj = await conversation_service.add_message(db, reply_in, user_id)
-            if reply_in.type in [MessageType.HUMAN, MessageType.AI]:
-                await store_message_embedding(reply_message_obj, conversation_id)
+            await store_messages(db, state, [(MessageType.AI, error_message)])
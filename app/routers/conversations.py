@@ -1,33 +1,137 @@
-from fastapi import APIRouter, Depends, status, WebSocket, WebSocketDisconnect, Cookie, HTTPException
-from typing import Optional
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, status, WebSocket, WebSocketDisconnect, Cookie, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from app.utils.auth_utils import verify_session_token
 from app.services.auth_service import get_user_by_email
 from sqlalchemy.orm import Session
-from app.db.session import get_db
-from app.dependencies import get_current_user
-from app.schemas.conversation import ConversationRead, ConversationCreate, ConversationList, ConversationUpdate
+from app.db.session import get_db, get_read_db, read_sessionmaker
+from app.dependencies import get_current_user, get_current_user_read
+from app.schemas.conversation import ConversationRead, ConversationCreate, ConversationIndex, ConversationList, ConversationUpdate
 from app.schemas.message import MessageList, MessageCreate
-from app.services import conversation_service
-from app.services.llm_service import stream_llm_response, store_message_embedding, get_context_with_summary, classify_tool_intent_with_llm
+from app.schemas.search import MessageSearchResults, MessageTextSearchResults
+from app.schemas.transfer import ImportResult
+from app.services import archive_service, conversation_service, search_service, fulltext_service, transfer_service
+from app.services.llm_service import stream_llm_response, get_context_with_summary, classify_tool_intent_with_llm, get_embedding
 from app.models.message import MessageType
-from app.utils.embedding_utils import delete_message_embedding, delete_conversation_embeddings
 from app.config import settings
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
 
 @router.get("/", response_model=ConversationList)
-def list_conversations(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def list_conversations(db: Session = Depends(get_read_db), current_user = Depends(get_current_user_read)):
     conversations = conversation_service.get_conversations(db, user_id=current_user.user_id)
     return {"conversations": conversations}
 
+@router.get("/index", response_model=ConversationIndex)
+def conversation_index(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    # On the primary: chat turns are written over the socket, which can't set the
+    # read-your-writes cookie, so a replica could miss the user's latest message.
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    """Sidebar listing: title, last activity, message count and preview; pass next_cursor back to page. Honors If-None-Match."""
+    try:
+        page = conversation_service.get_conversation_index(db, current_user.user_id, limit=limit, cursor=cursor)
+    except conversation_service.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body = page.model_dump_json()
+    etag = f'W/"{hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]}"'
+    # private: the page is per user; no-cache: revalidate every time, which costs a 304 while nothing changed.
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/export")
+def export_conversations(request: Request, conversation_id: Optional[int] = None, current_user = Depends(get_current_user_read)):
+    """All live conversations, or one, with their messages as streamed NDJSON (app/schemas/transfer.py)."""
+    session_factory = read_sessionmaker(request)
+    try:
+        transfer_service.check_archives(session_factory, current_user.user_id, conversation_id=conversation_id)
+    except archive_service.ArchiveMissing as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    body = transfer_service.export_ndjson(session_factory, current_user.user_id, conversation_id=conversation_id)
+    filename = f"conversation-{conversation_id}.ndjson" if conversation_id is not None else "conversations.ndjson"
+    return StreamingResponse(body, media_type="application/x-ndjson", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@router.post("/import", response_model=ImportResult)
+async def import_conversations(request: Request, current_user = Depends(get_current_user)):
+    """Create conversations from an NDJSON export; messages are stored in batches and embedded in the background."""
+    try:
+        return await transfer_service.import_ndjson(request.stream(), current_user.user_id)
+    except transfer_service.InvalidImport as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/", response_model=ConversationRead)
 def create_conversation(conversation_in: ConversationCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     conversation = conversation_service.create_conversation(db, user_id=current_user.user_id, conversation_in=conversation_in)
     return conversation
 
+@router.get("/search", response_model=MessageSearchResults)
+async def search_messages(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    offset: int = Query(0, ge=0),
+    conversation_id: Optional[int] = None,
+    since_days: Optional[float] = Query(None, gt=0),
+    type: Optional[List[MessageType]] = Query(None),
+    current_user = Depends(get_current_user),
+):
+    """Semantic search over all of the current user's conversations, or one of them with conversation_id."""
+    since = datetime.now(timezone.utc) - timedelta(days=since_days) if since_days else None
+    embedding = await get_embedding(q)
+    return await asyncio.to_thread(
+        search_service.search_by_embedding,
+        embedding,
+        current_user.user_id,
+        limit=limit,
+        offset=offset,
+        conversation_id=conversation_id,
+        since=since,
+        types=type,
+    )
+
+@router.get("/search/text", response_model=MessageTextSearchResults)
+def search_messages_text(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
+    conversation_id: Optional[int] = None,
+    since_days: Optional[float] = Query(None, gt=0),
+    type: Optional[List[MessageType]] = Query(None),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    """Keyword search over the current user's messages with highlighted matches; pass next_cursor back to page."""
+    since = datetime.now(timezone.utc) - timedelta(days=since_days) if since_days else None
+    try:
+        return fulltext_service.search_messages(
+            db,
+            q,
+            user_id=current_user.user_id,
+            limit=limit,
+            cursor=cursor,
+            conversation_id=conversation_id,
+            since=since,
+            types=type,
+        )
+    except fulltext_service.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# On the primary, like the index: a replica could miss a turn just written over the socket.
 @router.get("/{conversation_id}/messages", response_model=MessageList)
 def get_conversation_messages(conversation_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    messages = conversation_service.get_messages(db, conversation_id=conversation_id, user_id=current_user.user_id)
+    try:
+        messages = conversation_service.get_messages(db, conversation_id=conversation_id, user_id=current_user.user_id)
+    except archive_service.ArchiveMissing as e:
+        raise HTTPException(status_code=500, detail=str(e))
     return {"messages": messages}
 
 @router.patch("/{conversation_id}", response_model=ConversationRead)
@@ -47,7 +151,6 @@ def delete_conversation(conversation_id: int, db: Session = Depends(get_db), cur
             return {"error": "Conversation not found"}, 404
         
         conversation_service.delete_conversation(db, conversation_id, current_user.user_id)
-        delete_conversation_embeddings(conversation_id)
         
         return {"message": "Conversation deleted successfully"}
     except Exception as e:
@@ -61,7 +164,6 @@ def delete_message(conversation_id: int, message_id: int, db: Session = Depends(
             return {"error": "Message not found"}, 404
         
         conversation_service.delete_message(db, message_id, conversation_id, current_user.user_id)
-        delete_message_embedding(message_id)
         
         return {"message": "Message deleted successfully"}
     except Exception as e:
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import Optional
-from app.db.session import get_db
-from app.dependencies import get_current_user
+from app.db.session import get_db, get_read_db
+from app.dependencies import get_current_user, get_current_user_read
 from app.models.user import User
 from app.models.user_toolkit_connection import UserToolkitConnection
 from app.schemas.tool import (
@@ -84,8 +84,8 @@ async def disable_toolkit(
 
 @router.get("/connections", response_model=ToolkitConnectionList)
 async def get_user_connections(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_read),
+    db: Session = Depends(get_read_db)
 ):
     """Get all toolkit connections for the current user."""
     connections = composio_service.get_user_connections(db, current_user.user_id)
@@ -99,8 +99,8 @@ async def get_user_connections(
 @router.get("/connections/{toolkit_slug}", response_model=ToolkitConnection)
 async def get_connection_status(
     toolkit_slug: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_read),
+    db: Session = Depends(get_read_db)
 ):
     """Get connection status for a specific toolkit."""
     connection = composio_service.get_connection_status(db, current_user.user_id, toolkit_slug)
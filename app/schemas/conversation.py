@@ -19,5 +19,19 @@ class ConversationRead(BaseModel):
 class ConversationList(BaseModel):
     conversations: List[ConversationRead]
 
+
+class ConversationIndexItem(BaseModel):
+    conversation_id: int
+    title: Optional[str] = None
+    last_activity_at: Optional[datetime] = None
+    message_count: int = 0
+    preview: Optional[str] = None
+
+
+class ConversationIndex(BaseModel):
+    conversations: List[ConversationIndexItem]
+    limit: int
+    next_cursor: Optional[str] = None
+
 class ConversationUpdate(BaseModel):
     title: Optional[str] = None
@@ -0,0 +1,36 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+from app.models.message import MessageType
+
+class MessageSearchHit(BaseModel):
+    message_id: int
+    conversation_id: int
+    conversation_title: Optional[str] = None
+    type: Optional[MessageType] = None
+    snippet: str
+    score: float
+    created_at: Optional[datetime] = None
+
+
+class MessageSearchResults(BaseModel):
+    results: List[MessageSearchHit]
+    offset: int
+    limit: int
+    next_offset: Optional[int] = None
+
+
+class MessageTextSearchHit(BaseModel):
+    message_id: int
+    conversation_id: int
+    conversation_title: Optional[str] = None
+    type: Optional[MessageType] = None
+    headline: str
+    rank: float
+    created_at: Optional[datetime] = None
+
+
+class MessageTextSearchResults(BaseModel):
+    results: List[MessageTextSearchHit]
+    limit: int
+    next_cursor: Optional[str] = None
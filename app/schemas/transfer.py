@@ -0,0 +1,37 @@
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
+from datetime import datetime
+from app.config import settings
+from app.models.message import MessageType
+
+# One JSON object per line: an optional header, then each conversation followed by its messages.
+# conversation_id ties messages to their conversation within the file; imports assign new ids.
+# Limits mirror the columns (title) or the longest line an import accepts (texts), so oversized
+# values fail validation with a 400 instead of reaching the database.
+
+class ExportHeader(BaseModel):
+    record: Literal["export"] = "export"
+    version: int
+    exported_at: Optional[datetime] = None
+
+
+class ExportConversation(BaseModel):
+    record: Literal["conversation"] = "conversation"
+    conversation_id: int
+    title: Optional[str] = Field(default=None, max_length=255)
+    summary_text: Optional[str] = Field(default=None, max_length=settings.import_max_line_bytes)
+    created_at: Optional[datetime] = None
+
+
+class ExportMessage(BaseModel):
+    record: Literal["message"] = "message"
+    conversation_id: int
+    type: MessageType
+    content: str = Field(max_length=settings.import_max_line_bytes)
+    created_at: Optional[datetime] = None
+
+
+class ImportResult(BaseModel):
+    conversations: int
+    messages: int
+    seconds: float
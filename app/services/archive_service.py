@@ -0,0 +1,223 @@
+"""
+Cold storage for idle conversations.
+
+A conversation whose last message is older than `message_archive_after_days`
+has its messages written to one gzip'd NDJSON document in `message_archives`
+and deleted from `messages`, in a transaction that also enqueues a
+conversation-wide vector delete and sets `conversation_context.archived_at`.
+Rows and archive commit together, so the archive is exactly as durable, and
+as visible to every host, as the rows it replaces.
+The context row stays, so a socket join still reads the summary and the
+latest messages without touching the archive.
+
+Archived conversations are rehydrated transparently: storing a new message
+restores them inside the insert's transaction (app/services/conversation_service.py),
+and reading their history restores them first. Rehydrated rows keep their
+message ids, their embeddings are queued again, and the archive row is deleted
+in the same transaction. An archived conversation without an archive row
+raises ArchiveMissing, which is not worth retrying.
+
+Every step runs under the `conversation_context` row lock that message writers
+take, so a conversation is never archived while a turn is being stored.
+"""
+import asyncio
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.conversation_context import ConversationContext
+from app.models.embedding_outbox import EmbeddingOutbox, OutboxOp
+from app.models.message import Message, MessageType
+from app.models.message_archive import MessageArchive
+from app.services import context_service, outbox_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = ("message_id", "conversation_id", "user_id", "type", "content", "created_at", "write_id")
+
+
+class ArchiveMissing(RuntimeError):
+    """A conversation is marked archived but its archive is gone; retrying cannot help."""
+
+
+def _record(row: Any) -> Dict[str, Any]:
+    return {
+        "message_id": row.message_id,
+        "conversation_id": row.conversation_id,
+        "user_id": row.user_id,
+        "type": row.type.name,
+        "content": row.content,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "write_id": row.write_id,
+    }
+
+
+def _row(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **record,
+        "type": MessageType[record["type"]],
+        "created_at": datetime.fromisoformat(record["created_at"]) if record["created_at"] else None,
+    }
+
+
+def _write_archive(db: Session, conversation_id: int) -> int:
+    """Add the conversation's archive row, in the caller's transaction; returns how many messages it holds."""
+    count = 0
+    rows = db.execute(
+        select(*(getattr(Message, column) for column in _COLUMNS))
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.message_id)
+        .execution_options(yield_per=settings.message_archive_batch_size)
+    )
+    raw = io.BytesIO()
+    with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+        for row in rows:
+            archive.write(json.dumps(_record(row), ensure_ascii=False).encode("utf-8") + b"\n")
+            count += 1
+    db.merge(MessageArchive(conversation_id=conversation_id, message_count=count, data=raw.getvalue()))
+    return count
+
+
+def read_archive(db: Session, conversation_id: int) -> Iterator[List[Dict[str, Any]]]:
+    """An archived conversation's message rows, in message_id order, in batches."""
+    data = db.execute(select(MessageArchive.data).where(MessageArchive.conversation_id == conversation_id)).scalar()
+    if data is None:
+        raise ArchiveMissing(f"Conversation {conversation_id} is archived but its archive is missing")
+    batch: List[Dict[str, Any]] = []
+    with gzip.open(io.BytesIO(data), "rt", encoding="utf-8") as archive:
+        for line in archive:
+            batch.append(_row(json.loads(line)))
+            if len(batch) >= settings.message_archive_batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def idle_conversations(idle_before: datetime, limit: Optional[int] = None, conversation_id: Optional[int] = None) -> List[int]:
+    """Live conversations with messages whose last write is older than `idle_before`, least recent first."""
+    query = (
+        select(ConversationContext.conversation_id)
+        .join(Conversation, Conversation.conversation_id == ConversationContext.conversation_id)
+        .where(
+            ConversationContext.archived_at.is_(None),
+            ConversationContext.updated_at < idle_before,
+            Conversation.deleted_at.is_(None),
+        )
+    )
+    if conversation_id is not None:
+        query = query.where(ConversationContext.conversation_id == conversation_id)
+    with SessionLocal() as db:
+        return list(db.execute(query.order_by(ConversationContext.updated_at).limit(limit)).scalars())
+
+
+def archive_conversation(conversation_id: int, idle_before: datetime) -> int:
+    """
+    Move one conversation's messages to cold storage if it is still idle; returns
+    the number archived. The archive row and the delete commit together.
+    """
+    with SessionLocal() as db:
+        context = context_service.lock_context(db, conversation_id)
+        conversation = db.execute(
+            select(Conversation.user_id, Conversation.deleted_at).where(Conversation.conversation_id == conversation_id)
+        ).first()
+        idle = context.archived_at is None and context.updated_at is not None and context.updated_at < idle_before
+        if not idle or conversation is None or conversation.deleted_at is not None:
+            db.rollback()
+            return 0
+        count = _write_archive(db, conversation_id)
+        db.execute(delete(Message).where(Message.conversation_id == conversation_id))
+        outbox_service.enqueue_delete_conversation(db, conversation_id, conversation.user_id)
+        context.archived_at = datetime.now(timezone.utc)
+        db.commit()
+        return count
+
+
+def rehydrate(db: Session, context: ConversationContext) -> int:
+    """
+    Restore an archived conversation's messages and delete its archive row in
+    the caller's transaction, with `context` locked by `lock_context`; caller
+    commits. Raises ArchiveMissing if there is nothing to restore from.
+    """
+    conversation_id = context.conversation_id
+    # A vector delete from archiving that has not run yet would remove what is re-embedded below.
+    # One a drainer is running holds its row locked, so this waits for it (outbox_service._delete_conversation).
+    db.execute(delete(EmbeddingOutbox).where(
+        EmbeddingOutbox.op == OutboxOp.DELETE_CONVERSATION.value,
+        EmbeddingOutbox.conversation_id == conversation_id,
+    ))
+    # Vectors dropped by app/jobs/compact_messages.py stay dropped.
+    pruned_up_to = db.execute(
+        select(Conversation.embeddings_pruned_up_to).where(Conversation.conversation_id == conversation_id)
+    ).scalar() or 0
+    count = 0
+    for batch in read_archive(db, conversation_id):
+        messages = list(db.scalars(insert(Message).on_conflict_do_nothing().returning(Message), batch))
+        for message in messages:
+            if message.message_id > pruned_up_to:
+                outbox_service.enqueue_upsert(db, message)
+        count += len(batch)
+    db.execute(delete(MessageArchive).where(MessageArchive.conversation_id == conversation_id))
+    context.archived_at = None
+    # Recounted, in case the conversation was archived before message_count existed.
+    context.message_count = db.execute(select(func.count()).where(Message.conversation_id == conversation_id)).scalar()
+    return count
+
+
+def ensure_rehydrated(conversation_id: int) -> int:
+    """Restore an archived conversation in its own transaction on the primary; returns the number of messages restored."""
+    with SessionLocal() as db:
+        context = context_service.lock_context(db, conversation_id)
+        if context.archived_at is None:
+            db.rollback()
+            return 0
+        count = rehydrate(db, context)
+        db.commit()
+        return count
+
+
+def is_archived(db: Session, conversation_id: int) -> bool:
+    return db.execute(
+        select(ConversationContext.archived_at).where(ConversationContext.conversation_id == conversation_id)
+    ).scalar() is not None
+
+
+def archive_idle(limit: Optional[int] = 100, conversation_id: Optional[int] = None) -> Dict[str, int]:
+    """One pass over conversations idle for longer than `message_archive_after_days`."""
+    totals = {"conversations": 0, "messages": 0}
+    if settings.message_archive_after_days <= 0:
+        return totals
+    idle_before = datetime.now(timezone.utc) - timedelta(days=settings.message_archive_after_days)
+    for candidate in idle_conversations(idle_before, limit=limit, conversation_id=conversation_id):
+        try:
+            count = archive_conversation(candidate, idle_before)
+        except Exception as e:
+            logger.error(f"Failed to archive conversation {candidate}: {str(e)}")
+            continue
+        if count:
+            totals["conversations"] += 1
+            totals["messages"] += count
+    return totals
+
+
+async def run_archiver(stop: Optional[asyncio.Event] = None) -> None:
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            totals = await asyncio.to_thread(archive_idle)
+            if totals["conversations"]:
+                print(f"[archive] archived {totals['messages']} messages of {totals['conversations']} conversations")
+        except Exception as e:
+            logger.error(f"Message archiving failed: {str(e)}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.message_archive_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
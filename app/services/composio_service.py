@@ -1,21 +1,29 @@
 from typing import List, Any, Optional
 from sqlalchemy.orm import Session
-from composio import Composio
-from composio_langchain import LangchainProvider
 from app.config import settings
+from app import providers
 from app.models.user_toolkit_connection import UserToolkitConnection, ConnectionStatus
+from app.services.conversation_state import state_cache
 from datetime import datetime, timezone
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _create_composio_client():
+    from composio import Composio
+    from composio_langchain import LangchainProvider
+    return Composio(
+        api_key=settings.composio_api_key,
+        provider=LangchainProvider()
+    )
+
+
+providers.register("composio", _create_composio_client)
+
+
 class ComposioService:
     def __init__(self):
-        self.composio = Composio(
-            api_key=settings.composio_api_key,
-            provider=LangchainProvider()
-        )
         self._supported_toolkits = ["GOOGLECALENDAR", "NOTION", "SLACKBOT", "GMAIL", "GOOGLETASKS", "TWITTER"]
         self.auth_configs = {
             "GOOGLECALENDAR": settings.google_calendar_auth_config_id,
@@ -25,6 +33,11 @@ class ComposioService:
             "GOOGLETASKS": settings.google_tasks_auth_config_id,
             "TWITTER": settings.twitter_auth_config_id,
         }
+
+    @property
+    def composio(self):
+        """Composio client, constructed on first use."""
+        return providers.get("composio")
         
     def get_supported_toolkits(self) -> List[str]:
         """Get list of supported toolkit slugs."""
@@ -109,6 +122,8 @@ class ComposioService:
                 db.add(connection)
             
             db.commit()
+            # Cached conversation states hold the user's enabled toolkits.
+            state_cache.invalidate_user(user_id)
             return True
             
         except Exception as e:
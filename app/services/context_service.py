@@ -0,0 +1,113 @@
+"""
+Maintenance of the `conversation_context` row, so a turn's history is one
+primary-key lookup instead of ordered scans over `messages`.
+
+Writers lock the row with `lock_context` before inserting messages, which
+also orders concurrent inserts into one conversation, and update it before
+they commit. Every change to the summary or the window bumps `version`. A missing row is built from `messages` on first use; the
+migration backfills existing conversations.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.constants import N_CONTEXT_MESSAGES
+from app.models.conversation import Conversation
+from app.models.conversation_context import ConversationContext
+from app.models.message import Message, MessageType
+from app.utils.message_utils import get_last_n_messages
+
+CONTEXT_TYPES = (MessageType.HUMAN, MessageType.AI)
+# Length of conversation_context.last_message_preview.
+PREVIEW_CHARS = 200
+
+
+def message_item(message: Any) -> Dict[str, Any]:
+    return {
+        "message_id": message.message_id,
+        "write_id": getattr(message, "write_id", None),
+        "type": message.type.name,
+        "content": message.content,
+    }
+
+
+def _bump(context: ConversationContext) -> None:
+    context.version = (context.version or 0) + 1
+
+
+def _set_window(context: ConversationContext, items: List[Dict[str, Any]]) -> None:
+    items = items[-N_CONTEXT_MESSAGES:]
+    # New lists, so the ORM sees the JSONB columns change.
+    context.recent_messages = items
+    context.recent_message_ids = [item["message_id"] for item in items]
+    context.last_message_preview = items[-1]["content"][:PREVIEW_CHARS] if items else None
+
+
+def create_context(db: Session, conversation: Conversation) -> None:
+    """Add the empty context row of a flushed new conversation; caller commits."""
+    db.add(ConversationContext(conversation_id=conversation.conversation_id, user_id=conversation.user_id))
+
+
+def lock_context(db: Session, conversation_id: int) -> ConversationContext:
+    """The conversation's context row, locked until the transaction ends; created from `messages` if missing."""
+    context = db.execute(
+        select(ConversationContext).where(ConversationContext.conversation_id == conversation_id).with_for_update()
+    ).scalar_one_or_none()
+    if context is not None:
+        return context
+    conversation = db.execute(
+        select(Conversation.summary_text, Conversation.user_id, Conversation.created_at).where(Conversation.conversation_id == conversation_id)
+    ).one()
+    count, last_at = db.execute(
+        select(func.count(), func.max(Message.created_at)).where(Message.conversation_id == conversation_id)
+    ).one()
+    items = [message_item(message) for message in get_last_n_messages(db, conversation_id, N_CONTEXT_MESSAGES)]
+    # A concurrent writer may have created it meanwhile; then its row, with its messages, wins.
+    db.execute(
+        insert(ConversationContext)
+        .values(
+            conversation_id=conversation_id,
+            user_id=conversation.user_id,
+            summary_text=conversation.summary_text,
+            recent_messages=items,
+            recent_message_ids=[item["message_id"] for item in items],
+            message_count=count,
+            last_activity_at=last_at or conversation.created_at,
+            last_message_preview=items[-1]["content"][:PREVIEW_CHARS] if items else None,
+        )
+        .on_conflict_do_nothing(index_elements=[ConversationContext.conversation_id])
+    )
+    return db.execute(
+        select(ConversationContext).where(ConversationContext.conversation_id == conversation_id).with_for_update()
+    ).scalar_one()
+
+
+def append_messages(context: ConversationContext, messages: Sequence[Any]) -> None:
+    """Add flushed messages, oldest first, to a context locked with `lock_context`; caller commits."""
+    if messages:
+        context.message_count = (context.message_count or 0) + len(messages)
+        context.last_activity_at = func.now()
+        _bump(context)
+    items = [message_item(message) for message in messages if message.type in CONTEXT_TYPES]
+    if items:
+        _set_window(context, list(context.recent_messages or []) + items)
+
+
+def remove_message(db: Session, conversation_id: int, message_id: int) -> None:
+    """Refill the window after a flushed message delete, if the message was in it; caller commits."""
+    context = lock_context(db, conversation_id)
+    context.message_count = max((context.message_count or 0) - 1, 0)
+    _bump(context)
+    if message_id in (context.recent_message_ids or []):
+        _set_window(context, [message_item(message) for message in get_last_n_messages(db, conversation_id, N_CONTEXT_MESSAGES)])
+
+
+def set_summary(db: Session, conversation_id: int, summary_text: Optional[str]) -> Optional[int]:
+    """Mirror a summary written to `conversations`, in the same transaction; caller commits. Returns the new version."""
+    return db.execute(
+        update(ConversationContext)
+        .where(ConversationContext.conversation_id == conversation_id)
+        .values(summary_text=summary_text, version=ConversationContext.version + 1)
+        .returning(ConversationContext.version)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
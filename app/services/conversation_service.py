@@ -1,33 +1,100 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from sqlalchemy import insert, select, tuple_
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.db.session import SessionLocal
 from app.models.conversation import Conversation
-from app.models.message import Message
-from app.schemas.conversation import ConversationCreate, ConversationRead
+from app.models.conversation_context import ConversationContext
+from app.models.message import Message, MessageType
+from app.schemas.conversation import ConversationCreate, ConversationIndex, ConversationIndexItem, ConversationRead
 from app.schemas.message import MessageCreate, MessageRead
-from typing import List, Optional
-from app.services.llm_service import generate_summary_with_llm
-from app.utils.message_utils import get_last_n_messages
-from app.constants import M_SUMMARY_INTERVAL
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from app.services import archive_service, context_service, outbox_service, summary_service
+from app.services.conversation_state import state_cache
 
 def get_conversations(db: Session, user_id: int) -> List[ConversationRead]:
-    conversations = db.query(Conversation).filter(Conversation.user_id == user_id).order_by(Conversation.created_at.desc()).all()
+    conversations = db.query(Conversation).filter(Conversation.user_id == user_id, Conversation.deleted_at.is_(None)).order_by(Conversation.created_at.desc()).all()
     return [ConversationRead.model_validate(c) for c in conversations]
 
+class InvalidCursor(ValueError):
+    pass
+
+def _encode_index_cursor(last_activity_at: datetime, conversation_id: int) -> str:
+    raw = json.dumps([last_activity_at.isoformat(), conversation_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_index_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        last_activity_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(last_activity_at), int(conversation_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+def get_conversation_index(db: Session, user_id: int, limit: int = 50, cursor: Optional[str] = None) -> ConversationIndex:
+    """
+    A page of the user's conversations for the sidebar, most recently active
+    first, read from the denormalized conversation_context columns with one
+    range scan of ix_conversation_context_user_id_last_activity_at.
+    """
+    query = select(
+        ConversationContext.conversation_id,
+        Conversation.title,
+        ConversationContext.last_activity_at,
+        ConversationContext.message_count,
+        ConversationContext.last_message_preview,
+    ).join(Conversation, Conversation.conversation_id == ConversationContext.conversation_id).where(
+        ConversationContext.user_id == user_id,
+        Conversation.deleted_at.is_(None),
+    )
+    if cursor:
+        query = query.where(
+            tuple_(ConversationContext.last_activity_at, ConversationContext.conversation_id) < tuple_(*_decode_index_cursor(cursor))
+        )
+    rows = db.execute(
+        query.order_by(ConversationContext.last_activity_at.desc(), ConversationContext.conversation_id.desc()).limit(limit + 1)
+    ).all()
+    items = [
+        ConversationIndexItem(
+            conversation_id=row.conversation_id,
+            title=row.title,
+            last_activity_at=row.last_activity_at,
+            message_count=row.message_count,
+            preview=row.last_message_preview,
+        )
+        for row in rows[:limit]
+    ]
+    next_cursor = _encode_index_cursor(rows[limit - 1].last_activity_at, rows[limit - 1].conversation_id) if len(rows) > limit else None
+    return ConversationIndex(conversations=items, limit=limit, next_cursor=next_cursor)
+
 def create_conversation(db: Session, user_id: int, conversation_in: ConversationCreate) -> ConversationRead:
     conversation = Conversation(user_id=user_id, title=conversation_in.title)
     db.add(conversation)
+    db.flush()
+    context_service.create_context(db, conversation)
     db.commit()
     db.refresh(conversation)
     return ConversationRead.model_validate(conversation)
 
 def get_conversation(db: Session, conversation_id: int, user_id: int) -> Optional[ConversationRead]:
-    conversation = db.query(Conversation).filter(Conversation.conversation_id == conversation_id, Conversation.user_id == user_id).first()
+    conversation = db.query(Conversation).filter(Conversation.conversation_id == conversation_id, Conversation.user_id == user_id, Conversation.deleted_at.is_(None)).first()
     return ConversationRead.model_validate(conversation) if conversation else None
 
 def get_messages(db: Session, conversation_id: int, user_id: int) -> List[MessageRead]:
-    conversation = db.query(Conversation).filter(Conversation.conversation_id == conversation_id, Conversation.user_id == user_id).first()
+    conversation = db.query(Conversation).filter(Conversation.conversation_id == conversation_id, Conversation.user_id == user_id, Conversation.deleted_at.is_(None)).first()
     if not conversation:
         return []
-    messages = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at.asc()).all()
+    if archive_service.is_archived(db, conversation_id):
+        # Restored on the primary, which `db` may not be; read the restored rows from there.
+        archive_service.ensure_rehydrated(conversation_id)
+        with SessionLocal() as primary:
+            return _read_messages(primary, conversation_id)
+    return _read_messages(db, conversation_id)
+
+def _read_messages(db: Session, conversation_id: int) -> List[MessageRead]:
+    messages = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at.asc(), Message.message_id.asc()).all()
     return [MessageRead.model_validate(m) for m in messages]
 
 async def add_message(db: Session, message_in: MessageCreate, user_id: int) -> Message:
@@ -37,29 +104,72 @@ async def add_message(db: Session, message_in: MessageCreate, user_id: int) -> M
         type=message_in.type,
         content=message_in.content
     )
+    context = context_service.lock_context(db, message_in.conversation_id)
+    if context.archived_at is not None:
+        archive_service.rehydrate(db, context)
     db.add(message)
+    db.flush()
+    context_service.append_messages(context, [message])
+    outbox_service.enqueue_upsert(db, message)
     db.commit()
     db.refresh(message)
-
-    message_count = db.query(Message).filter(Message.conversation_id == message.conversation_id).count()
-    if message_count % M_SUMMARY_INTERVAL == 0:
-        last_msgs = get_last_n_messages(db, message.conversation_id, M_SUMMARY_INTERVAL)
-        conversation = db.query(Conversation).filter(Conversation.conversation_id == message.conversation_id).first()
-        if conversation:
-            prev_summary = conversation.summary_text if conversation.summary_text else None
-            filtered_msgs = [m for m in last_msgs if m.type in ("Human", "AI")]
-            summary_text = await generate_summary_with_llm(filtered_msgs, previous_summary=prev_summary)
-            conversation.summary_text = summary_text
-            db.flush()
-            db.commit()
+    after_messages_stored(message.conversation_id)
 
     return message
 
+def insert_messages(db: Session, rows: Sequence[Dict[str, Any]], versions: Optional[Dict[int, int]] = None) -> List[Message]:
+    """
+    Insert message rows with one multi-row INSERT ... RETURNING, in the given
+    order, queue their embeddings and add them to their conversation contexts;
+    caller commits. `versions`, if given, receives each context's new version.
+    """
+    if not rows:
+        return []
+    # Locked before the insert, so concurrent turns append in message_id order.
+    contexts = {cid: context_service.lock_context(db, cid) for cid in sorted({row["conversation_id"] for row in rows})}
+    for context in contexts.values():
+        if context.archived_at is not None:
+            archive_service.rehydrate(db, context)
+    messages = list(db.scalars(insert(Message).returning(Message, sort_by_parameter_order=True), list(rows)))
+    for message in messages:
+        outbox_service.enqueue_upsert(db, message)
+    for cid, context in contexts.items():
+        context_service.append_messages(context, [message for message in messages if message.conversation_id == cid])
+        if versions is not None:
+            versions[cid] = context.version
+    return messages
+
+async def add_turn_messages(db: Session, conversation_id: int, user_id: int, messages: Sequence[Tuple[MessageType, str]]) -> List[Message]:
+    """
+    Store the messages of one turn (tool results, then the reply) in a single
+    transaction. The caller appends them to the cached conversation state.
+    """
+    versions: Dict[int, int] = {}
+    stored = insert_messages(db, [
+        {"conversation_id": conversation_id, "user_id": user_id, "type": message_type, "content": content}
+        for message_type, content in messages
+    ], versions=versions)
+    db.commit()
+    state_cache.advance(conversation_id, versions.get(conversation_id))
+    after_messages_stored(conversation_id)
+    return stored
+
+def after_messages_stored(conversation_id: int) -> None:
+    """Post-commit hook: wake the embedding worker and refresh the summary in the background."""
+    outbox_service.notify()
+    summary_service.schedule_update(conversation_id)
+
 def get_message(db: Session, message_id: int, conversation_id: int, user_id: int) -> Optional[MessageRead]:
+    conversation = db.query(Conversation).filter(Conversation.conversation_id == conversation_id, Conversation.user_id == user_id, Conversation.deleted_at.is_(None)).first()
+    if not conversation:
+        return None
+    if archive_service.is_archived(db, conversation_id):
+        archive_service.ensure_rehydrated(conversation_id)
     message = db.query(Message).join(Conversation).filter(
         Message.message_id == message_id,
         Message.conversation_id == conversation_id,
-        Conversation.user_id == user_id
+        Conversation.user_id == user_id,
+        Conversation.deleted_at.is_(None)
     ).first()
     return MessageRead.model_validate(message) if message else None
 
@@ -67,28 +177,38 @@ def delete_message(db: Session, message_id: int, conversation_id: int, user_id:
     message = db.query(Message).join(Conversation).filter(
         Message.message_id == message_id,
         Message.conversation_id == conversation_id,
-        Conversation.user_id == user_id
+        Conversation.user_id == user_id,
+        Conversation.deleted_at.is_(None)
     ).first()
     if message:
         db.delete(message)
+        db.flush()
+        context_service.remove_message(db, conversation_id, message_id)
+        outbox_service.enqueue_delete_message(db, message_id, conversation_id, user_id)
         db.commit()
+        state_cache.invalidate(conversation_id)
         return True
     return False
 
 def delete_conversation(db: Session, conversation_id: int, user_id: int) -> bool:
+    """
+    Soft-delete: hide the conversation immediately and leave removing its
+    messages and vectors to the purger (app/services/purge_service.py).
+    """
     conversation = db.query(Conversation).filter(
         Conversation.conversation_id == conversation_id,
-        Conversation.user_id == user_id
+        Conversation.user_id == user_id,
+        Conversation.deleted_at.is_(None)
     ).first()
     if conversation:
-        db.query(Message).filter(Message.conversation_id == conversation_id).delete()
-        db.delete(conversation)
+        conversation.deleted_at = func.now()
         db.commit()
+        state_cache.invalidate(conversation_id)
         return True
     return False
 
 def update_conversation_title(db: Session, conversation_id: int, user_id: int, title: str) -> Optional[ConversationRead]:
-    conversation = db.query(Conversation).filter(Conversation.conversation_id == conversation_id, Conversation.user_id == user_id).first()
+    conversation = db.query(Conversation).filter(Conversation.conversation_id == conversation_id, Conversation.user_id == user_id, Conversation.deleted_at.is_(None)).first()
     if not conversation:
         return None
     conversation.title = title
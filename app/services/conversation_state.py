@@ -0,0 +1,186 @@
+"""
+In-process cache of what a chat turn reads: the conversation's summary, its
+latest Human/AI messages and the user's enabled toolkits.
+
+A state is loaded when a socket joins the conversation and kept current
+write-through afterwards: the socket handler appends every message it stores
+(including write-behind writes that are not committed yet), the summary
+service replaces the summary it commits, and deleting messages or the
+conversation, or changing a toolkit connection, drops the affected entries.
+States are evicted least recently used beyond `conversation_state_max_entries`
+and after `conversation_state_idle_seconds` without a turn; the next turn
+reloads them from the conversation's `conversation_context` row.
+
+Other processes change conversations too: REST requests served by another
+worker, or jobs such as rebuild_summaries. Every hit therefore reads the
+`version` of the conversation_context row, one primary-key lookup, and
+reloads the state if the row moved past what the state reflects. Writes made
+through the cache (`advance`, `set_summary`) move the cached version along, so
+a process's own turns don't cause reloads.
+"""
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Iterable, List, Optional, Sequence
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.constants import N_CONTEXT_MESSAGES
+from app.models.conversation import Conversation
+from app.models.conversation_context import ConversationContext
+from app.models.message import MessageType
+from app.services.context_service import CONTEXT_TYPES
+from app.utils.message_utils import get_last_n_messages, with_pending
+
+
+@dataclass
+class RecentMessage:
+    type: MessageType
+    content: str
+    message_id: Optional[int] = None
+    write_id: Optional[str] = None
+
+
+@dataclass
+class ConversationState:
+    conversation_id: int
+    user_id: int
+    summary_text: Optional[str]
+    enabled_toolkits: List[str]
+    recent: Deque[Any] = field(default_factory=lambda: deque(maxlen=N_CONTEXT_MESSAGES))
+    # conversation_context.version the state reflects; 0 while the row is absent.
+    version: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+    def last(self, n: int) -> List[Any]:
+        """The latest `n` Human/AI messages, oldest first."""
+        return list(self.recent)[-n:] if n > 0 else []
+
+    def append(self, messages: Iterable[Any]) -> None:
+        for message in messages:
+            if message.type in CONTEXT_TYPES:
+                self.recent.append(message)
+
+
+def load_state(db: Session, conversation_id: int, user_id: int, pending: Sequence[Any] = ()) -> Optional[ConversationState]:
+    """
+    Read a conversation's state from Postgres, or None if it is missing,
+    deleted or not the user's. `pending` are the conversation's uncommitted
+    write-behind writes, read before calling.
+    """
+    from app.services.composio_service import composio_service
+    # One primary-key lookup; the conversation_context row is absent until the first message.
+    row = db.query(
+        Conversation.summary_text,
+        ConversationContext.summary_text.label("context_summary"),
+        ConversationContext.recent_messages,
+        ConversationContext.version,
+    ).outerjoin(
+        ConversationContext, ConversationContext.conversation_id == Conversation.conversation_id
+    ).filter(
+        Conversation.conversation_id == conversation_id,
+        Conversation.user_id == user_id,
+        Conversation.deleted_at.is_(None),
+    ).first()
+    if row is None:
+        return None
+    state = ConversationState(
+        conversation_id=conversation_id,
+        user_id=user_id,
+        summary_text=row.context_summary if row.recent_messages is not None else row.summary_text,
+        enabled_toolkits=composio_service.get_user_enabled_toolkits(db, user_id),
+        version=row.version or 0,
+    )
+    if row.recent_messages is not None:
+        stored = [
+            RecentMessage(type=MessageType[item["type"]], content=item["content"], message_id=item["message_id"], write_id=item.get("write_id"))
+            for item in row.recent_messages
+        ]
+    else:
+        stored = [
+            RecentMessage(type=message.type, content=message.content, message_id=message.message_id, write_id=message.write_id)
+            for message in get_last_n_messages(db, conversation_id, N_CONTEXT_MESSAGES)
+        ]
+    state.append(with_pending(stored, pending, N_CONTEXT_MESSAGES))
+    return state
+
+
+def _current_version(db: Session, conversation_id: int, user_id: int) -> Optional[int]:
+    """The context row's version (0 while absent), or None if the conversation is gone or not the user's."""
+    row = db.query(ConversationContext.version).select_from(Conversation).outerjoin(
+        ConversationContext, ConversationContext.conversation_id == Conversation.conversation_id
+    ).filter(
+        Conversation.conversation_id == conversation_id,
+        Conversation.user_id == user_id,
+        Conversation.deleted_at.is_(None),
+    ).first()
+    return None if row is None else row.version or 0
+
+
+class ConversationStateCache:
+    """LRU of conversation states; used from the event loop only."""
+
+    def __init__(self):
+        self._states: "OrderedDict[int, ConversationState]" = OrderedDict()
+
+    def get(self, db: Session, conversation_id: int, user_id: int, pending: Sequence[Any] = ()) -> Optional[ConversationState]:
+        """The cached state if it is current, or one loaded from Postgres (and cached, unless caching is disabled)."""
+        self._evict_idle()
+        state = self._states.get(conversation_id)
+        if state is not None and state.user_id == user_id:
+            version = _current_version(db, conversation_id, user_id)
+            if version is None:
+                del self._states[conversation_id]
+                return None
+            if version == state.version:
+                self._states.move_to_end(conversation_id)
+                state.last_used = time.monotonic()
+                return state
+        state = load_state(db, conversation_id, user_id, pending)
+        if state is not None and settings.conversation_state_cache_enabled:
+            self._states[conversation_id] = state
+            while len(self._states) > max(1, settings.conversation_state_max_entries):
+                self._states.popitem(last=False)
+        return state
+
+    def advance(self, conversation_id: int, version: Optional[int]) -> bool:
+        """
+        Record that the cached state already holds a committed write that moved
+        the context row to `version`. Returns False, and leaves the state to be
+        reloaded, if the row changed in between.
+        """
+        state = self._states.get(conversation_id)
+        if state is None or version is None or state.version != version - 1:
+            return False
+        state.version = version
+        return True
+
+    def set_summary(self, conversation_id: int, summary_text: Optional[str], version: Optional[int] = None) -> None:
+        state = self._states.get(conversation_id)
+        if state is not None:
+            state.summary_text = summary_text
+            self.advance(conversation_id, version)
+
+    def invalidate(self, conversation_id: int) -> None:
+        self._states.pop(conversation_id, None)
+
+    def invalidate_user(self, user_id: int) -> None:
+        for conversation_id in [cid for cid, state in self._states.items() if state.user_id == user_id]:
+            del self._states[conversation_id]
+
+    def clear(self) -> None:
+        self._states.clear()
+
+    def _evict_idle(self) -> None:
+        # Least recently used first, so idle entries are all at the front.
+        cutoff = time.monotonic() - settings.conversation_state_idle_seconds
+        while self._states:
+            conversation_id, state = next(iter(self._states.items()))
+            if state.last_used >= cutoff:
+                break
+            del self._states[conversation_id]
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+state_cache = ConversationStateCache()
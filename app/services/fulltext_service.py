@@ -0,0 +1,158 @@
+"""
+Keyword search over message history with Postgres full-text search.
+
+`messages.content_tsv` is a stored generated tsvector with a GIN index, so a
+query only touches matching rows. Results are ordered by ts_rank_cd and paged
+with an opaque (rank, message_id) keyset cursor, which stays cheap however deep
+a client pages, unlike OFFSET. Highlighting runs on the returned page only.
+"""
+import base64
+import binascii
+import html
+import json
+import re
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+from sqlalchemy import Numeric, and_, cast, func, literal, select, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.conversation import Conversation
+from app.models.message import Message
+
+CONTENT_TSV = Message.__table__.c.content_tsv
+# ts_headline markers; the text between them is escaped before they become <mark> tags.
+_START, _STOP = "\ue000", "\ue001"
+_HEADLINE_OPTIONS = f'StartSel="{_START}", StopSel="{_STOP}", MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "'
+# Tokens that embeddings capture poorly and exact matching finds: identifiers with
+# digits (order numbers, error codes, versions), emails, URLs, #refs and quoted phrases.
+_LEXICAL = re.compile(
+    r'"[^"]+"|\S+@\S+\.\w+|https?://\S+|#\w+|\b(?=[\w.-]*\d)(?=[\w.-]*[a-zA-Z])[\w.-]{3,}\b|\b\w+_\w+\b'
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _tsquery(q: str):
+    return func.websearch_to_tsquery(cast(literal(settings.fulltext_language), REGCONFIG), q)
+
+
+def encode_cursor(rank: float, message_id: int) -> str:
+    raw = json.dumps([rank, message_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        rank, message_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(rank), int(message_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def highlight(headline: Optional[str]) -> str:
+    """Escape a ts_headline fragment and turn its markers into <mark> tags."""
+    escaped = html.escape(" ".join((headline or "").split()))
+    return escaped.replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def search_messages(
+    db: Session,
+    q: str,
+    user_id: Optional[int] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    conversation_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    types: Optional[Sequence[Any]] = None,
+    headlines: bool = True,
+) -> Dict[str, Any]:
+    """
+    One page of messages matching `q` (web search syntax: quoted phrases, OR,
+    -exclusion), best first, from the user's live conversations or one of them.
+    Hits carry the full message content and, with `headlines`, a highlighted fragment.
+    """
+    if user_id is None and conversation_id is None:
+        raise ValueError("search_messages needs a user_id or a conversation_id")
+    limit = max(1, min(limit, settings.search_max_results))
+    query = _tsquery(q)
+    # Rounded so the keyset comparison is exact across pages.
+    rank = cast(func.ts_rank_cd(CONTENT_TSV, query), Numeric(12, 6)).label("rank")
+    matches = select(Message.message_id, Message.conversation_id, rank).join(Conversation).where(
+        CONTENT_TSV.op("@@")(query),
+        Conversation.deleted_at.is_(None),
+    )
+    if user_id is not None:
+        matches = matches.where(Message.user_id == user_id)
+    if conversation_id is not None:
+        matches = matches.where(Message.conversation_id == conversation_id)
+    if since is not None:
+        matches = matches.where(Message.created_at >= since)
+    if types:
+        matches = matches.where(Message.type.in_(types))
+    matches = matches.subquery()
+
+    page_query = select(matches.c.message_id, matches.c.conversation_id, matches.c.rank)
+    if cursor:
+        after_rank, after_id = decode_cursor(cursor)
+        page_query = page_query.where(tuple_(matches.c.rank, matches.c.message_id) < tuple_(after_rank, after_id))
+    # One extra row tells whether there is a next page.
+    page_rows = page_query.order_by(matches.c.rank.desc(), matches.c.message_id.desc()).limit(limit + 1).subquery()
+
+    columns = [
+        Message.message_id,
+        Message.conversation_id,
+        Message.type,
+        Message.content,
+        Message.created_at,
+        Conversation.title.label("conversation_title"),
+        page_rows.c.rank,
+    ]
+    if headlines:
+        columns.append(func.ts_headline(
+            cast(literal(settings.fulltext_language), REGCONFIG), Message.content, query, _HEADLINE_OPTIONS
+        ).label("headline"))
+    rows = db.execute(
+        select(*columns)
+        .select_from(page_rows)
+        # conversation_id too, so each lookup probes one hash partition of `messages`.
+        .join(Message, and_(Message.message_id == page_rows.c.message_id, Message.conversation_id == page_rows.c.conversation_id))
+        .join(Conversation, Conversation.conversation_id == Message.conversation_id)
+        .order_by(page_rows.c.rank.desc(), page_rows.c.message_id.desc())
+    ).all()
+
+    results = [{
+        "message_id": row.message_id,
+        "conversation_id": row.conversation_id,
+        "conversation_title": row.conversation_title,
+        "type": row.type,
+        "content": row.content,
+        "headline": highlight(row.headline) if headlines else None,
+        "rank": float(row.rank),
+        "created_at": row.created_at,
+    } for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = results[-1]
+        next_cursor = encode_cursor(last["rank"], last["message_id"])
+    return {"results": results, "limit": limit, "next_cursor": next_cursor}
+
+
+def looks_lexical(q: str) -> bool:
+    """True for queries built around exact tokens, where keyword hits are enough on their own."""
+    return bool(_LEXICAL.search(q or ""))
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: Optional[int] = None) -> List[Hashable]:
+    """
+    Merge ranked lists by summing 1 / (k + rank) per item, so items ranked well
+    by several retrievers rise without comparing their incompatible scores.
+    """
+    k = settings.retrieval_rrf_k if k is None else k
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for position, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + position)
+    return sorted(scores, key=lambda key: scores[key], reverse=True)
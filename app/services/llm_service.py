@@ -1,23 +1,29 @@
-from typing import List, AsyncGenerator, Optional, Dict, Any
-from langchain.chat_models import init_chat_model
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI, HarmCategory, HarmBlockThreshold
-from langchain_openai import OpenAIEmbeddings
-from langchain_core.messages import HumanMessage, SystemMessage, BaseMessage, AIMessage, ToolMessage
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List, AsyncGenerator, Optional, Dict, Any, Tuple, TYPE_CHECKING
 from app.utils.message_utils import get_last_n_messages
-from app.utils.embedding_utils import add_message_embedding, query_similar_messages
-from chromadb.api.types import QueryResult
-from app.models.message import Message
+from app.utils.embedding_utils import query_similar_messages
+from app.utils.chunking import parse_chunk_id
+from app.vectorstores import get_vector_store
+from app.models.message import Message, MessageType
+from app.db.session import SessionLocal
 from app.models.conversation import Conversation
 from app.utils.type_utils import safe_str, safe_int
-from app.constants import SYSTEM_PROMPT, N_CONTEXT_MESSAGES
+from app.constants import SYSTEM_PROMPT, N_CONTEXT_MESSAGES, EMBEDDING_MODELS
 from sqlalchemy.orm import Session
 from app.config import settings
 from app.services.composio_service import composio_service
+from app.services.conversation_state import ConversationState
+from app.services import search_service, fulltext_service
+from app import providers
 import logging
 import json
 
+if TYPE_CHECKING:
+    from chromadb.api.types import QueryResult
+    from langchain_core.messages import BaseMessage
+
 
-composio = composio_service.composio
 logger = logging.getLogger(__name__)
 
 def build_system_prompt(db: Session, user_id: int) -> str:
@@ -29,52 +35,154 @@ def build_system_prompt(db: Session, user_id: int) -> str:
     prompt += f"\n\nAvailableToolkits: {enabled_toolkits}"
     return prompt
 
-def get_model_and_embeddings():
-    """
-    Initialize and return the chat model and embeddings based on the settings.model value.
-    """
+def _create_chat_model():
+    from langchain.chat_models import init_chat_model
     model_name = settings.model.lower()
     if model_name == "gemini":
-        chat_model = init_chat_model("google_genai:gemini-2.0-flash")
-        embedding_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001", task_type="SEMANTIC_SIMILARITY")
+        return init_chat_model("google_genai:gemini-2.0-flash")
     elif model_name == "openai":
-        chat_model = init_chat_model("openai:gpt-4.1-mini")
-        embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-    else:
-        raise ValueError(f"Invalid model: {settings.model}")
-    return chat_model, embedding_model
-
-model, embeddings = get_model_and_embeddings()
-summary_model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash-lite",
-    safety_settings={
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    }
-)
+        return init_chat_model("openai:gpt-4.1-mini")
+    raise ValueError(f"Invalid model: {settings.model}")
+
+def _create_embedding_model():
+    model_name = settings.model.lower()
+    if model_name == "gemini":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        if settings.embedding_truncate_dim:
+            logger.warning("EMBEDDING_TRUNCATE_DIM is ignored: models/embedding-001 is not Matryoshka-trained")
+        return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODELS["gemini"], task_type="SEMANTIC_SIMILARITY")
+    elif model_name == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        # text-embedding-3 models truncate server-side and return re-normalized vectors.
+        if settings.embedding_truncate_dim:
+            return OpenAIEmbeddings(model=EMBEDDING_MODELS["openai"], dimensions=settings.embedding_truncate_dim)
+        return OpenAIEmbeddings(model=EMBEDDING_MODELS["openai"])
+    raise ValueError(f"Invalid model: {settings.model}")
+
+def _create_summary_model():
+    from langchain_google_genai import ChatGoogleGenerativeAI, HarmCategory, HarmBlockThreshold
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash-lite",
+        safety_settings={
+            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+        }
+    )
+
+providers.register("chat_model", _create_chat_model)
+providers.register("embeddings", _create_embedding_model)
+providers.register("summary_model", _create_summary_model)
+
+def get_chat_model():
+    return providers.get("chat_model")
+
+def get_embedding_model():
+    return providers.get("embeddings")
+
+def get_summary_model():
+    return providers.get("summary_model")
+
+def get_model_and_embeddings():
+    """
+    Return the chat model and embeddings based on the settings.model value.
+    """
+    return get_chat_model(), get_embedding_model()
 
 async def get_embedding(text: str) -> List[float]:
-    return embeddings.embed_query(safe_str(text))
+    return get_embedding_model().embed_query(safe_str(text))
 
-async def get_semantic_context(user_message: str, conversation_id: int, top_k: int = 10) -> List[str]:
-    embedding = await get_embedding(user_message)
-    results: QueryResult = query_similar_messages(embedding, conversation_id, top_k=top_k)  # type: ignore
-    docs: List[str] = []
+def _window_start() -> Optional[datetime]:
+    return datetime.now(timezone.utc) - timedelta(days=settings.retrieval_window_days) if settings.retrieval_window_days else None
+
+def _user_scope(user_id: Optional[int]) -> bool:
+    return settings.retrieval_scope.lower() == "user" and user_id is not None
+
+async def _vector_hits(embedding: List[float], conversation_id: int, top_k: int, user_id: Optional[int]) -> List[Tuple[int, str]]:
+    """(message_id, matching chunk) pairs, best first."""
+    if _user_scope(user_id):
+        # Search every conversation of the user, e.g. "what did I say about X last week" in a new chat.
+        page = await asyncio.to_thread(search_service.search_by_embedding, embedding, user_id, limit=top_k, since=_window_start())
+        return [(hit["message_id"], safe_str(hit["document"])) for hit in page["results"]]
+    results: "QueryResult" = query_similar_messages(
+        embedding, conversation_id, top_k=top_k, user_id=user_id, within_days=settings.retrieval_window_days or None
+    )  # type: ignore
     documents = results.get('documents')
-    if isinstance(documents, list) and len(documents) > 0 and isinstance(documents[0], list):
-        docs = documents[0]
-    return [safe_str(doc) for doc in docs]
+    if not (isinstance(documents, list) and len(documents) > 0 and isinstance(documents[0], list)):
+        return []
+    metadatas = results.get('metadatas') or [[]]
+    hits: List[Tuple[int, str]] = []
+    for i, doc in enumerate(documents[0]):
+        metadata = metadatas[0][i] if metadatas[0] and metadatas[0][i] else {}
+        message_id = int(metadata.get("message_id") or parse_chunk_id(results["ids"][0][i])[0])
+        hits.append((message_id, safe_str(doc)))
+    return hits
+
+def _lexical_hits(user_message: str, conversation_id: int, top_k: int, user_id: Optional[int]) -> List[Tuple[int, str]]:
+    """(message_id, content) pairs from full-text search, best first; empty when the search fails."""
+    try:
+        with SessionLocal() as db:
+            page = fulltext_service.search_messages(
+                db,
+                user_message,
+                user_id=user_id,
+                limit=top_k,
+                conversation_id=None if _user_scope(user_id) else conversation_id,
+                since=_window_start(),
+                types=[MessageType.HUMAN, MessageType.AI],
+                headlines=False,
+            )
+    except Exception as e:
+        logger.error(f"Full-text context query failed for conversation {conversation_id}: {e}")
+        return []
+    # Bounded like an embedding chunk so one long reply cannot crowd out the rest of the context.
+    return [(hit["message_id"], search_service.snippet(hit["content"], settings.embedding_chunk_size)) for hit in page["results"]]
 
-async def get_context_with_summary(db: Session, conversation_id: int, user_message: str, semantic_k: int = 10) -> List[str]:
+async def get_semantic_context(user_message: str, conversation_id: int, top_k: int = 10, user_id: Optional[int] = None) -> List[str]:
+    if settings.retrieval_mode.lower() != "hybrid":
+        embedding = await get_embedding(user_message)
+        return [doc for _, doc in await _vector_hits(embedding, conversation_id, top_k, user_id)]
+    lexical = await asyncio.to_thread(_lexical_hits, user_message, conversation_id, top_k, user_id)
+    if lexical and fulltext_service.looks_lexical(user_message):
+        # Identifier-style queries are answered by exact matches; skip the embedding round trip.
+        return [doc for _, doc in lexical]
+    embedding = await get_embedding(user_message)
+    vector = await _vector_hits(embedding, conversation_id, top_k, user_id)
+    documents: Dict[int, str] = {}
+    for message_id, doc in vector + lexical:
+        documents.setdefault(message_id, doc)
+    ranked = fulltext_service.reciprocal_rank_fusion([[m for m, _ in vector], [m for m, _ in lexical]])
+    return [documents[message_id] for message_id in ranked[:top_k]]
+
+async def _get_recent_and_semantic(db: Session, conversation_id: int, user_message: str, semantic_k: int, user_id: Optional[int]):
+    store = get_vector_store()
+    if hasattr(store, "query_with_recent") and settings.retrieval_scope.lower() != "user" and settings.retrieval_mode.lower() != "hybrid":
+        # Backends colocated with `messages` can return both in one round trip.
+        try:
+            embedding = await get_embedding(user_message)
+            recent, docs = store.query_with_recent(db, embedding, conversation_id, semantic_k, N_CONTEXT_MESSAGES, since=_window_start())
+            return recent, [safe_str(doc) for doc in docs]
+        except Exception as e:
+            logger.error(f"Combined context query failed for conversation {conversation_id}: {e}")
+            db.rollback()
+    messages = get_last_n_messages(db, conversation_id, N_CONTEXT_MESSAGES)
+    semantic_context = await get_semantic_context(user_message, conversation_id, top_k=semantic_k, user_id=user_id)
+    return messages, semantic_context
+
+async def get_context_with_summary(db: Session, conversation_id: int, user_message: str, semantic_k: int = 10, user_id: Optional[int] = None, state: Optional[ConversationState] = None) -> List[str]:
     """
     Returns a list of context strings: the latest summary (if any), the last N messages, and semantic search results.
+    With a cached conversation `state`, the summary and recent messages come from it and only retrieval runs.
     """
-    conversation = db.query(Conversation).filter(Conversation.conversation_id == conversation_id).first()
-    summary_text = conversation.summary_text if conversation and conversation.summary_text else None
-    messages = get_last_n_messages(db, conversation_id, N_CONTEXT_MESSAGES)
-    semantic_context = await get_semantic_context(user_message, conversation_id, top_k=semantic_k)
+    if state is not None:
+        summary_text = state.summary_text or None
+        messages = state.last(N_CONTEXT_MESSAGES)
+        semantic_context = await get_semantic_context(user_message, conversation_id, top_k=semantic_k, user_id=user_id)
+    else:
+        conversation = db.query(Conversation).filter(Conversation.conversation_id == conversation_id).first()
+        summary_text = conversation.summary_text if conversation and conversation.summary_text else None
+        messages, semantic_context = await _get_recent_and_semantic(db, conversation_id, user_message, semantic_k, user_id)
     context = []
     if summary_text:
         context.append(f"Summary: {summary_text}")
@@ -85,24 +193,11 @@ async def get_context_with_summary(db: Session, conversation_id: int, user_messa
         context.extend(semantic_context)
     return context
 
-async def store_message_embedding(message: Message, conversation_id: int):
-    from app.schemas.message import MessageType
-    message_id = safe_int(getattr(message, 'message_id', None))
-    content = safe_str(getattr(message, 'content', None))
-    msg_type = getattr(message, 'type', None)
-    if msg_type not in [MessageType.HUMAN, MessageType.AI]:
-        print(f"Skipping embedding for message {message_id} in conversation {conversation_id} of type {msg_type}")
-        return
-    try:
-        embedding = await get_embedding(content)
-        add_message_embedding(message_id, content, embedding, conversation_id)
-    except Exception as embed_error:
-        logger.error(f"Embedding error for message {message_id} in conversation {conversation_id}: {embed_error}")
-
 async def generate_summary_with_llm(messages: List[Message], previous_summary: Optional[str] = None, db: Optional[Session] = None, user_id: Optional[int] = None) -> str:
     """
     Use the LLM to generate a summary of the provided messages, optionally including the previous summary.
     """
+    from langchain_core.messages import HumanMessage, SystemMessage
     formatted = "\n".join([f"{msg.type}: {msg.content}" for msg in messages])
     if previous_summary:
         prompt = (
@@ -120,7 +215,26 @@ async def generate_summary_with_llm(messages: List[Message], previous_summary: O
         )
 
     llm_messages: List[BaseMessage] = [SystemMessage(content=prompt), HumanMessage(content=formatted)]
-    response = await summary_model.ainvoke(llm_messages)
+    response = await get_summary_model().ainvoke(llm_messages)
+    return _response_text(response)
+
+async def merge_summaries_with_llm(summaries: List[str]) -> str:
+    """
+    Use the LLM to merge summaries of consecutive parts of one conversation, oldest first, into a single summary.
+    """
+    from langchain_core.messages import HumanMessage, SystemMessage
+    prompt = (
+        """
+        These are summaries of consecutive parts of one conversation, oldest first. Merge them into a single summary of the conversation's context, purpose, and key points in 175 words maximum. Prefer later parts where they supersede earlier ones, keep ongoing threads, and eliminate redundancy.
+        """
+    )
+    formatted = "\n\n".join(f"Part {i}: {summary}" for i, summary in enumerate(summaries, start=1))
+    llm_messages: List[BaseMessage] = [SystemMessage(content=prompt), HumanMessage(content=formatted)]
+    response = await get_summary_model().ainvoke(llm_messages)
+    return _response_text(response)
+
+def _response_text(response: Any) -> str:
+    from langchain_core.messages import AIMessage
     if isinstance(response, AIMessage):
         return str(response.content)
     elif isinstance(response, list):
@@ -142,6 +256,7 @@ async def classify_tool_intent_with_llm(user_message: str, conversation_summary:
     Returns a list of slugs as strings (e.g., ["GOOGLETASKS", "GMAIL"]).
     Now includes conversation_summary, last_messages, and semantic_results in the prompt.
     """
+    from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
     allowed_slugs = composio_service.get_supported_toolkits()
     allowed_slugs_str = " ".join(allowed_slugs)
     prompt = (
@@ -181,7 +296,7 @@ async def classify_tool_intent_with_llm(user_message: str, conversation_summary:
 
     print(f"[classify_tool_intent_with_llm] prompt: {prompt}")
     llm_messages: List[BaseMessage] = [SystemMessage(content=prompt), HumanMessage(content=user_message)]
-    response = await summary_model.ainvoke(llm_messages)
+    response = await get_summary_model().ainvoke(llm_messages)
     if isinstance(response, AIMessage):
         slug_str = str(response.content).strip()
     elif hasattr(response, "content"):
@@ -194,8 +309,12 @@ async def classify_tool_intent_with_llm(user_message: str, conversation_summary:
     slugs = [s.strip() for s in slug_str.split(",") if s.strip()]
     return slugs
 
-async def stream_llm_response(prompt: str, context: List[str], db: Session, user_id: int, slugs: List[str]) -> AsyncGenerator[Dict[str, Any], None]:
-    enabled_toolkits = composio_service.get_user_enabled_toolkits(db, user_id)
+async def stream_llm_response(prompt: str, context: List[str], db: Session, user_id: int, slugs: List[str], enabled_toolkits: Optional[List[str]] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+    composio = composio_service.composio
+    model = get_chat_model()
+    # Copied: search tools are appended to it below.
+    enabled_toolkits = list(enabled_toolkits) if enabled_toolkits is not None else composio_service.get_user_enabled_toolkits(db, user_id)
     tools_list = []
     for slug in slugs:
         if slug != "NOTOOL" and slug in enabled_toolkits:
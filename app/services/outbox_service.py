@@ -0,0 +1,271 @@
+"""
+Transactional outbox for vector store writes.
+
+Message inserts and deletes enqueue an `embedding_outbox` row in the same
+transaction, so the request path never waits on the embedding provider or
+the vector store. A drainer claims rows with FOR UPDATE SKIP LOCKED, leases
+them for `outbox_lease_seconds`, applies them in batched store calls and
+deletes them; failures are retried with exponential backoff. A failed upsert
+batch is bisected so one bad message doesn't fail the others, and rows that
+use up `outbox_max_attempts` are marked dead (`dead_at`) until requeued.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.embedding_outbox import EmbeddingOutbox, OutboxOp
+from app.models.message import Message, MessageType
+from app.utils import chunking
+from app.vectorstores import get_vector_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+EMBEDDED_TYPES = (MessageType.HUMAN, MessageType.AI)
+
+# Set by the in-process worker so writers can wake it instead of waiting for the next poll.
+_wakeup: Optional[asyncio.Event] = None
+
+
+def enqueue_upsert(db: Session, message: Message) -> None:
+    """Queue an embedding for a flushed message; caller commits."""
+    if message.type not in EMBEDDED_TYPES:
+        return
+    db.add(EmbeddingOutbox(
+        op=OutboxOp.UPSERT.value,
+        message_id=message.message_id,
+        conversation_id=message.conversation_id,
+        user_id=message.user_id,
+    ))
+
+
+def enqueue_delete_message(db: Session, message_id: int, conversation_id: int, user_id: Optional[int] = None) -> None:
+    db.add(EmbeddingOutbox(op=OutboxOp.DELETE_MESSAGE.value, message_id=message_id, conversation_id=conversation_id, user_id=user_id))
+
+
+def enqueue_delete_conversation(db: Session, conversation_id: int, user_id: Optional[int] = None) -> None:
+    db.add(EmbeddingOutbox(op=OutboxOp.DELETE_CONVERSATION.value, conversation_id=conversation_id, user_id=user_id))
+
+
+def notify() -> None:
+    """Wake the in-process drainer after a commit. Must be called from the event loop thread."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def claim(batch_size: int) -> List[Dict[str, Any]]:
+    """Lease up to `batch_size` due rows; concurrent drainers skip rows another one holds."""
+    now = _now()
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(EmbeddingOutbox)
+            .where(
+                EmbeddingOutbox.available_at <= now,
+                EmbeddingOutbox.attempts < settings.outbox_max_attempts,
+                EmbeddingOutbox.dead_at.is_(None),
+            )
+            .order_by(EmbeddingOutbox.outbox_id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        claimed = []
+        for row in rows:
+            row.attempts += 1
+            row.available_at = now + timedelta(seconds=settings.outbox_lease_seconds)
+            claimed.append({
+                "outbox_id": row.outbox_id,
+                "op": row.op,
+                "message_id": row.message_id,
+                "conversation_id": row.conversation_id,
+                "user_id": row.user_id,
+                "attempts": row.attempts,
+            })
+        db.commit()
+    return claimed
+
+
+def _complete(done: List[int], failed: Dict[int, Tuple[int, str]]) -> None:
+    with SessionLocal() as db:
+        if done:
+            db.execute(delete(EmbeddingOutbox).where(EmbeddingOutbox.outbox_id.in_(done)))
+        now = _now()
+        for outbox_id, (attempts, error) in failed.items():
+            backoff = min(settings.outbox_max_backoff_seconds, 2 ** attempts)
+            values = {"available_at": now + timedelta(seconds=backoff), "last_error": error[:2000]}
+            if attempts >= settings.outbox_max_attempts:
+                values["dead_at"] = now
+                logger.error(f"Outbox row {outbox_id} gave up after {attempts} attempts: {error}")
+            db.execute(update(EmbeddingOutbox).where(EmbeddingOutbox.outbox_id == outbox_id).values(**values))
+        db.commit()
+
+
+def dead_rows() -> int:
+    with SessionLocal() as db:
+        return db.execute(select(func.count()).select_from(EmbeddingOutbox).where(EmbeddingOutbox.dead_at.is_not(None))).scalar_one()
+
+
+def requeue_dead() -> int:
+    """Give dead rows a fresh set of attempts, e.g. once the cause of their `last_error` is fixed."""
+    with SessionLocal() as db:
+        count = db.execute(
+            update(EmbeddingOutbox)
+            .where(EmbeddingOutbox.dead_at.is_not(None))
+            .values(dead_at=None, attempts=0, available_at=_now())
+        ).rowcount
+        db.commit()
+    return count
+
+
+def _load_messages(keys: List[Tuple[int, int]]) -> List[Any]:
+    """Messages by (message_id, conversation_id); the conversation ids limit the lookup to their partitions."""
+    with SessionLocal() as db:
+        return db.execute(
+            select(Message.message_id, Message.conversation_id, Message.user_id, Message.type, Message.content, Message.created_at)
+            .where(
+                Message.conversation_id.in_({conversation_id for _, conversation_id in keys}),
+                tuple_(Message.message_id, Message.conversation_id).in_(keys),
+            )
+        ).all()
+
+
+async def _apply_upserts(rows: List[Dict[str, Any]]) -> None:
+    from app.services.llm_service import get_embedding_model
+    # Messages deleted since they were queued are simply skipped; their delete row follows.
+    records = chunking.message_chunks(await asyncio.to_thread(_load_messages, [(r["message_id"], r["conversation_id"]) for r in rows]))
+    if not records:
+        return
+    texts, positions = chunking.unique_texts(records)
+    vectors = await get_embedding_model().aembed_documents(texts)
+    for record, position in zip(records, positions):
+        record["embedding"] = vectors[position]
+    await asyncio.to_thread(get_vector_store().add_many, records)
+
+
+def _delete_conversation(store, row: Dict[str, Any]) -> None:
+    """
+    Run a claimed conversation delete while holding its outbox row locked.
+    Restoring an archived conversation (archive_service.rehydrate) deletes the
+    row before queuing the restored messages' upserts, so it either cancels
+    the delete first, and it is skipped here, or waits until it has run.
+    """
+    with SessionLocal() as db:
+        queued = db.execute(
+            select(EmbeddingOutbox.outbox_id).where(EmbeddingOutbox.outbox_id == row["outbox_id"]).with_for_update()
+        ).first()
+        if queued is not None:
+            store.delete_conversation(row["conversation_id"], user_id=row["user_id"])
+
+
+async def _isolate_upserts(rows: List[Dict[str, Any]], error: Exception, record) -> None:
+    """
+    `rows` failed together with `error`: retry each half and bisect the ones
+    that fail again, down to the single bad message. If both halves fail, the
+    embedding API or the store is down rather than one message bad, so stop.
+    """
+    if len(rows) == 1:
+        logger.error(f"Outbox upsert of message {rows[0]['message_id']} failed: {str(error)}")
+        record(rows, error)
+        return
+    middle = len(rows) // 2
+    failed = []
+    for half in (rows[:middle], rows[middle:]):
+        try:
+            await _apply_upserts(half)
+            record(half, None)
+        except Exception as e:
+            failed.append((half, e))
+    if len(failed) == 2:
+        logger.error(f"Outbox upsert of {len(rows)} messages failed: {str(error)}")
+        for half, e in failed:
+            record(half, e)
+        return
+    for half, e in failed:
+        await _isolate_upserts(half, e, record)
+
+
+async def process(rows: List[Dict[str, Any]]) -> Tuple[List[int], Dict[int, Tuple[int, str]]]:
+    """Apply claimed rows: upserts first, then message deletes, then conversation deletes."""
+    store = get_vector_store()
+    done: List[int] = []
+    failed: Dict[int, Tuple[int, str]] = {}
+
+    def record(group: List[Dict[str, Any]], error: Optional[Exception]) -> None:
+        for row in group:
+            if error is None:
+                done.append(row["outbox_id"])
+            else:
+                failed[row["outbox_id"]] = (row["attempts"], str(error))
+
+    upserts = [r for r in rows if r["op"] == OutboxOp.UPSERT.value]
+    # Rows that failed before go one at a time, so two bad messages in a batch,
+    # which bisecting takes for an outage, can't keep failing the rest with them.
+    groups = [[r for r in upserts if r["attempts"] == 1]] + [[r] for r in upserts if r["attempts"] > 1]
+    for group in groups:
+        if not group:
+            continue
+        try:
+            await _apply_upserts(group)
+            record(group, None)
+        except Exception as e:
+            await _isolate_upserts(group, e, record)
+
+    message_deletes: Dict[Tuple[int, Optional[int]], List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        if row["op"] == OutboxOp.DELETE_MESSAGE.value:
+            message_deletes[(row["conversation_id"], row["user_id"])].append(row)
+    for (conversation_id, user_id), group in message_deletes.items():
+        try:
+            await asyncio.to_thread(store.delete_messages, [r["message_id"] for r in group], user_id=user_id, conversation_id=conversation_id)
+            record(group, None)
+        except Exception as e:
+            logger.error(f"Outbox delete of {len(group)} messages in conversation {conversation_id} failed: {str(e)}")
+            record(group, e)
+
+    for row in rows:
+        if row["op"] == OutboxOp.DELETE_CONVERSATION.value:
+            try:
+                await asyncio.to_thread(_delete_conversation, store, row)
+                record([row], None)
+            except Exception as e:
+                logger.error(f"Outbox delete of conversation {row['conversation_id']} failed: {str(e)}")
+                record([row], e)
+
+    return done, failed
+
+
+async def drain_once(batch_size: Optional[int] = None) -> int:
+    """Claim and apply one batch. Returns the number of rows claimed."""
+    rows = await asyncio.to_thread(claim, batch_size or settings.outbox_batch_size)
+    if not rows:
+        return 0
+    done, failed = await process(rows)
+    await asyncio.to_thread(_complete, done, failed)
+    return len(rows)
+
+
+async def run_worker(stop: Optional[asyncio.Event] = None) -> None:
+    """Drain until `stop` is set, sleeping `outbox_poll_interval_seconds` (or until notified) when idle."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    batch_size = settings.outbox_batch_size
+    while stop is None or not stop.is_set():
+        _wakeup.clear()
+        try:
+            claimed = await drain_once(batch_size)
+        except Exception as e:
+            logger.error(f"Outbox drain failed: {str(e)}")
+            claimed = 0
+        if claimed >= batch_size:
+            continue
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=settings.outbox_poll_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,108 @@
+"""
+Background removal of soft-deleted conversations.
+
+Messages are deleted in transactions of at most `conversation_purge_batch_size`
+rows, each enqueueing outbox deletes for its vectors, so no single statement
+holds locks on, or writes WAL for, a whole long conversation. The conversation
+row goes last, together with a conversation-wide outbox delete that catches
+anything an in-flight upsert wrote meanwhile.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional
+from sqlalchemy import delete, select
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services import outbox_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def deleted_conversations(limit: Optional[int] = None, conversation_id: Optional[int] = None) -> List[Any]:
+    """(conversation_id, user_id) of soft-deleted conversations, oldest deletion first."""
+    query = select(Conversation.conversation_id, Conversation.user_id).where(Conversation.deleted_at.is_not(None))
+    if conversation_id is not None:
+        query = query.where(Conversation.conversation_id == conversation_id)
+    with SessionLocal() as db:
+        return db.execute(query.order_by(Conversation.deleted_at).limit(limit)).all()
+
+
+def _purge_message_batch(conversation_id: int, user_id: int, batch_size: int) -> int:
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(Message.message_id, Message.type)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.message_id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            return 0
+        message_ids = [row.message_id for row in rows]
+        db.execute(delete(Message).where(Message.conversation_id == conversation_id, Message.message_id.in_(message_ids)))
+        for row in rows:
+            if row.type in outbox_service.EMBEDDED_TYPES:
+                outbox_service.enqueue_delete_message(db, row.message_id, conversation_id, user_id)
+        db.commit()
+        return len(message_ids)
+
+
+def _purge_conversation_row(conversation_id: int, user_id: int) -> bool:
+    with SessionLocal() as db:
+        remaining = db.execute(select(Message.message_id).where(Message.conversation_id == conversation_id).limit(1)).first()
+        if remaining is not None:
+            return False
+        db.execute(delete(Conversation).where(Conversation.conversation_id == conversation_id, Conversation.deleted_at.is_not(None)))
+        outbox_service.enqueue_delete_conversation(db, conversation_id, user_id)
+        db.commit()
+    return True
+
+
+def purge_conversation(conversation_id: int, user_id: int, batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> Dict[str, int]:
+    """Delete up to `max_batches` batches of messages, then the conversation once it is empty."""
+    batch_size = batch_size or settings.conversation_purge_batch_size
+    stats = {"messages": 0, "batches": 0, "conversations": 0}
+    while max_batches is None or stats["batches"] < max_batches:
+        deleted = _purge_message_batch(conversation_id, user_id, batch_size)
+        if not deleted:
+            break
+        stats["messages"] += deleted
+        stats["batches"] += 1
+    if _purge_conversation_row(conversation_id, user_id):
+        stats["conversations"] += 1
+    return stats
+
+
+def purge_deleted(batch_size: Optional[int] = None, max_batches: Optional[int] = None, limit: Optional[int] = 100) -> Dict[str, int]:
+    """One pass over the oldest soft-deleted conversations."""
+    totals = {"messages": 0, "batches": 0, "conversations": 0}
+    for conversation_id, user_id in deleted_conversations(limit):
+        try:
+            stats = purge_conversation(conversation_id, user_id, batch_size=batch_size, max_batches=max_batches)
+        except Exception as e:
+            logger.error(f"Failed to purge conversation {conversation_id}: {str(e)}")
+            continue
+        for key, value in stats.items():
+            totals[key] += value
+    return totals
+
+
+async def run_purger(stop: Optional[asyncio.Event] = None) -> None:
+    """
+    Purge in the background, bounding each pass to `conversation_purge_max_batches`
+    batches per conversation so one huge conversation cannot starve the rest.
+    """
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            totals = await asyncio.to_thread(purge_deleted, max_batches=settings.conversation_purge_max_batches)
+            if totals["messages"] or totals["conversations"]:
+                print(f"[purge] removed {totals['messages']} messages and {totals['conversations']} conversations")
+        except Exception as e:
+            logger.error(f"Conversation purge failed: {str(e)}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.conversation_purge_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import text
+from app.config import settings
+from app.db.session import engine, has_replica, replica_engine
+from app.services.llm_service import get_chat_model, get_embedding_model, get_summary_model
+from app.vectorstores import get_vector_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Provider checks cost real API calls, so a passing result is reused for
+# `ready_provider_check_interval` seconds instead of re-running on every probe.
+_provider_results: Dict[str, Dict[str, Any]] = {}
+
+
+def _timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def _check_database(db_engine: Any = None, pool_size: Optional[int] = None) -> float:
+    """Check out `ready_db_pool_min` connections at once so the pool holds that many warm connections."""
+    db_engine = db_engine if db_engine is not None else engine
+    target = max(1, min(settings.ready_db_pool_min, pool_size or settings.db_pool_size))
+    connections = []
+    try:
+        for _ in range(target):
+            connection = db_engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+        return _timed(lambda: connections[0].execute(text("SELECT 1")))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def _check_replica() -> float:
+    return _check_database(replica_engine, settings.db_replica_pool_size)
+
+
+def _check_chroma() -> float:
+    from app.vectorstores.chroma import get_chroma_client, get_collection
+    client = get_chroma_client()
+    get_collection()
+    return _timed(client.heartbeat)
+
+
+def _check_vector_store() -> float:
+    return _timed(get_vector_store)
+
+
+def _check_embeddings() -> float:
+    model = get_embedding_model()
+    return _timed(lambda: model.embed_query("ready"))
+
+
+def _check_llm() -> float:
+    model = get_chat_model()
+    return _timed(lambda: model.invoke("ping"))
+
+
+def _check_summary_llm() -> float:
+    model = get_summary_model()
+    return _timed(lambda: model.invoke("ping"))
+
+
+def _checks() -> List[Dict[str, Any]]:
+    if settings.vector_backend.lower() == "chroma":
+        vector_check = {"name": "chroma", "fn": _check_chroma, "threshold_ms": settings.ready_chroma_max_latency_ms, "cached": False}
+    else:
+        vector_check = {"name": "vector_store", "fn": _check_vector_store, "threshold_ms": settings.ready_chroma_max_latency_ms, "cached": False}
+    database_checks = [{"name": "database", "fn": _check_database, "threshold_ms": settings.ready_db_max_latency_ms, "cached": False}]
+    if has_replica:
+        database_checks.append({"name": "database_replica", "fn": _check_replica, "threshold_ms": settings.ready_db_max_latency_ms, "cached": False})
+    return [
+        *database_checks,
+        vector_check,
+        {"name": "embeddings", "fn": _check_embeddings, "threshold_ms": settings.ready_embeddings_max_latency_ms, "cached": True},
+        {"name": "llm", "fn": _check_llm, "threshold_ms": settings.ready_llm_max_latency_ms, "cached": True},
+        {"name": "summary_llm", "fn": _check_summary_llm, "threshold_ms": settings.ready_llm_max_latency_ms, "cached": True},
+    ]
+
+
+async def _run_check(name: str, fn: Callable[[], float], threshold_ms: float) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"ok": False, "latency_ms": None, "threshold_ms": threshold_ms, "error": None}
+    try:
+        latency_ms = await asyncio.wait_for(asyncio.to_thread(fn), timeout=settings.ready_check_timeout_seconds)
+        result["latency_ms"] = round(latency_ms, 2)
+        result["ok"] = latency_ms <= threshold_ms
+        if not result["ok"]:
+            result["error"] = "latency above threshold"
+    except asyncio.TimeoutError:
+        result["error"] = f"timed out after {settings.ready_check_timeout_seconds}s"
+    except Exception as e:
+        logger.error(f"Readiness check {name} failed: {str(e)}")
+        result["error"] = str(e)
+    result["checked_at"] = time.time()
+    return result
+
+
+def _cached_result(name: str) -> Optional[Dict[str, Any]]:
+    cached = _provider_results.get(name)
+    if cached and cached["ok"] and time.time() - cached["checked_at"] < settings.ready_provider_check_interval:
+        return dict(cached, cached=True)
+    return None
+
+
+async def check_readiness() -> Dict[str, Any]:
+    """
+    Warm and measure every dependency concurrently.
+
+    Returns {"ready": bool, "checks": {name: {ok, latency_ms, threshold_ms, error, ...}}}.
+    """
+    checks = _checks()
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = []
+    for check in checks:
+        cached = _cached_result(check["name"]) if check["cached"] else None
+        if cached:
+            results[check["name"]] = cached
+        else:
+            pending.append(check)
+
+    measured = await asyncio.gather(*[_run_check(c["name"], c["fn"], c["threshold_ms"]) for c in pending])
+    for check, result in zip(pending, measured):
+        results[check["name"]] = result
+        if check["cached"]:
+            _provider_results[check["name"]] = result
+
+    return {
+        "ready": all(result["ok"] for result in results.values()),
+        "checks": results,
+    }
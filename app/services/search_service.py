@@ -0,0 +1,137 @@
+"""
+Semantic search over all of a user's conversations.
+
+Queries go through the vector store's user scope (conversation_id=None), which
+maps to a per-user collection with CHROMA_SHARDING=user, the indexed
+message_embeddings.user_id column on pgvector and the per-user conversation
+manifest on the local backend, so a search costs about as much as a
+per-conversation query instead of a scan of every history.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.utils.chunking import parse_chunk_id
+from app.utils.embedding_utils import CHUNK_OVERFETCH, collapse_chunks
+from app.vectorstores import get_vector_store
+from app.vectorstores.base import empty_query_result
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Deeper queries made when dropped hits leave a page short.
+_MAX_REFETCHES = 3
+
+
+def _live_conversations(user_id: int, conversation_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+    """Titles of the given conversations that belong to the user and are not soft-deleted."""
+    ids = list(set(conversation_ids))
+    if not ids:
+        return {}
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(Conversation.conversation_id, Conversation.title).where(
+                Conversation.conversation_id.in_(ids),
+                Conversation.user_id == user_id,
+                Conversation.deleted_at.is_(None),
+            )
+        ).all()
+    return {row.conversation_id: row.title for row in rows}
+
+
+def snippet(text: Optional[str], limit: Optional[int] = None) -> str:
+    limit = limit or settings.search_snippet_chars
+    text = " ".join((text or "").split())
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip() + "…"
+
+
+def _created_at(timestamp: Any) -> Optional[datetime]:
+    if isinstance(timestamp, (int, float)):
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return None
+
+
+def _live_hits(results: Dict[str, Any], store: Any, user_id: int) -> List[Dict[str, Any]]:
+    """Query results as hits, best first, without those of other users' or soft-deleted conversations."""
+    hits: List[Dict[str, Any]] = []
+    metadatas = results.get("metadatas") or [[]]
+    for i, document in enumerate(results["documents"][0]):
+        metadata = metadatas[0][i] if metadatas[0] and metadatas[0][i] else {}
+        if "conversation_id" not in metadata:
+            continue
+        hits.append({
+            "message_id": int(metadata.get("message_id") or parse_chunk_id(results["ids"][0][i])[0]),
+            "conversation_id": int(metadata["conversation_id"]),
+            "type": metadata.get("type"),
+            "document": document,
+            "snippet": snippet(document),
+            "score": round(store.similarity(float(results["distances"][0][i])), 4),
+            "created_at": _created_at(metadata.get("timestamp")),
+        })
+    titles = _live_conversations(user_id, (hit["conversation_id"] for hit in hits))
+    return [dict(hit, conversation_title=titles[hit["conversation_id"]]) for hit in hits if hit["conversation_id"] in titles]
+
+
+def _query(store: Any, embedding: List[float], top_k: int, conversation_id: Optional[int], user_id: int, **filters: Any) -> Tuple[Dict[str, Any], bool]:
+    """
+    Up to `top_k` results with one chunk per message, and whether the index
+    ran out. That is decided on the rows fetched before collapsing, since many
+    chunks of one message can make a full fetch collapse to a short result.
+    """
+    fetch = top_k * CHUNK_OVERFETCH
+    try:
+        results = store.query(embedding, conversation_id, top_k=fetch, user_id=user_id, **filters)
+    except Exception as e:
+        logger.error(f"Error searching messages of user {user_id}: {e}")
+        return empty_query_result(), True
+    return collapse_chunks(results, top_k), len(results["ids"][0]) < fetch
+
+
+def search_by_embedding(
+    embedding: List[float],
+    user_id: int,
+    limit: int = 10,
+    offset: int = 0,
+    conversation_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    types: Optional[Sequence[Any]] = None,
+) -> Dict[str, Any]:
+    """
+    One page of hits, best first. Pages are cut from a top-(offset+limit)
+    nearest-neighbour query, deepened when chunks of the same message collapse
+    or hits of soft-deleted conversations are dropped, so `offset + limit` is
+    capped at `search_max_results`.
+    Hits carry the full matching chunk as "document" next to the snippet.
+    """
+    limit = max(1, min(limit, settings.search_max_results))
+    offset = max(0, offset)
+    page: Dict[str, Any] = {"results": [], "offset": offset, "limit": limit, "next_offset": None}
+    if offset >= settings.search_max_results:
+        return page
+    window = min(offset + limit, settings.search_max_results)
+    store = get_vector_store()
+    # One extra result tells whether there is a next page.
+    top_k = window + 1
+    for attempt in range(_MAX_REFETCHES + 1):
+        if attempt:
+            # In proportion to the share of rows that turned into hits, at most doubling.
+            wanted = window + 1
+            top_k = min(2 * top_k, max(top_k + wanted - len(hits), -(-top_k * wanted // max(len(hits), 1))))
+        # A full fetch means the index may hold more, even if too many of them are collapsed or dropped below.
+        results, exhausted = _query(store, embedding, top_k, conversation_id, user_id, since=since, until=until, types=types)
+        hits = _live_hits(results, store, user_id)
+        # Vectors of soft-deleted conversations linger until the purger removes them;
+        # fetch deeper, or the page would come up short.
+        if len(hits) > window or exhausted:
+            break
+    page["results"] = hits[offset:offset + limit]
+    more = len(hits) > offset + limit or not exhausted
+    if more and offset + limit < settings.search_max_results:
+        page["next_offset"] = offset + limit
+    return page
@@ -0,0 +1,236 @@
+"""
+Rolling conversation summaries with a summarized-up-to watermark.
+
+`conversations.summarized_up_to` is the message_id of the last message that
+`summary_text` covers. Incremental updates send only the Human/AI messages after
+it, in chunks of at most `summary_max_prompt_chars`, and advance it with a
+compare-and-set so concurrent updates never fold the same messages twice.
+
+Backfills rebuild a summary map-reduce style: the history is cut into bounded
+chunks that are summarized in parallel, and the partial summaries are merged in
+bounded groups until one remains.
+
+After a message is stored, `schedule_update` refreshes the summary in a
+background task, so the chat turn never waits on the summarizing LLM call.
+"""
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.constants import M_SUMMARY_INTERVAL
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message, MessageType
+from app.services import context_service
+from app.services.conversation_state import state_cache
+from app.services.llm_service import generate_summary_with_llm, merge_summaries_with_llm
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARIZED_TYPES = [MessageType.HUMAN, MessageType.AI]
+_PAGE_SIZE = 500
+
+# Background refreshes, one task per conversation; a request made while one runs makes it go once more.
+_updates: Dict[int, asyncio.Task] = {}
+_updates_due: Set[int] = set()
+
+
+def _message_chars(message: Any) -> int:
+    return len(str(message.type)) + len(message.content or "") + 3
+
+
+def _bounded(message: Any, limit: int) -> Any:
+    """The message itself, or a copy with its content cut to fit one prompt."""
+    if _message_chars(message) <= limit:
+        return message
+    content = (message.content or "")[:max(0, limit - 40)] + " …[truncated]"
+    return SimpleNamespace(message_id=message.message_id, type=message.type, content=content)
+
+
+def chunk_messages(messages: Sequence[Any], max_chars: Optional[int] = None) -> Iterator[List[Any]]:
+    """Consecutive runs of messages whose formatted size stays within `max_chars`."""
+    max_chars = max_chars or settings.summary_max_prompt_chars
+    chunk: List[Any] = []
+    size = 0
+    for message in messages:
+        message = _bounded(message, max_chars)
+        chars = _message_chars(message)
+        if chunk and size + chars > max_chars:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(message)
+        size += chars
+    if chunk:
+        yield chunk
+
+
+def pending_messages(db: Session, conversation_id: int, after_id: Optional[int], limit: int = _PAGE_SIZE) -> List[Any]:
+    """Human/AI messages after the watermark, oldest first."""
+    return db.execute(
+        select(Message.message_id, Message.type, Message.content)
+        .where(
+            Message.conversation_id == conversation_id,
+            Message.message_id > (after_id or 0),
+            Message.type.in_(SUMMARIZED_TYPES),
+        )
+        .order_by(Message.message_id)
+        .limit(limit)
+    ).all()
+
+
+def _store_summary(db: Session, conversation_id: int, expected: Optional[int], summary: str, summarized_up_to: int) -> bool:
+    """Write the summary unless another update moved the watermark since `expected` was read."""
+    result = db.execute(
+        update(Conversation)
+        .where(
+            Conversation.conversation_id == conversation_id,
+            func.coalesce(Conversation.summarized_up_to, 0) == (expected or 0),
+        )
+        .values(summary_text=summary, summarized_up_to=summarized_up_to)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.commit()
+        return False
+    version = context_service.set_summary(db, conversation_id, summary)
+    db.commit()
+    state_cache.set_summary(conversation_id, summary, version)
+    return True
+
+
+async def update_summary(db: Session, conversation_id: int, max_chunks: Optional[int] = None) -> int:
+    """
+    Fold messages after the watermark into the summary, one bounded chunk per
+    LLM call and at most `max_chunks` calls; returns the number of messages
+    summarized. Anything left over is picked up by the next update.
+    """
+    max_chunks = max_chunks or settings.summary_max_chunks_per_update
+    row = db.execute(
+        select(Conversation.summary_text, Conversation.summarized_up_to).where(
+            Conversation.conversation_id == conversation_id,
+            Conversation.deleted_at.is_(None),
+        )
+    ).first()
+    if row is None:
+        return 0
+    summary, watermark = row.summary_text, row.summarized_up_to
+    summarized = 0
+    for _ in range(max_chunks):
+        messages = pending_messages(db, conversation_id, watermark)
+        if not messages or (summarized == 0 and len(messages) < M_SUMMARY_INTERVAL):
+            break
+        chunk = next(chunk_messages(messages))
+        new_summary = await generate_summary_with_llm(chunk, previous_summary=summary)
+        if not _store_summary(db, conversation_id, watermark, new_summary, chunk[-1].message_id):
+            logger.info(f"Summary of conversation {conversation_id} was updated concurrently; skipping")
+            break
+        summary, watermark = new_summary, chunk[-1].message_id
+        summarized += len(chunk)
+    return summarized
+
+
+async def maybe_update_summary(db: Session, conversation_id: int) -> None:
+    """Request-path hook after a message is stored; failures leave the watermark for the next message."""
+    try:
+        await update_summary(db, conversation_id)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to update summary for conversation {conversation_id}: {str(e)}")
+
+
+def schedule_update(conversation_id: int) -> None:
+    """Refresh the summary in the background. Must be called from the event loop thread."""
+    _updates_due.add(conversation_id)
+    if conversation_id not in _updates:
+        _updates[conversation_id] = asyncio.create_task(_run_updates(conversation_id))
+
+
+async def _run_updates(conversation_id: int) -> None:
+    try:
+        while conversation_id in _updates_due:
+            _updates_due.discard(conversation_id)
+            with SessionLocal() as db:
+                await maybe_update_summary(db, conversation_id)
+    finally:
+        _updates.pop(conversation_id, None)
+
+
+def cancel_updates() -> None:
+    """On shutdown; summaries catch up from their watermark on the next message."""
+    _updates_due.clear()
+    for task in list(_updates.values()):
+        task.cancel()
+
+
+async def _reduce(summaries: List[str], max_chars: int, semaphore: asyncio.Semaphore) -> str:
+    """Merge partial summaries in groups that fit one prompt until a single summary remains."""
+    while len(summaries) > 1:
+        groups: List[List[str]] = [[]]
+        size = 0
+        for summary in summaries:
+            summary = summary[:max_chars]
+            # Each summary is sent as "Part <n>: <summary>" plus a blank line.
+            chars = len(summary) + 12
+            if groups[-1] and size + chars > max_chars:
+                groups.append([])
+                size = 0
+            groups[-1].append(summary)
+            size += chars
+        if len(groups) == len(summaries):
+            # Every summary fills a prompt on its own; merge halves in pairs so each round still shrinks the list.
+            half = max_chars // 2
+            groups = [[summary[:half] for summary in summaries[i:i + 2]] for i in range(0, len(summaries), 2)]
+
+        async def merge(group: List[str]) -> str:
+            if len(group) == 1:
+                return group[0]
+            async with semaphore:
+                return await merge_summaries_with_llm(group)
+
+        summaries = list(await asyncio.gather(*[merge(group) for group in groups]))
+    return summaries[0] if summaries else ""
+
+
+async def rebuild_summary(
+    db: Session,
+    conversation_id: int,
+    max_chars: Optional[int] = None,
+    concurrency: Optional[int] = None,
+) -> int:
+    """
+    Re-summarize a conversation's whole history with map-reduce and reset the
+    watermark to the last message included; returns the number of messages.
+    Messages that arrive meanwhile are folded in incrementally afterwards.
+    """
+    max_chars = max_chars or settings.summary_max_prompt_chars
+    semaphore = asyncio.Semaphore(max(1, concurrency or settings.summary_rebuild_concurrency))
+    messages: List[Any] = []
+    while True:
+        page = pending_messages(db, conversation_id, messages[-1].message_id if messages else None)
+        if not page:
+            break
+        messages.extend(page)
+    if not messages:
+        return 0
+    chunks = list(chunk_messages(messages, max_chars))
+
+    async def summarize(chunk: List[Any]) -> str:
+        async with semaphore:
+            return await generate_summary_with_llm(chunk)
+
+    partials = list(await asyncio.gather(*[summarize(chunk) for chunk in chunks]))
+    summary = await _reduce(partials, max_chars, semaphore)
+    db.execute(
+        update(Conversation)
+        .where(Conversation.conversation_id == conversation_id)
+        .values(summary_text=summary, summarized_up_to=messages[-1].message_id)
+        .execution_options(synchronize_session=False)
+    )
+    version = context_service.set_summary(db, conversation_id, summary)
+    db.commit()
+    state_cache.set_summary(conversation_id, summary, version)
+    await update_summary(db, conversation_id)
+    return len(messages)
@@ -0,0 +1,250 @@
+"""
+NDJSON export and import of a user's conversations.
+
+Exports stream from server-side cursors (`yield_per`), so memory stays
+constant however long the history is; archived conversations are read from
+their archives without restoring them. The format is described in
+app/schemas/transfer.py.
+
+Imports parse the request body line by line and insert messages in batches of
+`transfer_batch_size` with one multi-row INSERT each, through
+`conversation_service.insert_messages`, so conversation contexts and the
+embedding outbox are kept as for chat messages. Batches run in worker threads
+and commit as they go. If a line is invalid, the conversations created so far
+are soft-deleted, and the purger removes them.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from pydantic import ValidationError
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, sessionmaker
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.conversation_context import ConversationContext
+from app.models.message import Message, MessageType
+from app.models.message_archive import MessageArchive
+from app.schemas.transfer import ExportConversation, ExportHeader, ExportMessage, ImportResult
+from app.services import archive_service, context_service, conversation_service, outbox_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPORT_VERSION = 1
+# Lines are sent in chunks of about this many bytes.
+_CHUNK_BYTES = 64 * 1024
+
+
+class InvalidImport(ValueError):
+    pass
+
+
+def _line(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _message_line(conversation_id: int, message_type: MessageType, content: str, created_at: Optional[datetime]) -> bytes:
+    return _line({
+        "record": "message",
+        "conversation_id": conversation_id,
+        "type": message_type.value,
+        "content": content,
+        "created_at": _isoformat(created_at),
+    })
+
+
+def _export_lines(db: Session, user_id: int, conversation_id: Optional[int]) -> Iterator[bytes]:
+    yield _line({"record": "export", "version": EXPORT_VERSION, "exported_at": datetime.now(timezone.utc).isoformat()})
+    query = select(
+        Conversation.conversation_id, Conversation.title, Conversation.summary_text, Conversation.created_at, ConversationContext.archived_at
+    ).outerjoin(
+        ConversationContext, ConversationContext.conversation_id == Conversation.conversation_id
+    ).where(Conversation.user_id == user_id, Conversation.deleted_at.is_(None))
+    if conversation_id is not None:
+        query = query.where(Conversation.conversation_id == conversation_id)
+    for conversation in db.execute(query.order_by(Conversation.conversation_id)).all():
+        yield _line({
+            "record": "conversation",
+            "conversation_id": conversation.conversation_id,
+            "title": conversation.title,
+            "summary_text": conversation.summary_text,
+            "created_at": _isoformat(conversation.created_at),
+        })
+        if conversation.archived_at is not None:
+            for batch in archive_service.read_archive(db, conversation.conversation_id):
+                for row in batch:
+                    yield _message_line(conversation.conversation_id, row["type"], row["content"], row["created_at"])
+            continue
+        rows = db.execute(
+            select(Message.type, Message.content, Message.created_at)
+            .where(Message.conversation_id == conversation.conversation_id)
+            # The order archives are written in, so live and archived conversations export alike.
+            .order_by(Message.message_id)
+            .execution_options(yield_per=settings.transfer_batch_size)
+        )
+        for row in rows:
+            yield _message_line(conversation.conversation_id, row.type, row.content, row.created_at)
+
+
+def check_archives(session_factory: sessionmaker, user_id: int, conversation_id: Optional[int] = None) -> None:
+    """Raise ArchiveMissing before streaming starts, rather than cutting the export off halfway."""
+    query = select(ConversationContext.conversation_id).join(
+        Conversation, Conversation.conversation_id == ConversationContext.conversation_id
+    ).outerjoin(
+        MessageArchive, MessageArchive.conversation_id == ConversationContext.conversation_id
+    ).where(
+        Conversation.user_id == user_id,
+        Conversation.deleted_at.is_(None),
+        ConversationContext.archived_at.is_not(None),
+        MessageArchive.conversation_id.is_(None),
+    )
+    if conversation_id is not None:
+        query = query.where(Conversation.conversation_id == conversation_id)
+    with session_factory() as db:
+        missing = list(db.execute(query).scalars())
+    if missing:
+        raise archive_service.ArchiveMissing(f"Archives of conversations {missing} are missing")
+
+
+def export_ndjson(session_factory: sessionmaker, user_id: int, conversation_id: Optional[int] = None) -> Iterator[bytes]:
+    """
+    The user's live conversations and their messages as NDJSON chunks. Opens its
+    own session, since a streamed response outlives the request's dependencies.
+    """
+    with session_factory() as db:
+        chunk: List[bytes] = []
+        size = 0
+        for line in _export_lines(db, user_id, conversation_id):
+            chunk.append(line)
+            size += len(line)
+            if size >= _CHUNK_BYTES:
+                yield b"".join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield b"".join(chunk)
+
+
+async def _lines(body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for data in body:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > settings.import_max_line_bytes:
+            raise InvalidImport(f"Line longer than {settings.import_max_line_bytes} bytes")
+    if buffer:
+        yield buffer
+
+
+def _create_conversation(user_id: int, record: ExportConversation) -> int:
+    with SessionLocal() as db:
+        conversation = Conversation(user_id=user_id, title=record.title, summary_text=record.summary_text)
+        if record.created_at is not None:
+            conversation.created_at = record.created_at
+        db.add(conversation)
+        db.flush()
+        context_service.create_context(db, conversation)
+        db.flush()
+        if record.summary_text is not None:
+            context_service.set_summary(db, conversation.conversation_id, record.summary_text)
+        db.commit()
+        return conversation.conversation_id
+
+
+def _insert_batch(rows: List[Dict[str, Any]]) -> None:
+    with SessionLocal() as db:
+        conversation_service.insert_messages(db, rows)
+        db.commit()
+
+
+def _finish(conversation_ids: List[int]) -> None:
+    """Imported summaries cover every imported message, so their watermark is the last one."""
+    if not conversation_ids:
+        return
+    with SessionLocal() as db:
+        last_message = select(func.max(Message.message_id)).where(Message.conversation_id == Conversation.conversation_id).scalar_subquery()
+        db.execute(
+            update(Conversation)
+            .where(Conversation.conversation_id.in_(conversation_ids), Conversation.summary_text.is_not(None))
+            .values(summarized_up_to=last_message)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+
+def _discard(conversation_ids: List[int]) -> None:
+    with SessionLocal() as db:
+        db.execute(
+            update(Conversation)
+            .where(Conversation.conversation_id.in_(conversation_ids))
+            .values(deleted_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+
+async def import_ndjson(body: AsyncIterator[bytes], user_id: int) -> ImportResult:
+    """Create the file's conversations for the user, with their messages and queued embeddings."""
+    started = time.monotonic()
+    conversation_ids: Dict[int, int] = {}
+    pending: List[Dict[str, Any]] = []
+    messages = 0
+    number = 0
+    try:
+        async for line in _lines(body):
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                kind = record.get("record") if isinstance(record, dict) else None
+                if kind == "message":
+                    message = ExportMessage.model_validate(record)
+                    if message.conversation_id not in conversation_ids:
+                        raise InvalidImport(f"conversation {message.conversation_id} must come before its messages")
+                    row = {
+                        "conversation_id": conversation_ids[message.conversation_id],
+                        "user_id": user_id,
+                        "type": message.type,
+                        "content": message.content,
+                    }
+                    if message.created_at is not None:
+                        row["created_at"] = message.created_at
+                    pending.append(row)
+                elif kind == "conversation":
+                    conversation = ExportConversation.model_validate(record)
+                    if conversation.conversation_id in conversation_ids:
+                        raise InvalidImport(f"conversation {conversation.conversation_id} appears twice")
+                    conversation_ids[conversation.conversation_id] = await asyncio.to_thread(_create_conversation, user_id, conversation)
+                elif kind == "export":
+                    header = ExportHeader.model_validate(record)
+                    if header.version > EXPORT_VERSION:
+                        raise InvalidImport(f"unsupported export version {header.version}")
+                else:
+                    raise InvalidImport(f"unknown record {kind!r}")
+            except (ValueError, ValidationError) as e:
+                raise InvalidImport(f"line {number}: {str(e)}") from e
+            if len(pending) >= settings.transfer_batch_size:
+                await asyncio.to_thread(_insert_batch, pending)
+                messages += len(pending)
+                pending = []
+                outbox_service.notify()
+        if pending:
+            await asyncio.to_thread(_insert_batch, pending)
+            messages += len(pending)
+        await asyncio.to_thread(_finish, list(conversation_ids.values()))
+    except Exception as e:
+        logger.error(f"Import for user {user_id} failed: {str(e)}")
+        if conversation_ids:
+            await asyncio.to_thread(_discard, list(conversation_ids.values()))
+        raise
+    outbox_service.notify()
+    return ImportResult(conversations=len(conversation_ids), messages=messages, seconds=round(time.monotonic() - started, 2))
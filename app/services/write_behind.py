@@ -0,0 +1,364 @@
+"""
+Write-behind persistence of conversation messages.
+
+`submit` appends the messages to a local, fsync'd journal and returns, so the
+socket handler can assemble context and start generating while a
+per-conversation worker inserts them in submission order, enqueues their
+embeddings and refreshes the summary. Until a write is committed it is
+visible through `pending`, which is overlaid on the rows read from Postgres
+when a conversation's state is loaded (app/services/conversation_state.py), so
+the model sees exactly the history that ends up stored.
+
+Every write carries a unique write_id that is stored on the message. After a
+crash, `replay_journals` re-applies journal entries that never got a "done"
+record and skips those whose write_id already reached Postgres. A live
+process holds an exclusive lock on its journal, so replays never touch it.
+
+A batch that still fails after `write_behind_max_attempts` tries, or fails in a
+way retrying cannot fix, is retried one write at a time; a write that still
+fails is appended to a dead-letter file next to the journals and its future
+fails, so one bad write cannot block its conversation's queue or keep the
+journal from being truncated.
+"""
+import asyncio
+import fcntl
+import glob
+import itertools
+import json
+import os
+import socket
+import threading
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.exc import DataError
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message, MessageType
+from app.services import archive_service, conversation_service, outbox_service, summary_service
+from app.services.conversation_state import state_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Failures that fail the same way on every retry.
+_PERMANENT_ERRORS = (DataError, archive_service.ArchiveMissing)
+
+
+class WriteFailed(RuntimeError):
+    """Set on the futures of dead-lettered writes."""
+
+
+@dataclass
+class PendingWrite:
+    write_id: str
+    seq: int
+    conversation_id: int
+    user_id: int
+    type: MessageType
+    content: str
+    created_at: datetime
+    future: Optional[asyncio.Future] = field(default=None, repr=False, compare=False)
+
+    def record(self) -> Dict[str, Any]:
+        return {
+            "op": "write",
+            "write_id": self.write_id,
+            "seq": self.seq,
+            "conversation_id": self.conversation_id,
+            "user_id": self.user_id,
+            "type": self.type.value,
+            "content": self.content,
+            "created_at": self.created_at.isoformat(),
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "PendingWrite":
+        return cls(
+            write_id=record["write_id"],
+            seq=int(record["seq"]),
+            conversation_id=int(record["conversation_id"]),
+            user_id=int(record["user_id"]),
+            type=MessageType(record["type"]),
+            content=record["content"],
+            created_at=datetime.fromisoformat(record["created_at"]),
+        )
+
+
+class Journal:
+    """Append-only JSON lines file owned, and flock'ed, by one process."""
+
+    def __init__(self, directory: str, fsync: bool = True):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"journal-{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl")
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab")
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def append(self, records: Iterable[Dict[str, Any]], sync: bool = True) -> None:
+        data = b"".join(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n" for record in records)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            if sync and self.fsync:
+                os.fsync(self._file.fileno())
+
+    def truncate(self) -> None:
+        """Drop the journal's contents once every write in it is committed."""
+        with self._lock:
+            self._file.truncate(0)
+            self._file.seek(0)
+
+    def close(self, remove: bool) -> None:
+        with self._lock:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+        if remove:
+            os.remove(self.path)
+
+
+def dead_letter(writes: Sequence[PendingWrite], error: str, directory: Optional[str] = None) -> str:
+    """Append writes that could not be stored to this host's dead-letter file; returns its path."""
+    directory = directory or settings.write_behind_dir
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"dead-letter-{socket.gethostname()}.jsonl")
+    failed_at = datetime.now(timezone.utc).isoformat()
+    data = b"".join(
+        json.dumps({**write.record(), "error": error, "failed_at": failed_at}, separators=(",", ":")).encode("utf-8") + b"\n"
+        for write in writes
+    )
+    with open(path, "ab") as f:
+        # Shared by every process on the host.
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    return path
+
+
+def _read_journal(path: str) -> List[PendingWrite]:
+    """Writes in a journal without a "done" record, in submission order."""
+    writes: Dict[str, PendingWrite] = {}
+    done = set()
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn last line from a crash mid-append; its submit never returned.
+                continue
+            if record.get("op") == "write":
+                writes[record["write_id"]] = PendingWrite.from_record(record)
+            elif record.get("op") == "done":
+                done.update(record["write_ids"])
+    return sorted((write for write_id, write in writes.items() if write_id not in done), key=lambda write: write.seq)
+
+
+def persist(writes: Sequence[PendingWrite]) -> Tuple[List[int], Optional[int]]:
+    """
+    Insert writes of one conversation in order, skipping write_ids that are
+    already stored, and enqueue their embeddings in the same transaction.
+    Returns the message ids of the newly inserted rows and the conversation
+    context's new version, None if nothing was inserted.
+    """
+    with SessionLocal() as db:
+        stored = set(db.execute(
+            select(Message.write_id).where(
+                Message.conversation_id == writes[0].conversation_id,
+                Message.write_id.in_([write.write_id for write in writes]),
+            )
+        ).scalars())
+        versions: Dict[int, int] = {}
+        messages = conversation_service.insert_messages(db, [
+            {
+                "conversation_id": write.conversation_id,
+                "user_id": write.user_id,
+                "type": write.type,
+                "content": write.content,
+                "created_at": write.created_at,
+                "write_id": write.write_id,
+            }
+            for write in writes if write.write_id not in stored
+        ], versions=versions)
+        message_ids = [message.message_id for message in messages]
+        db.commit()
+        return message_ids, versions.get(writes[0].conversation_id)
+
+
+def _conversation_live(conversation_id: int) -> bool:
+    with SessionLocal() as db:
+        return db.execute(
+            select(Conversation.conversation_id).where(
+                Conversation.conversation_id == conversation_id,
+                Conversation.deleted_at.is_(None),
+            )
+        ).first() is not None
+
+
+def replay_journals(directory: Optional[str] = None) -> int:
+    """Apply writes left in the journals of stopped processes; returns how many were inserted."""
+    directory = directory or settings.write_behind_dir
+    inserted = 0
+    for path in sorted(glob.glob(os.path.join(directory, "journal-*.jsonl"))):
+        with open(path, "rb+") as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # Owned by a running process.
+            writes = _read_journal(path)
+            by_conversation: Dict[int, List[PendingWrite]] = {}
+            for write in writes:
+                by_conversation.setdefault(write.conversation_id, []).append(write)
+            for conversation_id, conversation_writes in by_conversation.items():
+                if not _conversation_live(conversation_id):
+                    logger.warning(f"Dropping {len(conversation_writes)} journaled writes of deleted conversation {conversation_id}")
+                    continue
+                try:
+                    inserted += len(persist(conversation_writes)[0])
+                except Exception as e:
+                    dead_letter(conversation_writes, str(e), directory)
+                    logger.error(f"Dead-lettered {len(conversation_writes)} journaled writes of conversation {conversation_id}: {str(e)}")
+            os.remove(path)
+    if inserted:
+        print(f"[write_behind] replayed {inserted} journaled messages")
+    return inserted
+
+
+class WriteBehindQueue:
+    def __init__(self):
+        self._pending: Dict[int, Deque[PendingWrite]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._closing = False
+        self._journal: Optional[Journal] = None
+        self._journal_lock = threading.Lock()
+        self._seq = itertools.count(1)
+
+    def _get_journal(self) -> Journal:
+        with self._journal_lock:
+            if self._journal is None:
+                self._journal = Journal(settings.write_behind_dir, fsync=settings.write_behind_fsync)
+            return self._journal
+
+    async def submit(self, conversation_id: int, user_id: int, messages: Sequence[Tuple[MessageType, str]]) -> List[PendingWrite]:
+        """
+        Queue messages for one conversation, in order, and return once they are
+        durable in the journal. Await `flush` to wait until they are in Postgres.
+        """
+        loop = asyncio.get_running_loop()
+        now = datetime.now(timezone.utc)
+        writes = [
+            PendingWrite(
+                write_id=str(uuid.uuid4()),
+                seq=next(self._seq),
+                conversation_id=conversation_id,
+                user_id=user_id,
+                type=message_type,
+                content=content,
+                created_at=now,
+                future=loop.create_future(),
+            )
+            for message_type, content in messages
+        ]
+        # Queue before journaling so the in-memory order is the submission order.
+        self._pending.setdefault(conversation_id, deque()).extend(writes)
+        await asyncio.to_thread(self._get_journal().append, [write.record() for write in writes])
+        if conversation_id not in self._workers:
+            self._workers[conversation_id] = asyncio.create_task(self._drain(conversation_id))
+        return writes
+
+    def pending(self, conversation_id: int) -> List[PendingWrite]:
+        """Writes of the conversation that are not committed yet, oldest first."""
+        return list(self._pending.get(conversation_id, ()))
+
+    async def flush(self, conversation_id: Optional[int] = None) -> None:
+        """Wait until every write submitted so far (for one conversation, or all) is committed or dropped."""
+        queues = [self._pending.get(conversation_id, ())] if conversation_id is not None else list(self._pending.values())
+        futures = [write.future for queue in queues for write in queue if write.future is not None]
+        if futures:
+            await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _drain(self, conversation_id: int) -> None:
+        queue = self._pending[conversation_id]
+        attempt = 0
+        # Writes still to be retried one at a time, after their batch gave up.
+        isolated = 0
+        try:
+            while queue:
+                batch = list(itertools.islice(queue, 1 if isolated else settings.write_behind_batch_size))
+                try:
+                    message_ids, version = await asyncio.to_thread(persist, batch)
+                except Exception as e:
+                    if not await asyncio.to_thread(_conversation_live, conversation_id):
+                        logger.warning(f"Dropping {len(queue)} queued writes of deleted conversation {conversation_id}: {str(e)}")
+                        self._finish(queue, len(queue))
+                        break
+                    attempt += 1
+                    if isinstance(e, _PERMANENT_ERRORS) or attempt >= settings.write_behind_max_attempts:
+                        attempt = 0
+                        if len(batch) > 1:
+                            # Find the write that fails instead of dropping its whole batch.
+                            isolated = len(batch)
+                            continue
+                        path = await asyncio.to_thread(dead_letter, batch, str(e))
+                        logger.error(f"Dead-lettered write {batch[0].write_id} of conversation {conversation_id} to {path}: {str(e)}")
+                        self._finish(queue, 1, error=WriteFailed(str(e)))
+                        isolated = max(isolated - 1, 0)
+                        continue
+                    delay = min(30.0, 0.5 * 2 ** attempt)
+                    logger.error(f"Write-behind insert for conversation {conversation_id} failed ({str(e)}); retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                attempt = 0
+                isolated = max(isolated - len(batch), 0)
+                self._finish(queue, len(batch))
+                outbox_service.notify()
+                if message_ids:
+                    # The state got these writes when they were submitted.
+                    state_cache.advance(conversation_id, version)
+                    summary_service.schedule_update(conversation_id)
+        finally:
+            self._workers.pop(conversation_id, None)
+            if not queue:
+                self._pending.pop(conversation_id, None)
+            elif not self._closing:
+                # Writes submitted while this worker was exiting.
+                self._workers[conversation_id] = asyncio.create_task(self._drain(conversation_id))
+            if not self._pending and self._journal is not None:
+                # No await between the check and the truncate, so no new write record can be lost.
+                self._journal.truncate()
+
+    def _finish(self, queue: Deque[PendingWrite], count: int, error: Optional[Exception] = None) -> None:
+        done = [queue.popleft() for _ in range(count)]
+        # Not fsync'd: a lost "done" record only makes a replay skip already stored write_ids,
+        # or retry a dead-lettered batch once more.
+        self._get_journal().append([{"op": "done", "write_ids": [write.write_id for write in done]}], sync=False)
+        for write in done:
+            if write.future is not None and not write.future.done():
+                if error is not None:
+                    write.future.set_exception(error)
+                else:
+                    write.future.set_result(None)
+
+    async def close(self, timeout: float) -> None:
+        """Wait up to `timeout` for queued writes; whatever is left is replayed from the journal on the next start."""
+        self._closing = True
+        workers = list(self._workers.values())
+        if workers:
+            _, still_running = await asyncio.wait(workers, timeout=timeout)
+            for task in still_running:
+                task.cancel()
+        if self._journal is not None:
+            self._journal.close(remove=not self._pending)
+            self._journal = None
+
+
+write_queue = WriteBehindQueue()
+
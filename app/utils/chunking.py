@@ -0,0 +1,135 @@
+"""
+Split message content into bounded, overlapping chunks for embedding.
+
+Each chunk is stored as its own vector with id "<message_id>:<chunk_index>"
+and carries its character span in the parent message, so retrieval can
+return just the matching passage instead of a whole tool-heavy reply.
+"""
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.config import settings
+
+# Acknowledgements and other replies that carry nothing worth retrieving.
+_LOW_INFORMATION = re.compile(
+    r"^(ok(ay)?|k|sure|yes|yep|yeah|no|nope|thanks?( you)?|thx|ty|cool|great|nice|done|got it|hi|hello|hey|bye)[\s.!?]*$",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"\w+")
+# Preferred split points, strongest first: paragraph, line, sentence, word.
+_BOUNDARIES = [re.compile(r"\n\s*\n"), re.compile(r"\n"), re.compile(r"[.!?]\s+"), re.compile(r"\s+")]
+
+
+@dataclass(frozen=True)
+class Chunk:
+    index: int
+    start: int
+    end: int
+    text: str
+
+
+def chunk_id(message_id: int, index: int) -> str:
+    return f"{message_id}:{index}"
+
+
+def parse_chunk_id(vector_id: Any) -> Tuple[int, int]:
+    """(message_id, chunk_index) of a vector id; ids written before chunking are bare message ids."""
+    message_id, _, index = str(vector_id).partition(":")
+    return int(message_id), int(index or 0)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(" ".join(text.split()).lower().encode("utf-8")).hexdigest()
+
+
+def is_trivial(content: Optional[str]) -> bool:
+    """True for empty, very short or purely conversational messages."""
+    text = (content or "").strip()
+    if len(text) < settings.embedding_min_chars or len(_WORD.findall(text)) < settings.embedding_min_words:
+        return True
+    return bool(_LOW_INFORMATION.match(text))
+
+
+def _split_point(text: str, start: int, limit: int) -> int:
+    """Latest boundary in the second half of text[start:limit], or `limit` when there is none."""
+    floor = start + (limit - start) // 2
+    for pattern in _BOUNDARIES:
+        best = -1
+        for match in pattern.finditer(text, floor, limit):
+            best = match.end()
+        if best > floor:
+            return best
+    return limit
+
+
+def split(content: str, size: Optional[int] = None, overlap: Optional[int] = None) -> List[Chunk]:
+    """
+    Windows of at most `size` characters that end on the strongest natural
+    boundary available and start `overlap` characters before the previous end.
+    """
+    size = size or settings.embedding_chunk_size
+    overlap = max(0, min(overlap if overlap is not None else settings.embedding_chunk_overlap, size // 2))
+    text = content.strip()
+    offset = content.find(text) if text else 0
+    if len(text) <= size:
+        return [Chunk(0, offset, offset + len(text), text)] if text else []
+    chunks: List[Chunk] = []
+    start = 0
+    while start < len(text):
+        end = len(text) if len(text) - start <= size else _split_point(text, start, start + size)
+        piece = text[start:end].strip()
+        if piece:
+            lead = len(text[start:end]) - len(text[start:end].lstrip())
+            chunk_start = offset + start + lead
+            chunks.append(Chunk(len(chunks), chunk_start, chunk_start + len(piece), piece))
+        if end >= len(text):
+            break
+        # Step back by the overlap, but snap forward to a word start so chunks never begin mid-word.
+        next_start = max(start + 1, end - overlap)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if 0 <= space < end - 1 else next_start
+    return chunks
+
+
+def message_chunks(messages: Iterable[Any]) -> List[Dict[str, Any]]:
+    """
+    Vector store records, without embeddings, for message rows with
+    message_id, conversation_id, user_id, type, content and created_at.
+    Trivial messages produce no records.
+    """
+    records: List[Dict[str, Any]] = []
+    for message in messages:
+        if is_trivial(message.content):
+            continue
+        for chunk in split(message.content):
+            records.append({
+                "message_id": message.message_id,
+                "chunk_index": chunk.index,
+                "chunk_start": chunk.start,
+                "chunk_end": chunk.end,
+                "content": chunk.text,
+                "content_hash": content_hash(chunk.text),
+                "conversation_id": message.conversation_id,
+                "user_id": message.user_id,
+                "type": message.type,
+                "created_at": message.created_at,
+            })
+    return records
+
+
+def unique_texts(records: List[Dict[str, Any]]) -> Tuple[List[str], List[int]]:
+    """
+    Distinct chunk texts to embed and, for each record, the position of its
+    text in that list, so repeated content is embedded once per batch.
+    """
+    texts: List[str] = []
+    positions: Dict[str, int] = {}
+    mapping: List[int] = []
+    for record in records:
+        key = record["content_hash"]
+        if key not in positions:
+            positions[key] = len(texts)
+            texts.append(record["content"])
+        mapping.append(positions[key])
+    return texts, mapping
@@ -1,80 +1,116 @@
-from chromadb.api.types import QueryResult
-from typing import List
-import chromadb
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, TYPE_CHECKING
 import logging
-from app.config import settings
+from app.vectorstores import get_vector_store
+from app.vectorstores.base import empty_query_result
+
+if TYPE_CHECKING:
+    from chromadb.api.types import QueryResult
 
 logger = logging.getLogger(__name__)
 
-chroma_client = chromadb.HttpClient(
-    host=settings.chroma_host,
-    port=settings.chroma_port
-)
+# Rows fetched per result wanted, so that collapsing chunks of the same message still leaves top_k results.
+CHUNK_OVERFETCH = 2
 
-collection = chroma_client.get_or_create_collection('messages')
 
-def add_message_embedding(message_id: int, content: str, embedding: List[float], conversation_id: int):
+def add_message_embedding(message_id: int, content: str, embedding: List[float], conversation_id: int, user_id: Optional[int] = None):
     try:
-        timestamp = datetime.now().isoformat()
-        collection.add(
-            ids=[str(message_id)],
-            embeddings=[embedding],
-            metadatas=[{
-                "message_id": message_id, 
-                "conversation_id": conversation_id,
-                "timestamp": timestamp
-            }],
-            documents=[content],
-        )
+        get_vector_store().add(message_id, content, embedding, conversation_id, user_id=user_id)
         print(f"Added embedding for message {message_id} in conversation {conversation_id}")
     except Exception as e:
         logger.error(f"Error adding embedding for message {message_id} in conversation {conversation_id}: {e}")
 
-def query_similar_messages(query_embedding: List[float], conversation_id: int, top_k: int = 10) -> QueryResult:
-    
+def query_similar_messages(
+    query_embedding: List[float],
+    conversation_id: Optional[int],
+    top_k: int = 10,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    within_days: Optional[float] = None,
+    types: Optional[Sequence[Any]] = None,
+) -> "QueryResult":
+    """
+    Nearest messages to `query_embedding`, filtered before the vector search.
+
+    Args:
+        conversation_id: Conversation to search; None searches all of `user_id`'s conversations
+        since, until: Bounds on the message creation time (until is exclusive)
+        within_days: Shorthand for `since` = now minus that many days, e.g. 30 for "last 30 days"
+        types: Message types (MessageType or "Human"/"AI") to keep
+    """
+    if within_days and since is None:
+        since = datetime.now(timezone.utc) - timedelta(days=within_days)
     try:
-        raw_results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            where={"conversation_id": conversation_id},
-            include=["documents", "metadatas", "distances"],
+        results = get_vector_store().query(
+            query_embedding, conversation_id, top_k=top_k * CHUNK_OVERFETCH, user_id=user_id, since=since, until=until, types=types
         )
-        return raw_results
+        return collapse_chunks(results, top_k)  # type: ignore
     except Exception as e:
         logger.error(f"Error querying similar messages for conversation {conversation_id}: {e}")
-        return {"documents": [[]], "metadatas": [[]], "distances": [[]]}  # Return empty result on error
+        return empty_query_result()  # type: ignore
+
 
-def delete_conversation_embeddings(conversation_id: int) -> bool:
+def collapse_chunks(results: Dict[str, Any], top_k: int) -> Dict[str, Any]:
+    """
+    Keep the best-matching chunk of each message, and one copy of identical
+    passages, from a single-query result ordered by distance.
+    """
+    kept = []
+    seen_messages, seen_texts = set(), set()
+    metadatas = (results.get("metadatas") or [[]])[0] or []
+    for i, vector_id in enumerate(results["ids"][0]):
+        metadata = metadatas[i] if i < len(metadatas) and metadatas[i] else {}
+        document = results["documents"][0][i]
+        message_id = metadata.get("message_id", vector_id)
+        text_key = metadata.get("content_hash") or " ".join((document or "").split()).lower()
+        if message_id in seen_messages or text_key in seen_texts:
+            continue
+        seen_messages.add(message_id)
+        seen_texts.add(text_key)
+        kept.append(i)
+        if len(kept) == top_k:
+            break
+    collapsed = empty_query_result()
+    for key in collapsed:
+        values = results.get(key)
+        if values and values[0] is not None:
+            collapsed[key] = [[values[0][i] for i in kept]]
+    return collapsed
+
+def delete_conversation_embeddings(conversation_id: int, user_id: Optional[int] = None) -> bool:
     """
     Delete all embeddings for a specific conversation.
-    
+
     Args:
         conversation_id: The ID of the conversation to delete
-        
+        user_id: Owner of the conversation, used to route to its collection
+
     Returns:
         bool: True if deletion was successful, False otherwise
     """
     try:
-        collection.delete(where={"conversation_id": conversation_id})
+        get_vector_store().delete_conversation(conversation_id, user_id=user_id)
         print(f"Deleted all embeddings for conversation {conversation_id}")
         return True
     except Exception as e:
         logger.error(f"Failed to delete embeddings for conversation {conversation_id}: {str(e)}")
         return False
 
-def delete_message_embedding(message_id: int) -> bool:
+def delete_message_embedding(message_id: int, user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> bool:
     """
     Delete a specific message embedding.
-    
+
     Args:
         message_id: The ID of the message to delete
-        
+        user_id: Owner of the message, used to route to its collection
+        conversation_id: Conversation of the message, if known
+
     Returns:
         bool: True if deletion was successful, False otherwise
     """
     try:
-        collection.delete(ids=[str(message_id)])
+        get_vector_store().delete_message(message_id, user_id=user_id, conversation_id=conversation_id)
         print(f"Deleted embedding for message {message_id}")
         return True
     except Exception as e:
@@ -1,6 +1,6 @@
 from app.models.message import Message, MessageType
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Any, List, Sequence
 
 def get_last_n_messages(db: Session, conversation_id: int, n: int) -> List[Message]:
     return (
@@ -9,7 +9,20 @@ def get_last_n_messages(db: Session, conversation_id: int, n: int) -> List[Messa
             Message.conversation_id == conversation_id,
             Message.type.in_([MessageType.HUMAN, MessageType.AI])
         )
-        .order_by(Message.created_at.desc())
+        .order_by(Message.created_at.desc(), Message.message_id.desc())
         .limit(n)
         .all()[::-1]
-    ) 
\ No newline at end of file
+    ) 
+
+def with_pending(messages: Sequence[Any], pending: Sequence[Any], n: int) -> List[Any]:
+    """
+    The last `n` of stored Human/AI messages followed by uncommitted
+    write-behind writes. Read `pending` before the stored messages; writes
+    committed in between are recognised by write_id and not repeated.
+    """
+    stored = {getattr(message, "write_id", None) for message in messages} - {None}
+    combined = list(messages) + [
+        write for write in pending
+        if write.write_id not in stored and write.type in (MessageType.HUMAN, MessageType.AI)
+    ]
+    return combined[-n:] if n > 0 else []
@@ -0,0 +1,34 @@
+import os
+from app.config import settings
+from app import providers
+from .base import VectorStore, embedding_model_id
+
+
+def _create_vector_store() -> VectorStore:
+    backend = settings.vector_backend.lower()
+    if backend == "chroma":
+        from .chroma import ChromaVectorStore
+        return ChromaVectorStore()
+    if backend == "local":
+        from .local import LocalVectorStore, model_dir
+        # Each embedding model gets its own tree so a backfill can run next to the live index.
+        return LocalVectorStore(
+            os.path.join(settings.local_index_dir, model_dir(embedding_model_id())),
+            cache_size=settings.local_index_cache_size,
+            storage_dtype=settings.embedding_storage_dtype,
+            rescore_factor=settings.embedding_rescore_factor,
+        )
+    if backend == "pgvector":
+        from .pgvector import PgVectorStore
+        return PgVectorStore()
+    raise ValueError(f"Invalid vector_backend: {settings.vector_backend}")
+
+
+providers.register("vector_store", _create_vector_store, close=lambda store: store.close())
+
+
+def get_vector_store() -> VectorStore:
+    return providers.get("vector_store")
+
+
+__all__ = ["VectorStore", "embedding_model_id", "get_vector_store"]
@@ -0,0 +1,164 @@
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Union
+from app.config import settings
+from app.constants import EMBEDDING_MODELS
+
+
+def empty_query_result() -> Dict[str, Any]:
+    return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+
+def embedding_model_id() -> str:
+    """
+    Identifier of the embedding model currently configured, stamped on every
+    stored vector so queries never compare vectors from different models.
+    """
+    provider = settings.model.lower()
+    model_id = f"{provider}:{EMBEDDING_MODELS.get(provider, provider)}"
+    if provider == "openai" and settings.embedding_truncate_dim:
+        model_id += f"@{settings.embedding_truncate_dim}"
+    return model_id
+
+
+def epoch_seconds(value: Union[datetime, int, float, None]) -> int:
+    """Seconds since the epoch for a datetime (naive ones are taken as UTC) or number; now when None."""
+    if value is None:
+        return int(time.time())
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+
+def type_value(message_type: Any) -> Optional[str]:
+    """MessageType members and plain strings alike, as stored in metadata ("Human", "AI", ...)."""
+    if message_type is None:
+        return None
+    return getattr(message_type, "value", message_type)
+
+
+def vector_metadata(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Filterable metadata stored with every vector. `timestamp` is the message's
+    creation time in epoch seconds so backends can range-filter on it. Keys
+    without a value are left out, since Chroma rejects None.
+    """
+    metadata = {
+        "message_id": record["message_id"],
+        "chunk_index": record.get("chunk_index", 0),
+        "chunk_start": record.get("chunk_start"),
+        "chunk_end": record.get("chunk_end"),
+        "content_hash": record.get("content_hash"),
+        "conversation_id": record["conversation_id"],
+        "user_id": record.get("user_id"),
+        "type": type_value(record.get("type")),
+        "timestamp": epoch_seconds(record.get("created_at")),
+        "embedding_model": embedding_model_id(),
+    }
+    return {key: value for key, value in metadata.items() if value is not None}
+
+
+def matches_filters(
+    metadata: Dict[str, Any],
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    types: Optional[Sequence[Any]] = None,
+    user_id: Optional[int] = None,
+) -> bool:
+    """Python evaluation of the query filters, for backends without a filter engine."""
+    timestamp = metadata.get("timestamp")
+    if (since is not None or until is not None) and not isinstance(timestamp, (int, float)):
+        return False
+    if since is not None and timestamp < epoch_seconds(since):
+        return False
+    if until is not None and timestamp >= epoch_seconds(until):
+        return False
+    if types and metadata.get("type") not in {type_value(t) for t in types}:
+        return False
+    if user_id is not None and metadata.get("user_id") != user_id:
+        return False
+    return True
+
+
+class VectorStore:
+    """
+    Storage backend for message embeddings.
+
+    Query results use Chroma's QueryResult layout (one inner list per query
+    embedding) so callers do not depend on the selected backend.
+
+    A message is stored as one vector per chunk (see app/utils/chunking.py),
+    with id "<message_id>:<chunk_index>". Bulk records passed to `add_many`
+    are dicts with message_id, content (the chunk text), embedding,
+    conversation_id and user_id keys, plus chunk_index, chunk_start,
+    chunk_end, content_hash and the message's type and created_at when known
+    (see `vector_metadata`). `add_many` replaces every chunk of the messages
+    it is given; deletes and `existing_ids` work on message ids.
+
+    Queries can be narrowed before the nearest-neighbour search: `since` and
+    `until` bound the message creation time (half-open), `types` keeps only
+    the given message types, and a query with no `conversation_id` searches
+    all of `user_id`'s conversations.
+    """
+
+    name = "base"
+
+    def add(self, message_id: int, content: str, embedding: List[float], conversation_id: int, user_id: Optional[int] = None) -> None:
+        """Store `content` as the single chunk of a message, unless the message already has vectors."""
+        raise NotImplementedError
+
+    def add_many(self, records: List[Dict[str, Any]]) -> None:
+        """Insert or replace the chunks of many messages in one bulk write."""
+        raise NotImplementedError
+
+    def existing_ids(self, message_ids: List[int], conversation_id: Optional[int] = None, user_id: Optional[int] = None) -> Set[int]:
+        """Subset of `message_ids` that already have a vector from the current embedding model."""
+        raise NotImplementedError
+
+    def query(
+        self,
+        embedding: List[float],
+        conversation_id: Optional[int],
+        top_k: int = 10,
+        user_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        types: Optional[Sequence[Any]] = None,
+    ) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def delete_conversation(self, conversation_id: int, user_id: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def delete_message(self, message_id: int, user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def delete_messages(self, message_ids: List[int], user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> None:
+        """Delete many messages in one call; backends override this with a bulk delete."""
+        for message_id in message_ids:
+            self.delete_message(message_id, user_id=user_id, conversation_id=conversation_id)
+
+    def iter_vectors(self, batch_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield every stored vector in pages of dicts with message_id and
+        conversation_id (plus vector_id, backend routing keys and, where
+        stored, its metadata), for reconciliation.
+        """
+        raise NotImplementedError
+
+    def update_metadata(self, items: List[Dict[str, Any]]) -> None:
+        """Replace the metadata of vectors yielded by `iter_vectors`; items carry a new "metadata" dict."""
+        raise NotImplementedError
+
+    def delete_vectors(self, items: List[Dict[str, Any]]) -> None:
+        """Bulk-delete vectors previously yielded by `iter_vectors`."""
+        raise NotImplementedError
+
+    def similarity(self, distance: float) -> float:
+        """Score in [-1, 1], higher is closer, for a distance returned by `query` (cosine by default)."""
+        return 1.0 - distance
+
+    def close(self) -> None:
+        pass
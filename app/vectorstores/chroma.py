@@ -0,0 +1,230 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+import threading
+import zlib
+from app.config import settings
+from app import providers
+from app.utils.chunking import chunk_id, parse_chunk_id
+from app.vectorstores.base import VectorStore, embedding_model_id, epoch_seconds, type_value, vector_metadata
+from app.vectorstores.hnsw_profiles import collection_space, get_profile
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _create_chroma_client():
+    import chromadb
+    return chromadb.HttpClient(
+        host=settings.chroma_host,
+        port=settings.chroma_port
+    )
+
+
+def _open_collection(name: str):
+    """Get or create a collection; new collections use the configured HNSW profile."""
+    profile = get_profile()
+    expected = profile.collection_metadata()
+    collection = get_chroma_client().get_or_create_collection(name, metadata=expected)
+    actual = collection.metadata or {}
+    if collection_space(actual) != profile.space or any(actual.get(key) != value for key, value in (expected or {}).items()):
+        # HNSW settings are fixed at creation; scores assume the profile's metric.
+        logger.warning(
+            f"Collection {name} was created with different HNSW settings ({actual or 'defaults'}) than the "
+            f"{profile.name} profile; use a new CHROMA_COLLECTION and re-embed to switch profiles."
+        )
+    return collection
+
+
+def _create_collection():
+    return _open_collection(settings.chroma_collection)
+
+
+providers.register("chroma_client", _create_chroma_client)
+providers.register("chroma_collection", _create_collection)
+
+_collection_cache: "OrderedDict[str, object]" = OrderedDict()
+_collection_cache_lock = threading.Lock()
+
+
+def get_chroma_client():
+    return providers.get("chroma_client")
+
+
+def collection_name_for_user(user_id: Optional[int]) -> str:
+    """
+    Route a user to a collection according to settings.chroma_sharding:
+    "none" keeps the single global collection, "user" gives every user their own
+    collection and "bucket" spreads users over chroma_shard_buckets collections.
+    """
+    strategy = settings.chroma_sharding.lower()
+    base = settings.chroma_collection
+    if user_id is None or strategy == "none":
+        return base
+    if strategy == "user":
+        return f"{base}_u{user_id}"
+    if strategy == "bucket":
+        bucket = zlib.crc32(str(user_id).encode()) % settings.chroma_shard_buckets
+        return f"{base}_b{bucket:03d}"
+    raise ValueError(f"Invalid chroma_sharding: {settings.chroma_sharding}")
+
+
+def get_collection_by_name(name: str):
+    if name == settings.chroma_collection:
+        return providers.get("chroma_collection")
+    with _collection_cache_lock:
+        collection = _collection_cache.get(name)
+        if collection is not None:
+            _collection_cache.move_to_end(name)
+            return collection
+    collection = _open_collection(name)
+    with _collection_cache_lock:
+        _collection_cache[name] = collection
+        while len(_collection_cache) > settings.chroma_collection_cache_size:
+            _collection_cache.popitem(last=False)
+    return collection
+
+
+def get_collection(user_id: Optional[int] = None):
+    return get_collection_by_name(collection_name_for_user(user_id))
+
+
+def list_collection_names() -> List[str]:
+    """Message collections, including every shard of settings.chroma_collection."""
+    names = []
+    for collection in get_chroma_client().list_collections():
+        name = collection if isinstance(collection, str) else collection.name
+        if name == settings.chroma_collection or name.startswith(f"{settings.chroma_collection}_"):
+            names.append(name)
+    return sorted(names)
+
+
+def _where(
+    conversation_id: Optional[int],
+    user_id: Optional[int],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    types: Optional[Sequence[Any]],
+) -> Dict[str, Any]:
+    clauses: List[Dict[str, Any]] = [{"embedding_model": embedding_model_id()}]
+    if conversation_id is not None:
+        clauses.append({"conversation_id": conversation_id})
+    elif user_id is not None:
+        clauses.append({"user_id": user_id})
+    else:
+        raise ValueError("A query needs a conversation_id or a user_id")
+    if since is not None:
+        clauses.append({"timestamp": {"$gte": epoch_seconds(since)}})
+    if until is not None:
+        clauses.append({"timestamp": {"$lt": epoch_seconds(until)}})
+    if types:
+        clauses.append({"type": {"$in": [type_value(t) for t in types]}})
+    return {"$and": clauses}
+
+
+class ChromaVectorStore(VectorStore):
+    name = "chroma"
+
+    def similarity(self, distance: float) -> float:
+        return get_profile().similarity(distance)
+
+    def add(self, message_id: int, content: str, embedding: List[float], conversation_id: int, user_id: Optional[int] = None) -> None:
+        get_collection(user_id).add(
+            ids=[chunk_id(message_id, 0)],
+            embeddings=[embedding],
+            metadatas=[vector_metadata({"message_id": message_id, "conversation_id": conversation_id, "user_id": user_id})],
+            documents=[content],
+        )
+
+    def add_many(self, records: List[Dict[str, Any]]) -> None:
+        grouped = defaultdict(lambda: {"ids": [], "embeddings": [], "metadatas": [], "documents": []})
+        for record in records:
+            batch = grouped[collection_name_for_user(record.get("user_id"))]
+            batch["ids"].append(chunk_id(record["message_id"], record.get("chunk_index", 0)))
+            batch["embeddings"].append(record["embedding"])
+            batch["metadatas"].append(vector_metadata(record))
+            batch["documents"].append(record["content"])
+        for name, batch in grouped.items():
+            collection = get_collection_by_name(name)
+            collection.upsert(**batch)
+            # Drop chunks left over from a longer previous version of a message (or its pre-chunking id).
+            message_ids = sorted({parse_chunk_id(vector_id)[0] for vector_id in batch["ids"]})
+            current = collection.get(where={"message_id": {"$in": message_ids}}, include=[])["ids"]
+            stale = sorted(set(current) - set(batch["ids"]))
+            if stale:
+                collection.delete(ids=stale)
+
+    def existing_ids(self, message_ids: List[int], conversation_id: Optional[int] = None, user_id: Optional[int] = None) -> Set[int]:
+        if not message_ids:
+            return set()
+        found = get_collection(user_id).get(
+            where={"$and": [{"message_id": {"$in": list(message_ids)}}, {"embedding_model": embedding_model_id()}]},
+            include=[],
+        )
+        return {parse_chunk_id(vector_id)[0] for vector_id in found["ids"]}
+
+    def query(
+        self,
+        embedding: List[float],
+        conversation_id: Optional[int],
+        top_k: int = 10,
+        user_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        types: Optional[Sequence[Any]] = None,
+    ) -> Dict[str, Any]:
+        return get_collection(user_id).query(
+            query_embeddings=[embedding],
+            n_results=top_k,
+            where=_where(conversation_id, user_id, since, until, types),
+            include=["documents", "metadatas", "distances"],
+        )
+
+    def delete_conversation(self, conversation_id: int, user_id: Optional[int] = None) -> None:
+        get_collection(user_id).delete(where={"conversation_id": conversation_id})
+
+    def delete_message(self, message_id: int, user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> None:
+        get_collection(user_id).delete(where={"message_id": message_id})
+
+    def delete_messages(self, message_ids: List[int], user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> None:
+        if message_ids:
+            get_collection(user_id).delete(where={"message_id": {"$in": list(message_ids)}})
+
+    def iter_vectors(self, batch_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        # Chroma pages by offset, so vectors deleted while iterating can shift a few
+        # later ones past this pass; they are picked up by the next one.
+        for name in list_collection_names():
+            collection = get_collection_by_name(name)
+            offset = 0
+            while True:
+                page = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+                if not page["ids"]:
+                    break
+                metadatas = page["metadatas"] or [{} for _ in page["ids"]]
+                yield [
+                    {
+                        "vector_id": vector_id,
+                        "message_id": parse_chunk_id(vector_id)[0],
+                        "conversation_id": (metadata or {}).get("conversation_id"),
+                        "collection": name,
+                        "metadata": metadata or {},
+                    }
+                    for vector_id, metadata in zip(page["ids"], metadatas)
+                ]
+                offset += len(page["ids"])
+
+    def delete_vectors(self, items: List[Dict[str, Any]]) -> None:
+        grouped: Dict[str, List[str]] = defaultdict(list)
+        for item in items:
+            grouped[item["collection"]].append(item["vector_id"])
+        for name, ids in grouped.items():
+            get_collection_by_name(name).delete(ids=ids)
+
+    def update_metadata(self, items: List[Dict[str, Any]]) -> None:
+        grouped: Dict[str, Dict[str, list]] = defaultdict(lambda: {"ids": [], "metadatas": []})
+        for item in items:
+            batch = grouped[item["collection"]]
+            batch["ids"].append(item["vector_id"])
+            batch["metadatas"].append(item["metadata"])
+        for name, batch in grouped.items():
+            get_collection_by_name(name).update(**batch)
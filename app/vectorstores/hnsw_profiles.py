@@ -0,0 +1,61 @@
+"""
+Named HNSW settings for Chroma collections, selected with CHROMA_HNSW_PROFILE.
+
+Chroma fixes the distance metric, M and ef_construction when a collection is
+created; existing collections keep theirs. Switching profiles therefore means a
+new CHROMA_COLLECTION and a re-embed. Compare profiles on your own data with
+`python -m benchmarks.hnsw_recall` first.
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+from app.config import settings
+
+
+@dataclass(frozen=True)
+class HnswProfile:
+    name: str
+    space: str
+    m: int
+    ef_construction: int
+    ef_search: int
+
+    def collection_metadata(self) -> Optional[Dict[str, object]]:
+        # The default profile creates collections exactly as before profiles existed.
+        if self.name == "default":
+            return None
+        return {
+            "hnsw:space": self.space,
+            "hnsw:M": self.m,
+            "hnsw:construction_ef": self.ef_construction,
+            "hnsw:search_ef": self.ef_search,
+        }
+
+    def similarity(self, distance: float) -> float:
+        # Squared L2 between unit-length embeddings is 2 - 2 * cosine; cosine and ip distances are 1 - cosine.
+        if self.space == "l2":
+            return 1.0 - distance / 2.0
+        return 1.0 - distance
+
+
+PROFILES: Dict[str, HnswProfile] = {
+    profile.name: profile
+    for profile in [
+        HnswProfile("default", "l2", m=16, ef_construction=100, ef_search=100),
+        HnswProfile("fast", "cosine", m=12, ef_construction=100, ef_search=32),
+        HnswProfile("balanced", "cosine", m=16, ef_construction=200, ef_search=64),
+        HnswProfile("recall", "cosine", m=32, ef_construction=400, ef_search=200),
+    ]
+}
+
+
+def get_profile(name: Optional[str] = None) -> HnswProfile:
+    name = (name or settings.chroma_hnsw_profile).lower()
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Invalid chroma_hnsw_profile: {name} (expected one of {', '.join(PROFILES)})")
+
+
+def collection_space(metadata: Optional[Dict[str, object]]) -> str:
+    """Distance metric of an existing collection from its metadata."""
+    return str((metadata or {}).get("hnsw:space", "l2"))
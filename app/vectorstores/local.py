@@ -0,0 +1,532 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+import fcntl
+import heapq
+import json
+import os
+import re
+import shutil
+import threading
+import numpy as np
+from app.utils.chunking import chunk_id
+from app.vectorstores.base import VectorStore, empty_query_result, matches_filters, vector_metadata
+from app.vectorstores import quantization
+
+META_FILE = "meta.json"
+# Per-user lists of conversation ids, so user-wide queries only load that user's conversations.
+USERS_DIR = "_users"
+USERS_COMPLETE = ".complete"
+# Per-conversation lock files, flock'ed so worker processes sharing the root don't interleave writes.
+# Kept outside the conversation directories, which delete_conversation removes.
+LOCKS_DIR = "_locks"
+
+# Files holding the vectors of a conversation for each storage dtype, in write order.
+# "int8" keeps float32 originals next to the codes so candidates can be rescored exactly;
+# only the codes are scanned, the originals are paged in for the few candidates.
+_ARRAYS = {
+    "float32": [("vectors", np.float32, True)],
+    "float16": [("vectors", np.float16, True)],
+    "int8": [("full", np.float32, True), ("scales", np.float32, False), ("codes", np.int8, True)],
+}
+
+
+_SUFFIXES = {"float32": "f32", "float16": "f16", "int8": "i8"}
+
+
+def _array_file(name: str, dtype, generation: int) -> str:
+    return f"{name}.{generation}.{_SUFFIXES[np.dtype(dtype).name]}"
+
+
+def model_dir(model_id: str) -> str:
+    """Directory name for an embedding model id, e.g. "openai:text-embedding-3-small" -> "openai_text-embedding-3-small"."""
+    return re.sub(r"[^A-Za-z0-9_.@-]+", "_", model_id)
+
+
+def _records_file(generation: int) -> str:
+    return f"records.{generation}.jsonl"
+
+
+def _message_id(record: Dict[str, Any]) -> int:
+    """Parent message of a row; rows written before chunking use the message id as row id."""
+    return int(record["metadata"].get("message_id", record["id"]))
+
+
+def _row_bytes(dtype, per_component: bool, dim: int) -> int:
+    return np.dtype(dtype).itemsize * (dim if per_component else 1)
+
+
+def _read_meta(path: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"dim": 0, "generation": 0}
+
+
+def _write_meta(path: str, meta: Dict[str, Any]) -> None:
+    tmp = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+
+def _version(path: str) -> Tuple[int, int, int]:
+    meta = _read_meta(path)
+    try:
+        stat = os.stat(os.path.join(path, _records_file(meta["generation"])))
+        return (meta["generation"], stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        return (meta["generation"], 0, 0)
+
+
+class _ConversationIndex:
+    """Memory-mapped, L2-normalized vectors for one conversation plus their row records."""
+
+    def __init__(self, path: str):
+        self.path = path
+        meta = _read_meta(path)
+        self.dim = int(meta["dim"])
+        self.generation = int(meta["generation"])
+        self.dtype = meta.get("dtype", "float32")
+        self.version = _version(path)
+        records: List[Dict[str, Any]] = []
+        records_path = os.path.join(path, _records_file(self.generation))
+        if os.path.exists(records_path):
+            with open(records_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break  # torn write at the tail
+        # Vectors are appended before records, so a crash can only leave extra vector bytes.
+        rows = len(records) if self.dim else 0
+        for name, dtype, per_component in _ARRAYS[self.dtype]:
+            file_path = os.path.join(path, _array_file(name, dtype, self.generation))
+            size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            rows = min(rows, size // _row_bytes(dtype, per_component, self.dim)) if self.dim else 0
+        self.records = records[:rows]
+        self.ids = {_message_id(record) for record in self.records}
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, dtype, per_component in _ARRAYS[self.dtype]:
+            shape = (rows, self.dim) if per_component else (rows,)
+            if rows:
+                file_path = os.path.join(path, _array_file(name, dtype, self.generation))
+                self.arrays[name] = np.memmap(file_path, dtype=dtype, mode="r", shape=shape)
+            else:
+                self.arrays[name] = np.empty(shape, dtype=dtype)
+
+    def vector_rows(self, keep: List[int]) -> np.ndarray:
+        """Full-precision rows, used when rewriting a generation."""
+        source = self.arrays["full"] if self.dtype == "int8" else self.arrays["vectors"]
+        return np.asarray(source[keep], dtype=np.float32)
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def _encode(vectors: np.ndarray, dtype: str) -> Dict[str, np.ndarray]:
+    vectors = np.atleast_2d(vectors).astype(np.float32)
+    if dtype == "float32":
+        return {"vectors": vectors}
+    if dtype == "float16":
+        return {"vectors": vectors.astype(np.float16)}
+    codes, scales = quantization.quantize_int8(vectors)
+    return {"full": vectors, "scales": scales, "codes": codes}
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process backend: one directory per conversation holding memory-mapped
+    vectors and a JSONL file of row records. Top-k is a single matrix-vector
+    product, so small conversations never pay a network hop.
+
+    Vectors are stored as float32, float16 or int8 codes (rescored against
+    float32 originals) per `storage_dtype`; a conversation keeps the dtype it
+    was created with. Rewrites (deletes, replaced rows) produce a new file
+    generation and switch to it by atomically replacing meta.json. Distances
+    are cosine distances.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, cache_size: int = 1024, storage_dtype: str = "float32", rescore_factor: int = 4):
+        if storage_dtype not in quantization.STORAGE_DTYPES:
+            raise ValueError(f"Invalid storage dtype: {storage_dtype}")
+        self.root = root
+        self.cache_size = cache_size
+        self.storage_dtype = storage_dtype
+        self.rescore_factor = rescore_factor
+        self._cache: "OrderedDict[int, _ConversationIndex]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._locks: Dict[int, threading.Lock] = {}
+        self._user_conversations: Dict[int, Set[int]] = {}
+        self._users_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, conversation_id: int) -> str:
+        return os.path.join(self.root, str(int(conversation_id)))
+
+    def _lock(self, conversation_id: int) -> threading.Lock:
+        with self._cache_lock:
+            return self._locks.setdefault(conversation_id, threading.Lock())
+
+    @contextmanager
+    def _locked(self, conversation_id: int, shared: bool = False) -> Iterator[None]:
+        """
+        Hold the conversation's thread lock and an flock on its lock file:
+        exclusive for writers, shared for readers, which must not see a rewrite
+        half done.
+        """
+        with self._lock(conversation_id):
+            os.makedirs(os.path.join(self.root, LOCKS_DIR), exist_ok=True)
+            with open(os.path.join(self.root, LOCKS_DIR, f"{int(conversation_id)}.lock"), "ab") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _invalidate(self, conversation_id: int) -> None:
+        with self._cache_lock:
+            self._cache.pop(conversation_id, None)
+
+    def _load(self, conversation_id: int) -> _ConversationIndex:
+        path = self._path(conversation_id)
+        version = _version(path)
+        with self._cache_lock:
+            index = self._cache.get(conversation_id)
+            # Another worker process may have written since we cached the mapping.
+            if index is not None and index.version == version:
+                self._cache.move_to_end(conversation_id)
+                return index
+        with self._locked(conversation_id, shared=True):
+            index = _ConversationIndex(path)
+        with self._cache_lock:
+            self._cache[conversation_id] = index
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return index
+
+    def add(self, message_id: int, content: str, embedding: List[float], conversation_id: int, user_id: Optional[int] = None) -> None:
+        record = {
+            "id": chunk_id(message_id, 0),
+            "document": content,
+            "metadata": vector_metadata({"message_id": message_id, "conversation_id": conversation_id, "user_id": user_id}),
+        }
+        self._write_rows(conversation_id, [(record, _normalize(embedding))], replace=False)
+
+    def add_many(self, records: List[Dict[str, Any]]) -> None:
+        by_conversation: Dict[int, List[Tuple[Dict[str, Any], np.ndarray]]] = {}
+        for record in records:
+            rows = by_conversation.setdefault(int(record["conversation_id"]), [])
+            row = {
+                "id": chunk_id(record["message_id"], record.get("chunk_index", 0)),
+                "document": record["content"],
+                "metadata": vector_metadata(record),
+            }
+            rows.append((row, _normalize(record["embedding"])))
+        for conversation_id, rows in by_conversation.items():
+            self._write_rows(conversation_id, rows, replace=True)
+
+    def _write_rows(self, conversation_id: int, rows: List[Tuple[Dict[str, Any], np.ndarray]], replace: bool) -> None:
+        """
+        Append rows in one write per file. With `replace`, every existing row
+        of the given messages is dropped first; otherwise messages that already
+        have rows are skipped.
+        """
+        path = self._path(conversation_id)
+        with self._locked(conversation_id):
+            index = _ConversationIndex(path)
+            unique: Dict[str, Tuple[Dict[str, Any], np.ndarray]] = {}
+            for record, vector in rows:
+                if replace or _message_id(record) not in index.ids:
+                    unique[record["id"]] = (record, vector)
+            if not unique:
+                return
+            dim = next(iter(unique.values()))[1].shape[0]
+            if any(vector.shape[0] != dim for _, vector in unique.values()) or (index.dim and index.dim != dim):
+                raise ValueError(f"Embedding dimension {dim} does not match index dimension {index.dim or dim}")
+            records = [record for record, _ in unique.values()]
+            vectors = np.stack([vector for _, vector in unique.values()])
+            replaced = index.ids & {_message_id(record) for record in records}
+            if replaced:
+                keep = [i for i, record in enumerate(index.records) if _message_id(record) not in replaced]
+                self._rewrite(path, index, keep, vectors, records)
+            else:
+                self._append(path, index, dim, vectors, records)
+        self._invalidate(conversation_id)
+        for user_id in {record["metadata"].get("user_id") for record in records} - {None}:
+            self._register_conversation(int(user_id), conversation_id)
+
+    def _manifest(self, user_id: int) -> str:
+        return os.path.join(self.root, USERS_DIR, f"{int(user_id)}.txt")
+
+    def _read_manifest(self, user_id: int) -> Set[int]:
+        try:
+            with open(self._manifest(user_id), "r", encoding="utf-8") as f:
+                return {int(line) for line in f if line.strip().isdigit()}
+        except FileNotFoundError:
+            return set()
+
+    def _register_conversation(self, user_id: int, conversation_id: int) -> None:
+        with self._users_lock:
+            known = self._user_conversations.get(user_id)
+            if known is None:
+                known = self._user_conversations[user_id] = self._read_manifest(user_id)
+            if conversation_id in known:
+                return
+            os.makedirs(os.path.join(self.root, USERS_DIR), exist_ok=True)
+            with open(self._manifest(user_id), "a", encoding="utf-8") as f:
+                # Other worker processes append to the same manifest.
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    f.write(f"{int(conversation_id)}\n")
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            known.add(conversation_id)
+
+    def _build_manifests(self) -> None:
+        """One-time scan that registers conversations written before manifests existed."""
+        owners: Dict[int, Set[int]] = {}
+        for name in os.listdir(self.root):
+            if name.isdigit():
+                for record in self._load(int(name)).records:
+                    user_id = record["metadata"].get("user_id")
+                    if user_id is not None:
+                        owners.setdefault(int(user_id), set()).add(int(name))
+        for user_id, conversation_ids in owners.items():
+            for conversation_id in sorted(conversation_ids):
+                self._register_conversation(user_id, conversation_id)
+        with open(os.path.join(self.root, USERS_DIR, USERS_COMPLETE), "w", encoding="utf-8") as f:
+            f.write(datetime.now().isoformat())
+
+    def conversations_for_user(self, user_id: int) -> Set[int]:
+        if not os.path.exists(os.path.join(self.root, USERS_DIR, USERS_COMPLETE)):
+            os.makedirs(os.path.join(self.root, USERS_DIR), exist_ok=True)
+            self._build_manifests()
+        # Re-read: other worker processes append to the manifest too.
+        with self._users_lock:
+            self._user_conversations[user_id] = self._read_manifest(user_id)
+            return set(self._user_conversations[user_id])
+
+    def _append(self, path: str, index: _ConversationIndex, dim: int, vectors: np.ndarray, records: List[Dict[str, Any]]) -> None:
+        generation, rows = index.generation, len(index.records)
+        dtype = index.dtype if index.dim else self.storage_dtype
+        del index
+        os.makedirs(path, exist_ok=True)
+        if not os.path.exists(os.path.join(path, META_FILE)):
+            _write_meta(path, {"dim": int(dim), "generation": generation, "dtype": dtype})
+        encoded = _encode(vectors, dtype)
+        for name, array_dtype, per_component in _ARRAYS[dtype]:
+            with open(os.path.join(path, _array_file(name, array_dtype, generation)), "ab") as f:
+                f.truncate(rows * _row_bytes(array_dtype, per_component, dim))
+                f.write(encoded[name].tobytes())
+        self._truncate_records(path, generation, rows)
+        with open(os.path.join(path, _records_file(generation)), "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+
+    @staticmethod
+    def _truncate_records(path: str, generation: int, rows: int) -> None:
+        """Drop record lines beyond `rows` left behind by an interrupted append."""
+        records_path = os.path.join(path, _records_file(generation))
+        if not os.path.exists(records_path):
+            return
+        with open(records_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        if len(lines) == rows and (not lines or lines[-1].endswith("\n")):
+            return
+        with open(records_path, "w", encoding="utf-8") as f:
+            f.writelines(lines[:rows])
+
+    def query(
+        self,
+        embedding: List[float],
+        conversation_id: Optional[int],
+        top_k: int = 10,
+        user_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        types: Optional[Sequence[Any]] = None,
+    ) -> Dict[str, Any]:
+        if top_k <= 0:
+            return empty_query_result()
+        query = _normalize(embedding)
+        if conversation_id is not None:
+            # The directory already scopes to the conversation; user_id only routes.
+            matches = self._search(self._load(conversation_id), query, top_k, since, until, types, None)
+        elif user_id is not None:
+            matches = []
+            for user_conversation_id in self.conversations_for_user(user_id):
+                if os.path.isdir(self._path(user_conversation_id)):
+                    matches.extend(self._search(self._load(user_conversation_id), query, top_k, since, until, types, user_id))
+            matches = heapq.nlargest(top_k, matches, key=lambda match: match[0])
+        else:
+            raise ValueError("A query needs a conversation_id or a user_id")
+        return {
+            "ids": [[str(record["id"]) for _, record in matches]],
+            "documents": [[record["document"] for _, record in matches]],
+            "metadatas": [[record["metadata"] for _, record in matches]],
+            "distances": [[float(1.0 - score) for score, _ in matches]],
+        }
+
+    def _search(
+        self,
+        index: _ConversationIndex,
+        query: np.ndarray,
+        top_k: int,
+        since: Optional[datetime],
+        until: Optional[datetime],
+        types: Optional[Sequence[Any]],
+        user_id: Optional[int],
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """(score, record) pairs of the best rows passing the filters, best first."""
+        if not index.records:
+            return []
+        rows: Optional[np.ndarray] = None
+        if since is not None or until is not None or types or user_id is not None:
+            # Filter first so only the surviving rows are scored.
+            rows = np.fromiter(
+                (i for i, record in enumerate(index.records) if matches_filters(record["metadata"], since, until, types, user_id)),
+                dtype=np.int64,
+            )
+            if not rows.size:
+                return []
+
+        def view(name: str) -> np.ndarray:
+            return index.arrays[name] if rows is None else index.arrays[name][rows]
+
+        if index.dtype == "int8":
+            top, scores = quantization.search(
+                query,
+                view("codes"),
+                top_k,
+                scales=view("scales"),
+                full=view("full"),
+                rescore_factor=self.rescore_factor,
+            )
+        else:
+            top, scores = quantization.search(query, view("vectors"), top_k)
+        if rows is not None:
+            top = rows[top]
+        return [(float(score), index.records[i]) for i, score in zip(top, scores)]
+
+    def delete_conversation(self, conversation_id: int, user_id: Optional[int] = None) -> None:
+        with self._locked(conversation_id):
+            shutil.rmtree(self._path(conversation_id), ignore_errors=True)
+        self._invalidate(conversation_id)
+
+    def delete_message(self, message_id: int, user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> None:
+        if conversation_id is not None:
+            self._delete_rows(conversation_id, {message_id})
+            return
+        # Without the conversation we have to find the directory that holds the row.
+        for name in os.listdir(self.root):
+            if name.isdigit():
+                self._delete_rows(int(name), {message_id})
+
+    def delete_messages(self, message_ids: List[int], user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> None:
+        if conversation_id is None:
+            super().delete_messages(message_ids, user_id=user_id)
+            return
+        self._delete_rows(conversation_id, set(message_ids))
+
+    def iter_vectors(self, batch_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        conversation_ids = sorted(int(name) for name in os.listdir(self.root) if name.isdigit())
+        for conversation_id in conversation_ids:
+            records = self._load(conversation_id).records
+            for start in range(0, len(records), batch_size):
+                yield [
+                    {"vector_id": record["id"], "message_id": _message_id(record), "conversation_id": conversation_id, "metadata": record["metadata"]}
+                    for record in records[start:start + batch_size]
+                ]
+
+    def delete_vectors(self, items: List[Dict[str, Any]]) -> None:
+        by_conversation: Dict[int, set] = {}
+        for item in items:
+            by_conversation.setdefault(int(item["conversation_id"]), set()).add(item["message_id"])
+        for conversation_id, message_ids in by_conversation.items():
+            self._delete_rows(conversation_id, message_ids)
+
+    def update_metadata(self, items: List[Dict[str, Any]]) -> None:
+        by_conversation: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        for item in items:
+            by_conversation.setdefault(int(item["conversation_id"]), {})[item["vector_id"]] = item["metadata"]
+        for conversation_id, metadata in by_conversation.items():
+            path = self._path(conversation_id)
+            with self._locked(conversation_id):
+                index = _ConversationIndex(path)
+                if not any(record["id"] in metadata for record in index.records):
+                    continue
+                records = [
+                    dict(record, metadata=metadata[record["id"]]) if record["id"] in metadata else record
+                    for record in index.records
+                ]
+                generation = index.generation
+                del index
+                # Vectors are untouched; only the records file of the current generation is swapped.
+                records_path = os.path.join(path, _records_file(generation))
+                with open(records_path + ".tmp", "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(record) + "\n" for record in records)
+                os.replace(records_path + ".tmp", records_path)
+            self._invalidate(conversation_id)
+
+    def _delete_rows(self, conversation_id: int, message_ids: set) -> None:
+        path = self._path(conversation_id)
+        with self._locked(conversation_id):
+            index = _ConversationIndex(path)
+            keep = [i for i, record in enumerate(index.records) if _message_id(record) not in message_ids]
+            if len(keep) == len(index.records):
+                return
+            self._rewrite(path, index, keep)
+        self._invalidate(conversation_id)
+
+    def _rewrite(
+        self,
+        path: str,
+        index: _ConversationIndex,
+        keep: List[int],
+        extra_vectors: Optional[np.ndarray] = None,
+        extra_records: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """Write the kept rows plus any new ones as the next generation and switch meta.json to it."""
+        vectors = index.vector_rows(keep) if keep else np.empty((0, index.dim), dtype=np.float32)
+        records = [index.records[i] for i in keep]
+        if extra_vectors is not None:
+            vectors = np.concatenate([vectors, extra_vectors.astype(np.float32)])
+            records += extra_records or []
+        old_generation, dim, dtype = index.generation, index.dim, index.dtype
+        del index
+        generation = old_generation + 1
+        encoded = _encode(vectors, dtype) if records else {}
+        for name, array_dtype, _ in _ARRAYS[dtype]:
+            with open(os.path.join(path, _array_file(name, array_dtype, generation)), "wb") as f:
+                if records:
+                    f.write(encoded[name].tobytes())
+        with open(os.path.join(path, _records_file(generation)), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        _write_meta(path, {"dim": dim, "generation": generation, "dtype": dtype})
+        old_files = [_array_file(name, array_dtype, old_generation) for name, array_dtype, _ in _ARRAYS[dtype]]
+        for name in old_files + [_records_file(old_generation)]:
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+
+    def existing_ids(self, message_ids: List[int], conversation_id: Optional[int] = None, user_id: Optional[int] = None) -> Set[int]:
+        wanted = set(message_ids)
+        if conversation_id is not None:
+            return wanted & self._load(conversation_id).ids
+        found: Set[int] = set()
+        for name in os.listdir(self.root):
+            if name.isdigit():
+                found |= wanted & self._load(int(name)).ids
+        return found
+
+    def close(self) -> None:
+        with self._cache_lock:
+            self._cache.clear()
@@ -0,0 +1,357 @@
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import and_, case, cast, func, select, delete, literal, null, text, union_all, Float, String
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from pgvector.sqlalchemy import HALFVEC
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.message import Message, MessageType
+from app.models.message_embedding import MessageEmbedding
+from app.utils.chunking import chunk_id
+from app.vectorstores.base import VectorStore, embedding_model_id, epoch_seconds, type_value
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Whether the installed pgvector (0.8+) has iterative index scans; checked once per process.
+_iterative_scan_supported: Optional[bool] = None
+
+
+def _supports_iterative_scan(db: Session) -> bool:
+    global _iterative_scan_supported
+    if _iterative_scan_supported is None:
+        version = db.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar() or "0"
+        _iterative_scan_supported = tuple(int(part) for part in version.split(".")[:2] if part.isdigit()) >= (0, 8)
+        if not _iterative_scan_supported and settings.pgvector_iterative_scan:
+            logger.warning(
+                f"pgvector {version} has no iterative index scans; conversation-scoped queries use an exact scan, "
+                "and user-scoped ones can return fewer than top_k rows. Upgrade to pgvector 0.8 or later."
+            )
+    return _iterative_scan_supported
+
+
+def _apply_search_settings(db: Session, conversation_id: Optional[int] = None) -> bool:
+    """
+    Per-transaction ANN knobs; SET LOCAL keeps them from leaking into pooled
+    connections. The index filters by conversation and user after the scan,
+    so without an iterative scan a scoped query can come back short. Returns
+    whether the query should skip the index for an exact scan instead, which
+    is the case for conversation-scoped queries, as they only cover a few rows.
+    """
+    iterative = bool(settings.pgvector_iterative_scan) and _supports_iterative_scan(db)
+    if settings.pgvector_index.lower() == "ivfflat":
+        db.execute(text(f"SET LOCAL ivfflat.probes = {int(settings.pgvector_ivfflat_probes)}"))
+        if iterative:
+            db.execute(text("SELECT set_config('ivfflat.iterative_scan', :mode, true)"), {"mode": settings.pgvector_iterative_scan})
+    else:
+        db.execute(text(f"SET LOCAL hnsw.ef_search = {int(settings.pgvector_hnsw_ef_search)}"))
+        if iterative:
+            db.execute(text("SELECT set_config('hnsw.iterative_scan', :mode, true)"), {"mode": settings.pgvector_iterative_scan})
+    return not iterative and conversation_id is not None
+
+
+def _chunk_text(chunk_start, chunk_end):
+    """The chunk's span of messages.content, or all of it for rows without a span."""
+    return case(
+        (chunk_start.is_(None), Message.content),
+        else_=func.substr(Message.content, chunk_start + 1, chunk_end - chunk_start),
+    )
+
+
+def _same_message(embeddings):
+    """Join condition to `messages`; conversation_id lets Postgres probe a single hash partition."""
+    return and_(Message.message_id == embeddings.message_id, Message.conversation_id == embeddings.conversation_id)
+
+
+def _metadata(row) -> Dict[str, Any]:
+    return {
+        "message_id": row.message_id,
+        "chunk_index": row.chunk_index,
+        "conversation_id": row.conversation_id,
+        "user_id": row.user_id,
+        "type": type_value(row.type),
+        "timestamp": epoch_seconds(row.created_at),
+    }
+
+
+def _filters(
+    conversation_id: Optional[int],
+    user_id: Optional[int],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    types: Optional[Sequence[Any]],
+) -> Tuple[list, bool]:
+    """
+    WHERE clauses for a semantic query and whether they touch `messages`.
+    Time and type live on `messages`, so those filters need the join before
+    the ANN ordering; scope and model filters stay on message_embeddings.
+    """
+    clauses = [MessageEmbedding.embedding_model == embedding_model_id()]
+    if conversation_id is not None:
+        clauses.append(MessageEmbedding.conversation_id == conversation_id)
+    elif user_id is not None:
+        clauses.append(MessageEmbedding.user_id == user_id)
+    else:
+        raise ValueError("A query needs a conversation_id or a user_id")
+    if since is not None:
+        clauses.append(Message.created_at >= since)
+    if until is not None:
+        clauses.append(Message.created_at < until)
+    if types:
+        clauses.append(Message.type.in_([MessageType(type_value(t)) for t in types]))
+    return clauses, since is not None or until is not None or bool(types)
+
+
+class PgVectorStore(VectorStore):
+    """
+    Embeddings stored next to `messages` in Postgres. Chunk documents are cut
+    from messages.content by their stored span through a join instead of being
+    duplicated, and the foreign keys cascade deletes of messages and
+    conversations to their vectors.
+    """
+
+    name = "pgvector"
+
+    def add(self, message_id: int, content: str, embedding: List[float], conversation_id: int, user_id: Optional[int] = None) -> None:
+        with SessionLocal() as db:
+            if user_id is None:
+                user_id = db.execute(select(Message.user_id).where(Message.message_id == message_id, Message.conversation_id == conversation_id)).scalar_one()
+            db.execute(
+                insert(MessageEmbedding)
+                .values(message_id=message_id, conversation_id=conversation_id, user_id=user_id, embedding=embedding, embedding_model=embedding_model_id())
+                .on_conflict_do_nothing(index_elements=[MessageEmbedding.message_id, MessageEmbedding.chunk_index])
+            )
+            db.commit()
+
+    def add_many(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        model = embedding_model_id()
+        with SessionLocal() as db:
+            missing = [r["message_id"] for r in records if r.get("user_id") is None]
+            owners = dict(db.execute(select(Message.message_id, Message.user_id).where(Message.message_id.in_(missing))).all()) if missing else {}
+            # Replace every chunk of these messages; the delete and insert commit together.
+            db.execute(delete(MessageEmbedding).where(MessageEmbedding.message_id.in_({r["message_id"] for r in records})))
+            statement = insert(MessageEmbedding).values([
+                {
+                    "message_id": r["message_id"],
+                    "chunk_index": r.get("chunk_index", 0),
+                    "chunk_start": r.get("chunk_start"),
+                    "chunk_end": r.get("chunk_end"),
+                    "conversation_id": r["conversation_id"],
+                    "user_id": r.get("user_id") or owners[r["message_id"]],
+                    "embedding": r["embedding"],
+                    "embedding_model": model,
+                }
+                for r in records
+            ])
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[MessageEmbedding.message_id, MessageEmbedding.chunk_index],
+                set_={
+                    "embedding": statement.excluded.embedding,
+                    "embedding_model": statement.excluded.embedding_model,
+                    "chunk_start": statement.excluded.chunk_start,
+                    "chunk_end": statement.excluded.chunk_end,
+                },
+            ))
+            db.commit()
+
+    def existing_ids(self, message_ids: List[int], conversation_id: Optional[int] = None, user_id: Optional[int] = None) -> Set[int]:
+        if not message_ids:
+            return set()
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(MessageEmbedding.message_id).where(
+                    MessageEmbedding.message_id.in_(message_ids),
+                    MessageEmbedding.embedding_model == embedding_model_id(),
+                )
+            ).scalars().all()
+        return set(rows)
+
+    def query(
+        self,
+        embedding: List[float],
+        conversation_id: Optional[int],
+        top_k: int = 10,
+        user_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        types: Optional[Sequence[Any]] = None,
+    ) -> Dict[str, Any]:
+        with SessionLocal() as db:
+            exact = _apply_search_settings(db, conversation_id)
+            rows = db.execute(
+                self._semantic_select(embedding, conversation_id, top_k, user_id=user_id, since=since, until=until, types=types, exact=exact)
+            ).all()
+        return {
+            "ids": [[chunk_id(row.message_id, row.chunk_index) for row in rows]],
+            "documents": [[row.content for row in rows]],
+            "metadatas": [[_metadata(row) for row in rows]],
+            "distances": [[float(row.distance) for row in rows]],
+        }
+
+    def query_with_recent(
+        self, db: Session, embedding: List[float], conversation_id: int, top_k: int, recent_n: int, since: Optional[datetime] = None
+    ) -> Tuple[List[Any], List[str]]:
+        """
+        Fetch the last `recent_n` Human/AI messages and the `top_k` semantic
+        matches in a single round trip. Returns (recent rows oldest first, semantic documents).
+        """
+        recent = (
+            select(
+                literal("recent", String).label("kind"),
+                Message.message_id,
+                Message.type,
+                Message.content,
+                Message.created_at,
+                null().cast(Float).label("distance"),
+                Message.write_id,
+            )
+            .where(
+                Message.conversation_id == conversation_id,
+                Message.type.in_([MessageType.HUMAN, MessageType.AI]),
+            )
+            .order_by(Message.created_at.desc(), Message.message_id.desc())
+            .limit(recent_n)
+            .subquery()
+        )
+        exact = _apply_search_settings(db, conversation_id)
+        semantic = self._semantic_select(embedding, conversation_id, top_k, since=since, exact=exact).subquery()
+        statement = union_all(
+            select(recent),
+            select(
+                literal("semantic", String).label("kind"),
+                semantic.c.message_id,
+                semantic.c.type,
+                semantic.c.content,
+                semantic.c.created_at,
+                semantic.c.distance,
+                null().cast(String).label("write_id"),
+            ),
+        )
+        rows = db.execute(statement).all()
+        recent_rows = sorted((row for row in rows if row.kind == "recent"), key=lambda row: row.created_at)
+        semantic_docs: List[str] = []
+        seen: Set[int] = set()
+        # Keep only the best chunk of each message.
+        for row in sorted((row for row in rows if row.kind == "semantic"), key=lambda row: row.distance):
+            if row.message_id not in seen:
+                seen.add(row.message_id)
+                semantic_docs.append(row.content)
+        return recent_rows, semantic_docs
+
+    def _semantic_select(
+        self,
+        embedding: List[float],
+        conversation_id: Optional[int],
+        top_k: int,
+        user_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        types: Optional[Sequence[Any]] = None,
+        exact: bool = False,
+    ):
+        clauses, on_messages = _filters(conversation_id, user_id, since, until, types)
+        if settings.embedding_storage_dtype.lower() == "float16" and not exact:
+            return self._rescored_select(embedding, top_k, clauses, on_messages)
+        distance = MessageEmbedding.embedding.cosine_distance(embedding)
+        # The index only serves ORDER BY the bare distance; `+ 0` makes an exact
+        # scan of the rows the conversation_id index returns.
+        order = distance + 0 if exact else distance
+        return (
+            select(
+                Message.message_id,
+                MessageEmbedding.chunk_index,
+                Message.conversation_id,
+                Message.user_id,
+                Message.type,
+                _chunk_text(MessageEmbedding.chunk_start, MessageEmbedding.chunk_end).label("content"),
+                Message.created_at,
+                distance.label("distance"),
+            )
+            .join(Message, _same_message(MessageEmbedding))
+            .where(*clauses)
+            .order_by(order)
+            .limit(top_k)
+        )
+
+    def _rescored_select(self, embedding: List[float], top_k: int, clauses: list, join_messages: bool = False):
+        """
+        Preselect `top_k * embedding_rescore_factor` candidates through the
+        halfvec index, then re-rank them by full-precision distance.
+        """
+        half = HALFVEC(settings.embedding_dimensions)
+        approximate = cast(MessageEmbedding.embedding, half).cosine_distance(cast(embedding, half))
+        candidates = select(
+            MessageEmbedding.message_id,
+            MessageEmbedding.conversation_id,
+            MessageEmbedding.chunk_index,
+            MessageEmbedding.chunk_start,
+            MessageEmbedding.chunk_end,
+            MessageEmbedding.embedding,
+        )
+        if join_messages:
+            candidates = candidates.join(Message, _same_message(MessageEmbedding))
+        candidates = (
+            candidates.where(*clauses)
+            .order_by(approximate)
+            .limit(top_k * max(1, settings.embedding_rescore_factor))
+            .subquery()
+        )
+        distance = candidates.c.embedding.cosine_distance(embedding)
+        return (
+            select(
+                Message.message_id,
+                candidates.c.chunk_index,
+                Message.conversation_id,
+                Message.user_id,
+                Message.type,
+                _chunk_text(candidates.c.chunk_start, candidates.c.chunk_end).label("content"),
+                Message.created_at,
+                distance.label("distance"),
+            )
+            .join(Message, _same_message(candidates.c))
+            .order_by(distance)
+            .limit(top_k)
+        )
+
+    def delete_conversation(self, conversation_id: int, user_id: Optional[int] = None) -> None:
+        with SessionLocal() as db:
+            db.execute(delete(MessageEmbedding).where(MessageEmbedding.conversation_id == conversation_id))
+            db.commit()
+
+    def delete_message(self, message_id: int, user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> None:
+        with SessionLocal() as db:
+            db.execute(delete(MessageEmbedding).where(MessageEmbedding.message_id == message_id))
+            db.commit()
+
+    def delete_messages(self, message_ids: List[int], user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> None:
+        if not message_ids:
+            return
+        with SessionLocal() as db:
+            db.execute(delete(MessageEmbedding).where(MessageEmbedding.message_id.in_(message_ids)))
+            db.commit()
+
+    def iter_vectors(self, batch_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        last_id = 0
+        while True:
+            with SessionLocal() as db:
+                # One entry per message, so pages never split a message's chunks.
+                rows = db.execute(
+                    select(MessageEmbedding.message_id, MessageEmbedding.conversation_id)
+                    .distinct()
+                    .where(MessageEmbedding.message_id > last_id)
+                    .order_by(MessageEmbedding.message_id)
+                    .limit(batch_size)
+                ).all()
+            if not rows:
+                return
+            last_id = rows[-1].message_id
+            yield [{"message_id": row.message_id, "conversation_id": row.conversation_id} for row in rows]
+
+    def delete_vectors(self, items: List[Dict[str, Any]]) -> None:
+        self.delete_messages([item["message_id"] for item in items])
+
+    def update_metadata(self, items: List[Dict[str, Any]]) -> None:
+        """Nothing to migrate: metadata is read from `messages` at query time."""
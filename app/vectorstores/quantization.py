@@ -0,0 +1,81 @@
+"""
+Helpers for compact embedding storage: Matryoshka-style truncation, float16
+and per-row symmetric int8 quantization, and a rescored top-k search.
+"""
+from typing import Optional, Tuple
+import numpy as np
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def truncate(matrix: np.ndarray, dim: int) -> np.ndarray:
+    """Keep the first `dim` components and re-normalize (only meaningful for Matryoshka-trained models)."""
+    if not dim or dim >= matrix.shape[-1]:
+        return normalize_rows(matrix)
+    return normalize_rows(np.asarray(matrix)[..., :dim])
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-row symmetric quantization. Returns (codes int8 [n, d], scales float32 [n])."""
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def bytes_per_vector(dim: int, dtype: str) -> int:
+    if dtype == "float32":
+        return dim * 4
+    if dtype == "float16":
+        return dim * 2
+    if dtype == "int8":
+        return dim + 4  # codes plus one float32 scale
+    raise ValueError(f"Invalid storage dtype: {dtype}")
+
+
+def approximate_scores(query: np.ndarray, matrix: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Inner products against a float32/float16 matrix or int8 codes (with their scales)."""
+    scores = np.asarray(matrix, dtype=np.float32) @ query
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def search(
+    query: np.ndarray,
+    matrix: np.ndarray,
+    k: int,
+    scales: Optional[np.ndarray] = None,
+    full: Optional[np.ndarray] = None,
+    rescore_factor: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k by inner product. When `full` precision vectors are given, the
+    compact matrix only preselects k * rescore_factor candidates which are
+    then re-ranked exactly. Returns (indices, scores).
+    """
+    scores = approximate_scores(query, matrix, scales)
+    if full is None or rescore_factor <= 1:
+        indices = top_k(scores, k)
+        return indices, scores[indices]
+    # Sorted candidate rows keep reads from a memory-mapped `full` sequential.
+    candidates = np.sort(top_k(scores, k * rescore_factor))
+    exact = np.asarray(full[candidates], dtype=np.float32) @ query
+    order = top_k(exact, k)
+    return candidates[order], exact[order]
@@ -0,0 +1,138 @@
+"""
+Throughput and peak memory of the NDJSON conversation import and export
+(app/services/transfer_service.py) against the configured database.
+
+    python -m benchmarks.conversation_transfer --messages 1M --conversations 1000
+    python -m benchmarks.conversation_transfer --messages 100k --batch-size 5000
+
+The fixture is generated line by line from a fixed seed and fed to the
+importer as a stream, so it is never held in memory whole; peak RSS therefore
+reflects the importer and exporter themselves. Everything is imported for a
+dedicated --email user, and afterwards the imported conversations are
+soft-deleted, for the purger to remove, and their queued embeddings dropped.
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterator, List
+from sqlalchemy import delete, func, select, update
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.conversation import Conversation
+from app.models.embedding_outbox import EmbeddingOutbox
+from app.services import transfer_service
+from app.services.auth_service import get_or_create_user
+from benchmarks.hnsw_recall import parse_count
+
+TYPES = ("Human", "AI", "Tool", "AI")
+WORDS = "the a conversation message reply tool search result summary vector index query user model".split()
+# Fixture lines handed to the importer per chunk, roughly what one network read delivers.
+LINES_PER_CHUNK = 256
+
+
+def fixture_lines(messages: int, conversations: int, seed: int) -> Iterator[bytes]:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    yield (json.dumps({"record": "export", "version": transfer_service.EXPORT_VERSION}) + "\n").encode("utf-8")
+    per_conversation = -(-messages // conversations)
+    written = 0
+    for conversation_id in range(1, conversations + 1):
+        if written >= messages:
+            break
+        created_at = start + timedelta(hours=conversation_id)
+        yield (json.dumps({
+            "record": "conversation",
+            "conversation_id": conversation_id,
+            "title": f"Benchmark conversation {conversation_id}",
+            "created_at": created_at.isoformat(),
+        }) + "\n").encode("utf-8")
+        for i in range(min(per_conversation, messages - written)):
+            yield (json.dumps({
+                "record": "message",
+                "conversation_id": conversation_id,
+                "type": TYPES[i % len(TYPES)],
+                "content": " ".join(rng.choices(WORDS, k=rng.randint(8, 80))),
+                "created_at": (created_at + timedelta(seconds=i)).isoformat(),
+            }) + "\n").encode("utf-8")
+        written += min(per_conversation, messages - written)
+
+
+async def fixture_stream(lines: Iterator[bytes], sizes: List[int]) -> AsyncIterator[bytes]:
+    chunk: List[bytes] = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= LINES_PER_CHUNK:
+            data = b"".join(chunk)
+            sizes.append(len(data))
+            yield data
+            chunk = []
+    if chunk:
+        data = b"".join(chunk)
+        sizes.append(len(data))
+        yield data
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(name: str, messages: int, size: int, seconds: float) -> None:
+    print(
+        f"{name:<7} messages={messages} size={size / 2**20:.1f}MB seconds={seconds:.1f} "
+        f"messages/s={messages / seconds:,.0f} MB/s={size / 2**20 / seconds:.1f} peak_rss={peak_rss_mb():.0f}MB"
+    )
+
+
+def cleanup(user_id: int) -> None:
+    with SessionLocal() as db:
+        conversation_ids = select(Conversation.conversation_id).where(Conversation.user_id == user_id, Conversation.deleted_at.is_(None))
+        db.execute(delete(EmbeddingOutbox).where(EmbeddingOutbox.conversation_id.in_(conversation_ids)))
+        db.execute(
+            update(Conversation)
+            .where(Conversation.user_id == user_id, Conversation.deleted_at.is_(None))
+            .values(deleted_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NDJSON conversation import/export throughput")
+    parser.add_argument("--messages", type=parse_count, default=parse_count("1M"))
+    parser.add_argument("--conversations", type=parse_count, default=1000)
+    parser.add_argument("--batch-size", type=int, default=settings.transfer_batch_size, help="TRANSFER_BATCH_SIZE")
+    parser.add_argument("--email", default="transfer-benchmark@example.com")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Leave the imported conversations in place")
+    args = parser.parse_args()
+    settings.transfer_batch_size = args.batch_size
+
+    with SessionLocal() as db:
+        user_id = get_or_create_user(db, {"email": args.email, "name": "Transfer benchmark"}).user_id
+    print(f"messages={args.messages} conversations={args.conversations} batch_size={args.batch_size} user_id={user_id}")
+
+    try:
+        sizes: List[int] = []
+        started = time.perf_counter()
+        result = asyncio.run(transfer_service.import_ndjson(fixture_stream(fixture_lines(args.messages, args.conversations, args.seed), sizes), user_id))
+        report("import", result.messages, sum(sizes), time.perf_counter() - started)
+
+        exported = 0
+        size = 0
+        started = time.perf_counter()
+        for chunk in transfer_service.export_ndjson(SessionLocal, user_id):
+            exported += chunk.count(b'"record":"message"')
+            size += len(chunk)
+        report("export", exported, size, time.perf_counter() - started)
+    finally:
+        if not args.keep:
+            cleanup(user_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Measure recall@k and bytes/vector of compact embedding storage against
+float32 brute force.
+
+    python -m benchmarks.embedding_compression --vectors 20000 --queries 200
+    python -m benchmarks.embedding_compression --corpus corpus.npy --queries-file queries.npy
+
+Without .npy files a fixed-seed synthetic corpus is generated whose variance
+decays along the dimensions, roughly like a Matryoshka-trained model, so the
+truncation rows are indicative only. Run it on exported real embeddings
+before changing EMBEDDING_TRUNCATE_DIM in production.
+
+Sizes are the bytes scanned per query; int8 with rescoring additionally keeps
+the float32 originals on disk, which are only read for the candidates.
+"""
+import argparse
+from typing import List, Optional, Tuple
+import numpy as np
+from app.vectorstores import quantization
+
+
+def synthetic(n: int, queries: int, dim: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    scale = 1.0 / np.sqrt(1.0 + np.arange(dim) / 32.0)
+    corpus = rng.normal(size=(n, dim)).astype(np.float32) * scale
+    # Queries are perturbed corpus rows so every query has real near neighbours.
+    picks = rng.integers(0, n, size=queries)
+    noise = rng.normal(size=(queries, dim)).astype(np.float32) * scale * 0.5
+    return corpus, corpus[picks] + noise
+
+
+def recall(truth: List[np.ndarray], found: List[np.ndarray], k: int) -> float:
+    hits = sum(len(set(t[:k].tolist()) & set(f[:k].tolist())) for t, f in zip(truth, found))
+    return hits / (k * len(truth))
+
+
+def evaluate(
+    name: str,
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    truth: List[np.ndarray],
+    k: int,
+    dtype: str,
+    dim: Optional[int] = None,
+    rescore_factor: int = 1,
+) -> None:
+    dim = dim or corpus.shape[1]
+    vectors = quantization.truncate(corpus, dim)
+    probes = quantization.truncate(queries, dim)
+    scales = full = None
+    if dtype == "int8":
+        matrix, scales = quantization.quantize_int8(vectors)
+        full = vectors if rescore_factor > 1 else None
+    elif dtype == "float16":
+        matrix = vectors.astype(np.float16)
+    else:
+        matrix = vectors
+    found = [quantization.search(q, matrix, k, scales=scales, full=full, rescore_factor=rescore_factor)[0] for q in probes]
+    size = quantization.bytes_per_vector(dim, dtype)
+    print(f"{name:>22}: recall@{k}={recall(truth, found, k):.4f}  scanned bytes/vector={size:>6}  ({size / (corpus.shape[1] * 4):.1%} of float32)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall and size of compact embedding storage")
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--truncate", type=int, nargs="*", default=[768, 512, 256])
+    parser.add_argument("--corpus", help=".npy file of corpus embeddings")
+    parser.add_argument("--queries-file", help=".npy file of query embeddings")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.corpus and args.queries_file:
+        corpus = np.load(args.corpus).astype(np.float32)
+        queries = np.load(args.queries_file).astype(np.float32)
+    else:
+        corpus, queries = synthetic(args.vectors, args.queries, args.dim, args.seed)
+    k = args.top_k
+    print(f"vectors={corpus.shape[0]} dim={corpus.shape[1]} queries={queries.shape[0]} k={k}")
+
+    normalized = quantization.normalize_rows(corpus)
+    truth = [quantization.top_k(normalized @ q, k) for q in quantization.normalize_rows(queries)]
+
+    evaluate("float32", corpus, queries, truth, k, "float32")
+    evaluate("float16", corpus, queries, truth, k, "float16")
+    evaluate("int8", corpus, queries, truth, k, "int8")
+    evaluate(f"int8+rescore x{args.rescore_factor}", corpus, queries, truth, k, "int8", rescore_factor=args.rescore_factor)
+    for dim in args.truncate:
+        if dim < corpus.shape[1]:
+            evaluate(f"float32 @{dim}", corpus, queries, truth, k, "float32", dim=dim)
+            evaluate(f"float16 @{dim}", corpus, queries, truth, k, "float16", dim=dim)
+
+
+if __name__ == "__main__":
+    main()
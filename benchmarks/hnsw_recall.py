@@ -0,0 +1,270 @@
+"""
+Recall@k, query latency and memory of Chroma HNSW profiles against exact
+brute force, from 10k to 10M vectors.
+
+    python -m benchmarks.hnsw_recall --vectors 10k --profiles default,balanced,recall
+    python -m benchmarks.hnsw_recall --vectors 1M --dim 384 --client persistent
+    python -m benchmarks.hnsw_recall --corpus corpus.npy --queries-file queries.npy
+    python -m benchmarks.hnsw_recall --from-collection messages --queries 500
+
+The synthetic corpus is clustered, unit-length and generated block by block
+from a fixed seed, so neither it nor the ground truth is ever held in memory
+whole. --corpus replays exported embeddings (memory-mapped .npy) and
+--from-collection replays an existing Chroma collection; without
+--queries-file, queries are noisy copies of corpus rows.
+
+Each profile is built in a throwaway collection that is deleted afterwards,
+on the CHROMA_HOST/CHROMA_PORT server or, with --client persistent, in-process
+so the index's resident memory can be measured. Queries are unfiltered: HNSW
+settings govern the ANN search, while per-conversation filters depend on how
+many vectors share a collection (see CHROMA_SHARDING).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.vectorstores.hnsw_profiles import PROFILES, HnswProfile
+from benchmarks.embedding_compression import recall
+from benchmarks.vector_backends import percentile
+
+BLOCK_SIZE = 20_000
+CLUSTERS = 1024
+
+
+def parse_count(value: str) -> int:
+    """10000, 10k, 2.5M."""
+    value = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value[:-1] if scale > 1 else value) * scale)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class Corpus:
+    """Row blocks of a synthetic or replayed corpus, in id order."""
+
+    def __init__(self, n: int, dim: int, seed: int, data: Optional[np.ndarray] = None):
+        self.n, self.dim, self.seed, self.data = n, dim, seed, data
+        if data is None:
+            self.centroids = _normalize(np.random.default_rng(seed).normal(size=(CLUSTERS, dim)).astype(np.float32))
+
+    def block(self, index: int) -> np.ndarray:
+        start = index * BLOCK_SIZE
+        stop = min(self.n, start + BLOCK_SIZE)
+        if self.data is not None:
+            return np.asarray(self.data[start:stop], dtype=np.float32)
+        rng = np.random.default_rng((self.seed, index))
+        picks = rng.integers(0, CLUSTERS, size=stop - start)
+        noise = rng.normal(size=(stop - start, self.dim)).astype(np.float32) * (1.2 / np.sqrt(self.dim))
+        return _normalize(self.centroids[picks] + noise)
+
+    def blocks(self) -> Iterator[Tuple[int, np.ndarray]]:
+        for index in range((self.n + BLOCK_SIZE - 1) // BLOCK_SIZE):
+            yield index * BLOCK_SIZE, self.block(index)
+
+    def queries(self, count: int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed + 1)
+        rows = np.sort(rng.integers(0, self.n, size=count))
+        # Regenerate each touched block once.
+        picked = np.concatenate([
+            self.block(index)[rows[rows // BLOCK_SIZE == index] % BLOCK_SIZE]
+            for index in np.unique(rows // BLOCK_SIZE)
+        ])
+        noise = rng.normal(size=picked.shape).astype(np.float32) * (0.6 / np.sqrt(self.dim))
+        picked = picked + noise * np.linalg.norm(picked, axis=1, keepdims=True)
+        return picked[rng.permutation(count)]
+
+
+def _scores(space: str, queries: np.ndarray, block: np.ndarray) -> np.ndarray:
+    """Higher is closer; ranks match Chroma's l2, cosine and ip distances."""
+    if space == "cosine":
+        return _normalize(queries) @ _normalize(block).T
+    if space == "ip":
+        return queries @ block.T
+    return 2.0 * (queries @ block.T) - np.sum(block * block, axis=1)
+
+
+def brute_force(corpus: Corpus, queries: np.ndarray, k: int, spaces: List[str]) -> Dict[str, List[np.ndarray]]:
+    """Exact top-k ids per query for every metric, in one streaming pass over the corpus."""
+    best = {space: (np.full((len(queries), 0), -np.inf, np.float32), np.zeros((len(queries), 0), np.int64)) for space in spaces}
+    for start, block in corpus.blocks():
+        ids = np.arange(start, start + len(block))
+        for space in spaces:
+            scores, found = best[space]
+            scores = np.concatenate([scores, _scores(space, queries, block)], axis=1)
+            found = np.concatenate([found, np.broadcast_to(ids, (len(queries), len(ids)))], axis=1)
+            keep = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+            best[space] = (np.take_along_axis(scores, keep, axis=1), np.take_along_axis(found, keep, axis=1))
+    truth = {}
+    for space, (scores, found) in best.items():
+        order = np.argsort(-scores, axis=1)
+        truth[space] = list(np.take_along_axis(found, order, axis=1))
+    return truth
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def estimated_index_bytes(profile: HnswProfile, n: int, dim: int) -> int:
+    # Per node: the float32 vector, 2*M level-0 links of 4 bytes, and the label and link-count
+    # bookkeeping; upper levels hold ~1/M of the nodes and are left out.
+    return n * (dim * 4 + 2 * profile.m * 4 + 24)
+
+
+def replay_collection(client, name: str, workdir: str, page_size: int = 1000) -> np.ndarray:
+    """Copy the embeddings of an existing collection into a memory-mapped file."""
+    collection = client.get_collection(name)
+    total = collection.count()
+    if not total:
+        raise SystemExit(f"Collection {name} is empty")
+    first = collection.get(limit=1, include=["embeddings"])["embeddings"]
+    data = np.lib.format.open_memmap(os.path.join(workdir, "replay.npy"), mode="w+", dtype=np.float32, shape=(total, len(first[0])))
+    offset = 0
+    while offset < total:
+        page = collection.get(limit=page_size, offset=offset, include=["embeddings"])["embeddings"]
+        if page is None or not len(page):
+            break
+        data[offset:offset + len(page)] = np.asarray(page, dtype=np.float32)
+        offset += len(page)
+    data.flush()
+    return data[:offset]
+
+
+def run_profile(
+    client,
+    profile: HnswProfile,
+    corpus: Corpus,
+    queries: np.ndarray,
+    truth: List[np.ndarray],
+    k: int,
+    batch_size: int,
+    persist_dir: Optional[str],
+) -> Dict[str, object]:
+    name = f"bench_hnsw_{profile.name}_{int(time.time())}"
+    rss_before = _rss_bytes()
+    collection = client.create_collection(name, metadata={
+        "hnsw:space": profile.space,
+        "hnsw:M": profile.m,
+        "hnsw:construction_ef": profile.ef_construction,
+        "hnsw:search_ef": profile.ef_search,
+    })
+    try:
+        started = time.perf_counter()
+        for start, block in corpus.blocks():
+            for offset in range(0, len(block), batch_size):
+                rows = block[offset:offset + batch_size]
+                collection.add(ids=[str(start + offset + i) for i in range(len(rows))], embeddings=rows)
+        build_seconds = time.perf_counter() - started
+
+        for vector in queries[:min(10, len(queries))]:
+            collection.query(query_embeddings=[vector], n_results=k, include=[])
+        timings: List[float] = []
+        found: List[np.ndarray] = []
+        for vector in queries:
+            started = time.perf_counter()
+            result = collection.query(query_embeddings=[vector], n_results=k, include=[])
+            timings.append((time.perf_counter() - started) * 1000)
+            found.append(np.array([int(i) for i in result["ids"][0]], dtype=np.int64))
+        rss_after = _rss_bytes()
+        stats: Dict[str, object] = {
+            "profile": profile.name,
+            "space": profile.space,
+            "m": profile.m,
+            "ef_construction": profile.ef_construction,
+            "ef_search": profile.ef_search,
+            "vectors": corpus.n,
+            "build_seconds": round(build_seconds, 2),
+            "inserts_per_second": round(corpus.n / max(build_seconds, 1e-9), 1),
+            f"recall@{k}": round(recall(truth, found, k), 4),
+            "p50_ms": round(statistics.median(timings), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+            "estimated_index_mb": round(estimated_index_bytes(profile, corpus.n, corpus.dim) / 2**20, 1),
+            "rss_delta_mb": round((rss_after - rss_before) / 2**20, 1) if persist_dir and rss_before and rss_after else None,
+            "disk_mb": round(_dir_bytes(persist_dir) / 2**20, 1) if persist_dir else None,
+        }
+    finally:
+        client.delete_collection(name)
+    print(
+        f"{profile.name:>9}: {profile.space:<6} M={profile.m:<3} ef_c={profile.ef_construction:<4} ef_s={profile.ef_search:<4} "
+        f"recall@{k}={stats[f'recall@{k}']:.4f}  p50={stats['p50_ms']:.3f} ms  p99={stats['p99_ms']:.3f} ms  "
+        f"build={stats['build_seconds']:.1f}s  index≈{stats['estimated_index_mb']} MB"
+        + (f"  rss+{stats['rss_delta_mb']} MB  disk={stats['disk_mb']} MB" if persist_dir else "")
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency/memory of Chroma HNSW profiles vs brute force")
+    parser.add_argument("--vectors", default="10k", help="Synthetic corpus size, e.g. 10k, 1M, 10M")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--profiles", default=",".join(PROFILES), help=f"Comma-separated, from: {', '.join(PROFILES)}")
+    parser.add_argument("--corpus", help="Replay embeddings from a .npy file (rows are vectors)")
+    parser.add_argument("--queries-file", help="Query embeddings as .npy")
+    parser.add_argument("--from-collection", help="Replay the embeddings of an existing Chroma collection")
+    parser.add_argument("--client", choices=["http", "persistent"], default="http", help="persistent runs Chroma in-process to measure memory")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    try:
+        profiles = [PROFILES[name.strip().lower()] for name in args.profiles.split(",") if name.strip()]
+    except KeyError as e:
+        raise SystemExit(f"Unknown profile {e}; expected one of {', '.join(PROFILES)}")
+
+    import chromadb
+    workdir = tempfile.mkdtemp(prefix="hnsw_bench_")
+    try:
+        persist_dir = os.path.join(workdir, "chroma") if args.client == "persistent" else None
+        if persist_dir:
+            client = chromadb.PersistentClient(path=persist_dir)
+        else:
+            client = chromadb.HttpClient(host=settings.chroma_host, port=settings.chroma_port)
+
+        if args.corpus or args.from_collection:
+            data = np.load(args.corpus, mmap_mode="r") if args.corpus else replay_collection(
+                chromadb.HttpClient(host=settings.chroma_host, port=settings.chroma_port), args.from_collection, workdir
+            )
+            corpus = Corpus(len(data), data.shape[1], args.seed, data=data)
+        else:
+            corpus = Corpus(parse_count(args.vectors), args.dim, args.seed)
+        queries = np.load(args.queries_file).astype(np.float32) if args.queries_file else corpus.queries(args.queries)
+        batch_size = max(1, min(args.batch_size, client.get_max_batch_size()))
+        print(f"vectors={corpus.n} dim={corpus.dim} queries={len(queries)} k={args.top_k} client={args.client}")
+
+        started = time.perf_counter()
+        truth = brute_force(corpus, queries, args.top_k, sorted({profile.space for profile in profiles}))
+        print(f"brute force ground truth: {time.perf_counter() - started:.1f}s")
+
+        results = [
+            run_profile(client, profile, corpus, queries, truth[profile.space], args.top_k, batch_size, persist_dir)
+            for profile in profiles
+        ]
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
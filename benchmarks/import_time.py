@@ -0,0 +1,70 @@
+"""
+Cold-start benchmark: measures how long a fresh worker process takes to import
+`app.main` (what uvicorn does before it can accept traffic).
+
+Each run spawns a new interpreter so nothing is cached in-process. Use
+`--importtime` to dump the slowest modules from `python -X importtime`.
+
+    python -m benchmarks.import_time --runs 10
+    python -m benchmarks.import_time --module app.main --importtime
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+
+def measure_once(module: str) -> float:
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; "
+        "print(time.perf_counter() - t)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str, top: int) -> List[Tuple[int, str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time per worker")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="Show the slowest imports")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    timings = [measure_once(args.module) for _ in range(args.runs)]
+    print(f"module={args.module} runs={args.runs}")
+    print(f"  min    {min(timings) * 1000:8.1f} ms")
+    print(f"  median {statistics.median(timings) * 1000:8.1f} ms")
+    print(f"  max    {max(timings) * 1000:8.1f} ms")
+    print(f"  wall   {(time.perf_counter() - started):8.2f} s (including interpreter startup)")
+
+    if args.importtime:
+        print(f"\nSlowest {args.top} imports (cumulative):")
+        for cumulative_us, name in slowest_imports(args.module, args.top):
+            print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
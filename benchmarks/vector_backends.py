@@ -0,0 +1,104 @@
+"""
+Compare top-k retrieval latency of the in-process NumPy backend against the
+Chroma HTTP backend on synthetic conversations.
+
+    python -m benchmarks.vector_backends --messages 300 --queries 500
+    python -m benchmarks.vector_backends --skip-chroma
+
+Chroma is reached with CHROMA_HOST/CHROMA_PORT and a throwaway collection that
+is deleted afterwards.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+import numpy as np
+from app.config import settings
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_queries(query: Callable[[List[float], int], object], queries: np.ndarray, conversation_ids: List[int]) -> List[float]:
+    timings = []
+    for i, vector in enumerate(queries):
+        conversation_id = conversation_ids[i % len(conversation_ids)]
+        started = time.perf_counter()
+        query(vector.tolist(), conversation_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name: str, timings: List[float]) -> Dict[str, float]:
+    stats = {
+        "p50": statistics.median(timings),
+        "p99": percentile(timings, 99),
+        "mean": statistics.fmean(timings),
+    }
+    print(f"{name:>8}: p50={stats['p50']:.3f} ms  p99={stats['p99']:.3f} ms  mean={stats['mean']:.3f} ms")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local vs Chroma retrieval latency")
+    parser.add_argument("--conversations", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=300, help="Messages per conversation")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    conversation_ids = list(range(1, args.conversations + 1))
+    corpus = {cid: rng.normal(size=(args.messages, args.dim)).astype(np.float32) for cid in conversation_ids}
+    queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    print(f"conversations={args.conversations} messages/conversation={args.messages} dim={args.dim} queries={args.queries}")
+
+    from app.vectorstores.local import LocalVectorStore
+    with tempfile.TemporaryDirectory() as root:
+        local = LocalVectorStore(root)
+        message_id = 0
+        for cid, vectors in corpus.items():
+            for vector in vectors:
+                message_id += 1
+                local.add(message_id, f"message {message_id}", vector.tolist(), cid)
+        report("local", run_queries(lambda v, cid: local.query(v, cid, top_k=args.top_k), queries, conversation_ids))
+
+    if args.skip_chroma:
+        return
+
+    import chromadb
+    client = chromadb.HttpClient(host=settings.chroma_host, port=settings.chroma_port)
+    name = f"bench_messages_{int(time.time())}"
+    collection = client.get_or_create_collection(name)
+    try:
+        message_id = 0
+        for cid, vectors in corpus.items():
+            ids = [str(message_id + i + 1) for i in range(len(vectors))]
+            message_id += len(vectors)
+            collection.add(
+                ids=ids,
+                embeddings=vectors.tolist(),
+                metadatas=[{"conversation_id": cid} for _ in ids],
+                documents=[f"message {i}" for i in ids],
+            )
+
+        def chroma_query(vector: List[float], cid: int):
+            return collection.query(
+                query_embeddings=[vector],
+                n_results=args.top_k,
+                where={"conversation_id": cid},
+                include=["documents", "metadatas", "distances"],
+            )
+
+        report("chroma", run_queries(chroma_query, queries, conversation_ids))
+    finally:
+        client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
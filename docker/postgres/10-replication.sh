@@ -0,0 +1,5 @@
+#!/bin/bash
+# Runs once, when the primary's data directory is initialized: lets the
+# replica container stream WAL as the superuser.
+set -e
+echo "host replication ${POSTGRES_USER} all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,13 @@
+#!/bin/bash
+# Streaming replica of meai-db for testing read routing locally. The first
+# start clones the primary with pg_basebackup; -R writes standby.signal and
+# primary_conninfo, so Postgres then starts as a read-only hot standby.
+set -e
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+  until pg_basebackup -h meai-db -U "$POSTGRES_USER" -D "$PGDATA" -R -X stream -P; do
+    echo "Waiting for meai-db..."
+    sleep 2
+  done
+  chmod 700 "$PGDATA"
+fi
+exec postgres
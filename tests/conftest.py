@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time. The tests never connect to the database.
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'meai-tests.db')}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
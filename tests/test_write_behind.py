@@ -0,0 +1,167 @@
+"""
+Crash recovery and failure handling of app/services/write_behind.py, with
+`persist` replaced by an in-memory store that, like the real one, skips
+write_ids it already holds.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+import pytest
+from app.config import settings
+from app.models.message import MessageType
+from app.services import write_behind
+from app.services.write_behind import Journal, PendingWrite, WriteBehindQueue, WriteFailed
+
+
+class FakeStore:
+    """Messages by write_id, in insert order."""
+
+    def __init__(self, poison: str = "poison", fail_after_commit: int = 0):
+        self.rows: Dict[str, PendingWrite] = {}
+        self.calls: List[List[str]] = []
+        self.poison = poison
+        # Calls that store their writes and then fail, like a commit whose reply is lost.
+        self.fail_after_commit = fail_after_commit
+
+    def persist(self, writes: Sequence[PendingWrite]) -> Tuple[List[int], Optional[int]]:
+        self.calls.append([write.write_id for write in writes])
+        if any(write.content == self.poison for write in writes):
+            raise ValueError("value too long for type character varying")
+        new = [write for write in writes if write.write_id not in self.rows]
+        for write in new:
+            self.rows[write.write_id] = write
+        if self.fail_after_commit:
+            self.fail_after_commit -= 1
+            raise ConnectionError("server closed the connection unexpectedly")
+        return list(range(len(self.rows) - len(new) + 1, len(self.rows) + 1)), None
+
+    def contents(self, conversation_id: int) -> List[str]:
+        return [write.content for write in self.rows.values() if write.conversation_id == conversation_id]
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = FakeStore()
+    monkeypatch.setattr(settings, "write_behind_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "write_behind_fsync", False)
+    monkeypatch.setattr(settings, "write_behind_max_attempts", 2)
+    monkeypatch.setattr(write_behind, "persist", store.persist)
+    monkeypatch.setattr(write_behind, "_conversation_live", lambda conversation_id: True)
+    monkeypatch.setattr(write_behind.summary_service, "schedule_update", lambda conversation_id: None)
+    monkeypatch.setattr(write_behind.outbox_service, "notify", lambda: None)
+    return store
+
+
+def _write(seq: int, conversation_id: int, content: str) -> PendingWrite:
+    return PendingWrite(
+        write_id=f"w{seq}",
+        seq=seq,
+        conversation_id=conversation_id,
+        user_id=1,
+        type=MessageType.HUMAN,
+        content=content,
+        created_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+    )
+
+
+def _crashed_journal(directory: str, writes: Sequence[PendingWrite], done: Sequence[str] = ()) -> str:
+    """A journal left behind by a process that died; its lock went with it."""
+    journal = Journal(directory, fsync=False)
+    journal.append([write.record() for write in writes])
+    if done:
+        journal.append([{"op": "done", "write_ids": list(done)}])
+    journal.close(remove=False)
+    return journal.path
+
+
+def test_replay_inserts_unfinished_writes_in_order(store, tmp_path):
+    writes = [_write(1, 7, "a"), _write(2, 8, "b"), _write(3, 7, "c"), _write(4, 7, "d")]
+    path = _crashed_journal(str(tmp_path), writes, done=["w1"])
+    # A torn last line: the process died mid-append, before its submit returned.
+    with open(path, "ab") as f:
+        f.write(b'{"op": "write", "write_id": "w5", "se')
+
+    assert write_behind.replay_journals(str(tmp_path)) == 3
+    assert store.contents(7) == ["c", "d"]
+    assert store.contents(8) == ["b"]
+    assert not os.path.exists(path)
+
+
+def test_replay_skips_journals_of_running_processes(store, tmp_path):
+    journal = Journal(str(tmp_path), fsync=False)
+    journal.append([_write(1, 7, "a").record()])
+    try:
+        assert write_behind.replay_journals(str(tmp_path)) == 0
+        assert store.rows == {}
+        assert os.path.exists(journal.path)
+    finally:
+        journal.close(remove=True)
+
+
+def test_replay_after_a_crash_during_replay_does_not_duplicate(store, tmp_path):
+    writes = [_write(1, 7, "a"), _write(2, 7, "b")]
+    _crashed_journal(str(tmp_path), writes)
+    assert write_behind.replay_journals(str(tmp_path)) == 2
+    # The replaying process died before removing the journal, so it is replayed again.
+    _crashed_journal(str(tmp_path), writes)
+    assert write_behind.replay_journals(str(tmp_path)) == 0
+    assert store.contents(7) == ["a", "b"]
+
+
+def test_replay_dead_letters_writes_that_cannot_be_stored(store, tmp_path):
+    _crashed_journal(str(tmp_path), [_write(1, 7, "poison"), _write(2, 8, "b")])
+    assert write_behind.replay_journals(str(tmp_path)) == 1
+    assert store.contents(8) == ["b"]
+    dead = _dead_letters(tmp_path)
+    assert [record["write_id"] for record in dead] == ["w1"]
+
+
+def _dead_letters(directory) -> List[dict]:
+    paths = [name for name in os.listdir(directory) if name.startswith("dead-letter-")]
+    records = []
+    for name in paths:
+        with open(os.path.join(directory, name), "rb") as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+def test_retry_after_a_lost_commit_stores_each_write_once(store):
+    store.fail_after_commit = 1
+
+    async def run():
+        queue = WriteBehindQueue()
+        writes = await queue.submit(7, 1, [(MessageType.HUMAN, "hi"), (MessageType.AI, "hello")])
+        await queue.flush(7)
+        await queue.close(1)
+        return writes
+
+    writes = asyncio.run(run())
+    assert len(store.calls) == 2
+    assert store.calls[0] == store.calls[1]
+    assert store.contents(7) == ["hi", "hello"]
+    assert all(write.future.result() is None for write in writes)
+
+
+def test_poison_write_is_dead_lettered_without_blocking_the_queue(store, tmp_path):
+    async def run():
+        queue = WriteBehindQueue()
+        first = await queue.submit(7, 1, [(MessageType.HUMAN, "a"), (MessageType.TOOL, "poison"), (MessageType.AI, "b")])
+        await queue.flush(7)
+        later = await queue.submit(7, 1, [(MessageType.HUMAN, "c")])
+        await queue.flush(7)
+        journal_size = os.path.getsize(queue._journal.path)
+        await queue.close(1)
+        return first, later, journal_size
+
+    first, later, journal_size = asyncio.run(run())
+    assert store.contents(7) == ["a", "b", "c"]
+    assert first[0].future.result() is None and first[2].future.result() is None
+    with pytest.raises(WriteFailed):
+        first[1].future.result()
+    assert later[0].future.result() is None
+    assert [record["write_id"] for record in _dead_letters(tmp_path)] == [first[1].write_id]
+    # Everything was settled, so the journal was truncated and nothing is left to replay.
+    assert journal_size == 0
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("journal-")]